@@ -133,6 +133,26 @@ async def graceful_shutdown():
             except Exception as e:
                 logger.error(f"等待任务取消时发生异常: {e}")
 
+        # 写入尚未落库的LLM用量记录
+        from src.llm_models.usage_recorder import llm_usage_recorder
+
+        llm_usage_recorder.flush()
+
+        # 写入尚未落库的消息
+        from src.common.message_buffer import message_write_buffer
+
+        message_write_buffer.flush()
+
+        # 关闭LLM服务商的共享HTTP会话
+        from src.llm_models.http_client import llm_client_registry
+
+        await llm_client_registry.close_all()
+
+        # 关闭图片处理工作进程
+        from src.common.image_pipeline import image_pipeline
+
+        image_pipeline.shutdown()
+
         logger.info("麦麦优雅关闭完成")
 
         # 关闭日志系统，释放文件句柄
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+知识库嵌入导入基准测试
+
+在本地启动一个模拟 OpenAI 嵌入接口的服务（每个请求固定延迟，另按文本数量增加延迟，
+向量由文本的hash生成），用同一批模拟文本分别执行：
+1. 逐条请求（batch_size=1, max_concurrency=1，改造前的方式）
+2. 批量并发请求（按参数设置的 batch_size 与 max_concurrency）
+统计耗时、请求数与吞吐量，并检查两种方式写入嵌入库的向量是否一致。
+
+用法: python scripts/benchmark_embedding_insert.py [--texts 2000] [--batch-size 32] [--max-concurrency 4]
+                                                [--latency 0.05] [--per-text-latency 0.001] [--dimension 1024]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.chat.knowledge.embedding_store import EmbeddingStore  # noqa: E402
+from src.chat.knowledge.llm_client import LLMClient  # noqa: E402
+from src.chat.knowledge.lpmmconfig import global_config  # noqa: E402
+
+CHARACTERS = "的一是不了人我在有他这中大来上个国到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可她里后小么心多天而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现"
+STUB_MODEL = "stub-embedding"
+
+
+class StubEmbeddingServer:
+    """模拟 OpenAI 兼容的 /embeddings 接口"""
+
+    def __init__(self, dimension: int, latency: float, per_text_latency: float):
+        self.dimension = dimension
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def embed(self, text: str) -> List[float]:
+        """由文本hash生成的固定向量"""
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dimension, dtype=np.float32).tolist()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.latency + server.per_text_latency * len(texts))
+                payload = json.dumps(
+                    {
+                        "object": "list",
+                        "data": [
+                            {"object": "embedding", "index": i, "embedding": server.embed(text)}
+                            for i, text in enumerate(texts)
+                        ],
+                        "model": body.get("model", STUB_MODEL),
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                    }
+                ).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def generate_texts(count: int) -> List[str]:
+    rng = random.Random(42)
+    return ["".join(rng.choices(CHARACTERS, k=rng.randint(10, 80))) for _ in range(count)]
+
+
+def run_insert(
+    server: StubEmbeddingServer, texts: List[str], batch_size: int, max_concurrency: int, dir_path: str
+) -> Dict[str, object]:
+    """在空的嵌入库中导入全部文本，返回耗时、请求数与导入后的向量"""
+    global_config["embedding"].update(
+        {"model": STUB_MODEL, "batch_size": batch_size, "max_concurrency": max_concurrency, "checkpoint_interval": 0}
+    )
+    embedding_store = EmbeddingStore(LLMClient(server.url, "stub"), "benchmark", dir_path)
+    requests_before = server.requests
+    start_time = time.perf_counter()
+    embedding_store.batch_insert_strs(texts, times=1)
+    elapsed = time.perf_counter() - start_time
+    vectors = {item_hash: embedding_store.get_vector(idx) for item_hash, idx in embedding_store.hash2idx.items()}
+    return {"elapsed": elapsed, "requests": server.requests - requests_before, "vectors": vectors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库嵌入导入基准测试")
+    parser.add_argument("--texts", type=int, default=2000, help="模拟文本数量，默认2000")
+    parser.add_argument("--batch-size", type=int, default=32, help="批量方式单次请求的文本数，默认32")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="批量方式同时进行的请求数，默认4")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟接口每个请求的固定延迟（秒），默认0.05")
+    parser.add_argument(
+        "--per-text-latency", type=float, default=0.001, help="模拟接口每个文本增加的延迟（秒），默认0.001"
+    )
+    parser.add_argument("--dimension", type=int, default=1024, help="向量维度，默认1024")
+    args = parser.parse_args()
+
+    texts = generate_texts(args.texts)
+    server = StubEmbeddingServer(args.dimension, args.latency, args.per_text_latency)
+    server.start()
+    temp_dir = Path(tempfile.mkdtemp(prefix="maibot_embedding_insert_"))
+    try:
+        modes = (
+            ("逐条请求", 1, 1),
+            (f"批量{args.batch_size}条×并发{args.max_concurrency}", args.batch_size, args.max_concurrency),
+        )
+        results = {}
+        for name, batch_size, max_concurrency in modes:
+            dir_path = str(temp_dir / f"{batch_size}_{max_concurrency}")
+            results[name] = run_insert(server, texts, batch_size, max_concurrency, dir_path)
+    finally:
+        server.stop()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(
+        f"\n共 {len(texts)} 条文本，模拟接口延迟 {args.latency * 1000:.0f}ms/请求 + {args.per_text_latency * 1000:.1f}ms/条\n"
+    )
+    print(f"{'方式':<16}{'耗时':>10}{'请求数':>10}{'吞吐量':>14}")
+    for name, result in results.items():
+        print(
+            f"{name:<16}{result['elapsed']:>9.2f}s{result['requests']:>10}{len(texts) / result['elapsed']:>10.1f}条/秒"
+        )
+
+    baseline, batched = (result["vectors"] for result in results.values())
+    mismatches = sum(
+        1
+        for item_hash, vector in baseline.items()
+        if item_hash not in batched or not np.allclose(vector, batched[item_hash])
+    )
+    mismatches += len(batched.keys() - baseline.keys())
+    print(f"\n向量不一致的条目数: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+图片预处理流水线基准测试
+
+对一个目录中的动图表情包分别执行：
+1. 在事件循环中直接处理（改造前的方式）
+2. 通过 image_pipeline 在工作线程中处理
+统计每张图片的处理耗时，以及处理期间事件循环的最长阻塞时间（心跳任务的最大延迟）。
+另外单独对比改造前后两种帧解码与去重方式的耗时。
+
+用法: python scripts/benchmark_image_pipeline.py [表情包目录] [--concurrency 4] [--limit 0]
+"""
+
+import argparse
+import asyncio
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.common.image_pipeline import (  # noqa: E402
+    _gif_to_frame_strip,
+    _iter_frames,
+    _select_distinct_frames,
+    image_pipeline,
+)
+
+HEARTBEAT_INTERVAL = 0.01  # 心跳间隔（秒）
+SIMILARITY_THRESHOLD = 1000.0
+MAX_FRAMES = 15
+
+
+def load_gifs(directory: Path, limit: int) -> List[bytes]:
+    """读取目录（含子目录）中的所有动图"""
+    gifs = []
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file():
+            continue
+        data = path.read_bytes()
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                if img.format != "GIF" or not getattr(img, "is_animated", False):
+                    continue
+        except Exception:
+            continue
+        gifs.append(data)
+        if limit and len(gifs) >= limit:
+            break
+    return gifs
+
+
+def select_frames_per_frame(gif_bytes: bytes, similarity_threshold: float, max_frames: int) -> List[np.ndarray]:
+    """先解码全部帧，再逐帧与上一张选中帧比较（改造前的帧去重方式，已修正uint8溢出）"""
+    all_frames = list(_iter_frames(Image.open(io.BytesIO(gif_bytes))))
+    selected = [all_frames[0]]
+    last_selected = all_frames[0].astype(np.int32)
+    for frame in all_frames[1:]:
+        current = frame.astype(np.int32)
+        if np.mean((current - last_selected) ** 2) > similarity_threshold:
+            selected.append(frame)
+            last_selected = current
+            if len(selected) >= max_frames:
+                break
+    return selected
+
+
+async def heartbeat(stop: asyncio.Event, stalls: List[float]):
+    """定时唤醒，记录每次唤醒比预期晚了多久"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + HEARTBEAT_INTERVAL
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        stalls.append(max(0.0, loop.time() - expected))
+
+
+async def run_mode(gifs: List[bytes], use_pipeline: bool, concurrency: int) -> Dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def process(gif_bytes: bytes):
+        async with semaphore:
+            start_time = time.perf_counter()
+            if use_pipeline:
+                await image_pipeline.gif_to_frame_strip(gif_bytes, SIMILARITY_THRESHOLD, MAX_FRAMES)
+            else:
+                _gif_to_frame_strip(gif_bytes, SIMILARITY_THRESHOLD, MAX_FRAMES)
+                # 让出事件循环，模拟改造前在协程中直接处理的情况
+                await asyncio.sleep(0)
+            latencies.append(time.perf_counter() - start_time)
+
+    stalls: List[float] = []
+    stop = asyncio.Event()
+    heartbeat_task = asyncio.create_task(heartbeat(stop, stalls))
+    start_time = time.perf_counter()
+    await asyncio.gather(*(process(gif_bytes) for gif_bytes in gifs))
+    total_time = time.perf_counter() - start_time
+    stop.set()
+    await heartbeat_task
+
+    ordered = sorted(latencies)
+    return {
+        "total": total_time,
+        "mean": statistics.mean(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max_stall": max(stalls, default=0.0),
+    }
+
+
+def benchmark_frame_selection(gifs: List[bytes]) -> Dict[str, float]:
+    per_frame_time = vectorized_time = 0.0
+    mismatches = 0
+    for gif_bytes in gifs:
+        start_time = time.perf_counter()
+        expected = select_frames_per_frame(gif_bytes, SIMILARITY_THRESHOLD, MAX_FRAMES)
+        per_frame_time += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        selected = _select_distinct_frames(
+            _iter_frames(Image.open(io.BytesIO(gif_bytes))), SIMILARITY_THRESHOLD, MAX_FRAMES
+        )
+        vectorized_time += time.perf_counter() - start_time
+        if len(selected) != len(expected) or not all(map(np.array_equal, selected, expected)):
+            mismatches += 1
+    return {"per_frame": per_frame_time, "vectorized": vectorized_time, "mismatches": mismatches}
+
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}ms"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="图片预处理流水线基准测试")
+    parser.add_argument("directory", nargs="?", default="data/emoji", help="动图表情包目录，默认 data/emoji")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时处理的图片数，默认4")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用的图片数，0为不限制")
+    args = parser.parse_args()
+
+    gifs = load_gifs(Path(args.directory), args.limit)
+    if not gifs:
+        print(f"目录 {args.directory} 中没有找到动图")
+        return
+    print(
+        f"共 {len(gifs)} 张动图，总大小 {sum(len(gif) for gif in gifs) / 1024 / 1024:.1f}MB，并发数 {args.concurrency}"
+    )
+
+    selection = benchmark_frame_selection(gifs)
+    print("\n=== 帧解码与去重 ===")
+    print(f"全部解码后逐帧比较: {format_ms(selection['per_frame'])}")
+    print(f"按需解码并分批比较: {format_ms(selection['vectorized'])}")
+    print(f"结果不一致的图片数: {selection['mismatches']}")
+
+    # 预先启动工作线程，避免把线程池创建时间计入结果
+    await image_pipeline.gif_to_frame_strip(gifs[0], SIMILARITY_THRESHOLD, MAX_FRAMES)
+
+    print("\n=== GIF抽帧拼接 ===")
+    print(f"{'方式':<12}{'总耗时':>12}{'平均耗时':>12}{'P95耗时':>12}{'最长阻塞':>12}")
+    for name, use_pipeline in (("事件循环内", False), ("image_pipeline", True)):
+        result = await run_mode(gifs, use_pipeline, args.concurrency)
+        print(
+            f"{name:<12}{format_ms(result['total']):>12}{format_ms(result['mean']):>12}"
+            f"{format_ms(result['p95']):>12}{format_ms(result['max_stall']):>12}"
+        )
+
+    image_pipeline.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+消息表结构基准测试
+
+在临时数据库中按旧版（每条消息重复保存聊天流和发送者信息）结构生成模拟消息，
+统计数据库大小和常用查询的耗时；然后用 migrate_messages_schema 转换为新结构，再统计一次，
+并检查转换前后各查询返回的结果是否完全一致。
+
+用法: python scripts/benchmark_message_schema.py [--rows 1000000] [--repeat 20] [--keep]
+"""
+
+import argparse
+import hashlib
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from peewee import SqliteDatabase
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.common.database.database_model import (  # noqa: E402
+    ChatStreams,
+    LegacyMessages,
+    Messages,
+    MessageSenders,
+    MessageView,
+    create_message_view,
+    migrate_messages_schema,
+)
+from src.common.message_repository import _apply_filter, _build_find_query, _model_to_dict  # noqa: E402
+
+MODELS = [ChatStreams, MessageSenders, Messages, MessageView, LegacyMessages]
+BATCH_SIZE = 50000
+CHAT_COUNT = 500
+USER_COUNT = 20000
+TIME_SPAN = 90 * 24 * 3600  # 模拟消息覆盖的时间范围（秒）
+CHARACTERS = "的一是不了人我在有他这中大来上个国到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可她里后小么心多天而能好都然没日于起还发成事只作当想看文无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现"
+
+
+def random_text(rng: random.Random, min_length: int, max_length: int) -> str:
+    return "".join(rng.choices(CHARACTERS, k=rng.randint(min_length, max_length)))
+
+
+def generate_legacy_messages(database: SqliteDatabase, rows: int):
+    """按旧版结构生成消息，建立旧版结构上的索引"""
+    rng = random.Random(42)
+    start_time = time.time() - TIME_SPAN
+
+    streams = []
+    for i in range(CHAT_COUNT):
+        is_group = i % 5 != 0
+        streams.append(
+            {
+                "stream_id": hashlib.md5(f"stream_{i}".encode()).hexdigest(),
+                "create_time": start_time,
+                "group_platform": "qq" if is_group else None,
+                "group_id": str(100000000 + i) if is_group else None,
+                "group_name": random_text(rng, 4, 12) if is_group else None,
+                "last_active_time": start_time + TIME_SPAN,
+                "platform": "qq",
+                "user_platform": "qq",
+                "user_id": str(1000000000 + rng.randrange(USER_COUNT)),
+                "user_nickname": random_text(rng, 2, 10),
+                "user_cardname": "",
+            }
+        )
+    database.create_tables([ChatStreams])
+    ChatStreams.insert_many(streams).execute()
+
+    users = [(str(1000000000 + i), random_text(rng, 2, 10), random_text(rng, 0, 8) or None) for i in range(USER_COUNT)]
+    LegacyMessages.create_table()
+    fields = [field for field in LegacyMessages._meta.sorted_fields if field.name != "id"]
+    sql = 'INSERT INTO "messages_legacy" ({}) VALUES ({})'.format(
+        ", ".join(f'"{field.column_name}"' for field in fields), ", ".join("?" for _ in fields)
+    )
+    step = TIME_SPAN / rows
+    connection = database.connection()
+    for batch_start in range(0, rows, BATCH_SIZE):
+        batch = []
+        for i in range(batch_start, min(rows, batch_start + BATCH_SIZE)):
+            stream = streams[rng.randrange(CHAT_COUNT)]
+            user_id, nickname, cardname = users[rng.randrange(USER_COUNT)]
+            values = {
+                "message_id": str(2000000000 + i),
+                "time": start_time + i * step,
+                "chat_id": stream["stream_id"],
+                "reply_to": None,
+                "chat_info_stream_id": stream["stream_id"],
+                "chat_info_platform": stream["platform"],
+                "chat_info_user_platform": stream["user_platform"],
+                "chat_info_user_id": stream["user_id"],
+                "chat_info_user_nickname": stream["user_nickname"],
+                "chat_info_user_cardname": stream["user_cardname"],
+                "chat_info_group_platform": stream["group_platform"],
+                "chat_info_group_id": stream["group_id"],
+                "chat_info_group_name": stream["group_name"],
+                "chat_info_create_time": stream["create_time"],
+                "chat_info_last_active_time": stream["last_active_time"],
+                "user_platform": "qq",
+                "user_id": user_id,
+                "user_nickname": nickname,
+                "user_cardname": cardname,
+                "processed_plain_text": random_text(rng, 2, 60),
+                "display_message": "",
+                "detailed_plain_text": None,
+                "memorized_times": 0,
+            }
+            batch.append(tuple(values[field.name] for field in fields))
+        with database.atomic():
+            connection.executemany(sql, batch)
+        print(f"\r已生成 {min(rows, batch_start + BATCH_SIZE)}/{rows} 条消息", end="", flush=True)
+    print()
+
+    # 与升级前的数据库一致：表名为 messages，带有 user-021 之后的索引
+    database.execute_sql('ALTER TABLE "messages_legacy" RENAME TO "messages"')
+    for name, columns in (
+        ("messages_message_id", "message_id"),
+        ("messages_time", "time"),
+        ("messages_chat_id_time", "chat_id, time"),
+        ("messages_user_id_time", "user_id, time"),
+    ):
+        database.execute_sql(f'CREATE INDEX "{name}" ON "messages" ({columns})')
+    # 旧版结构中消息表本身就是扁平的，查询时直接以视图的形式使用
+    database.execute_sql('CREATE VIEW "messages_view" AS SELECT * FROM "messages"')
+
+
+def build_patterns(database: SqliteDatabase) -> List[Tuple[str, Callable]]:
+    # 以最新一条消息所在的聊天和发送者作为查询对象；用 fetchall 取完结果，避免未结束的语句占用表
+    now, stream_id, user_id = database.execute_sql(
+        'SELECT time, chat_id, user_id FROM "messages" ORDER BY time DESC LIMIT 1'
+    ).fetchall()[0]
+    hour_ago = now - 3600
+    day_ago = now - 24 * 3600
+    week_ago = now - 7 * 24 * 3600
+
+    def find(message_filter, sort=None, limit=0, limit_mode="latest"):
+        return lambda: [_model_to_dict(msg) for msg in _build_find_query(message_filter, sort, limit, limit_mode)]
+
+    def count(message_filter):
+        return lambda: _apply_filter(MessageView.select(), message_filter).count()
+
+    return [
+        ("聊天中最近30条消息", find({"chat_id": stream_id, "time": {"$lt": now + 1}}, limit=30)),
+        ("聊天中最近一天的消息", find({"chat_id": stream_id, "time": {"$gt": day_ago}}, [("time", 1)])),
+        ("聊天中最近一周的消息数", count({"chat_id": stream_id, "time": {"$gt": week_ago, "$lt": now + 1}})),
+        ("用户最近一周的消息", find({"time": {"$gt": week_ago}, "user_id": {"$in": [user_id]}}, [("time", 1)])),
+        ("全部聊天最近一小时的消息", find({"time": {"$gt": hour_ago}}, [("time", 1)])),
+        (
+            "统计最近一天的消息",
+            lambda: [msg.chat_info_group_id for msg in MessageView.select().where(MessageView.time >= day_ago)],
+        ),
+    ]
+
+
+def database_size(database: SqliteDatabase, db_path: Path) -> int:
+    database.execute_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    return db_path.stat().st_size
+
+
+def run_patterns(patterns: List[Tuple[str, Callable]], repeat: int) -> Dict[str, Tuple[float, object]]:
+    results = {}
+    for name, run in patterns:
+        result = run()  # 预热
+        timings = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start_time)
+        results[name] = (statistics.median(timings), result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息表结构基准测试")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="模拟消息条数，默认1000000")
+    parser.add_argument("--repeat", type=int, default=20, help="每个查询的重复次数，默认20")
+    parser.add_argument("--keep", action="store_true", help="结束后保留临时数据库")
+    args = parser.parse_args()
+
+    temp_dir = Path(tempfile.mkdtemp(prefix="maibot_message_schema_"))
+    db_path = temp_dir / "messages.db"
+    database = SqliteDatabase(str(db_path), pragmas={"journal_mode": "wal", "synchronous": 0, "cache_size": -64000})
+    for model in MODELS:
+        model.bind(database, bind_refs=False, bind_backrefs=False)
+
+    try:
+        # 转换过程需要逐批提交和 VACUUM，只管理连接，不开启外层事务
+        with database.connection_context():
+            generate_legacy_messages(database, args.rows)
+            patterns = build_patterns(database)
+            size_before = database_size(database, db_path)
+            before = run_patterns(patterns, args.repeat)
+
+            database.execute_sql('DROP VIEW "messages_view"')
+            start_time = time.perf_counter()
+            migrate_messages_schema(database)
+            Messages._schema.create_indexes(safe=True)
+            create_message_view(database)
+            migrate_time = time.perf_counter() - start_time
+            size_after = database_size(database, db_path)
+            after = run_patterns(patterns, args.repeat)
+            senders = MessageSenders.select().count()
+
+        print(f"\n转换耗时 {migrate_time:.1f}s，发送者 {senders} 个")
+        print(f"数据库大小: {size_before / 1024 / 1024:.1f}MB -> {size_after / 1024 / 1024:.1f}MB")
+        print(f"平均每条消息: {size_before / args.rows:.0f}B -> {size_after / args.rows:.0f}B\n")
+        print(f"{'查询':<20}{'旧结构':>10}{'新结构':>10}  结果一致")
+        mismatches = 0
+        for name, _ in patterns:
+            before_time, before_result = before[name]
+            after_time, after_result = after[name]
+            same = before_result == after_result
+            mismatches += not same
+            print(f"{name:<20}{before_time * 1000:>8.2f}ms{after_time * 1000:>8.2f}ms  {'是' if same else '否'}")
+    finally:
+        if args.keep:
+            print(f"\n数据库已保留: {db_path}")
+        else:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+请求对冲行为检查
+
+用延迟与成败可控的模拟模型代替真实的服务商，逐个检查 LLMRequestHedger 在以下情形中的行为：
+1. 主模型在截止时间内返回（不发出对冲请求）
+2. 主模型超过截止时间、备用模型先返回（主模型请求被取消）
+3. 对冲请求发出后主模型仍先返回（备用模型请求被取消）
+4. 主模型请求失败（立即切换到备用模型，不等待截止时间）
+5. 主模型与备用模型都失败（抛出异常，不遗留未完成的请求）
+6. 调用方在两个请求都在进行时取消（两个请求都被取消）
+任何一项不符合预期时以非零状态码退出。
+
+用法: python scripts/check_hedged_request.py [--deadline 0.2]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config.config import global_config  # noqa: E402
+from src.llm_models.hedged_request import LLMRequestHedger  # noqa: E402
+
+REQUEST_TYPE = "check.hedge"
+
+
+class FakeModel:
+    """模拟的模型请求对象，提供 LLMRequestHedger 用到的 model_name、request_type 与 generate_response_async"""
+
+    def __init__(self, model_name: str, delay: float, fail: bool = False):
+        self.model_name = model_name
+        self.request_type = REQUEST_TYPE
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+        self.completed = 0
+
+    async def generate_response_async(self, prompt: str, **kwargs) -> Tuple:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.completed += 1
+        if self.fail:
+            raise RuntimeError(f"模型 {self.model_name} 请求失败")
+        return f"{self.model_name}: {prompt}", ("", self.model_name)
+
+
+async def case_primary_wins(hedger: LLMRequestHedger, deadline: float) -> List[str]:
+    primary, backup = FakeModel("primary", deadline / 4), FakeModel("backup", deadline / 4)
+    (content, _), result = await hedger.generate_response_async(primary, "你好", backup=backup)
+    errors = []
+    if result.model_name != "primary" or result.hedged or content != "primary: 你好":
+        errors.append(f"应由主模型直接返回，实际 {result}")
+    if backup.calls:
+        errors.append("主模型按时返回时不应请求备用模型")
+    return errors
+
+
+async def case_hedge_wins(hedger: LLMRequestHedger, deadline: float) -> List[str]:
+    primary, backup = FakeModel("primary", deadline * 10), FakeModel("backup", deadline / 2)
+    _, result = await hedger.generate_response_async(primary, "你好", backup=backup)
+    await asyncio.sleep(0)  # 让被取消的请求处理 CancelledError
+    errors = []
+    if result.model_name != "backup" or not result.hedged or result.failover:
+        errors.append(f"应由备用模型对冲返回，实际 {result}")
+    if result.latency > deadline * 2:
+        errors.append(f"耗时 {result.latency:.2f}秒，未在截止时间后及时对冲")
+    if primary.cancelled != 1:
+        errors.append("备用模型胜出后主模型请求应被取消")
+    return errors
+
+
+async def case_primary_wins_after_hedge(hedger: LLMRequestHedger, deadline: float) -> List[str]:
+    primary, backup = FakeModel("primary", deadline * 1.5), FakeModel("backup", deadline * 10)
+    _, result = await hedger.generate_response_async(primary, "你好", backup=backup)
+    await asyncio.sleep(0)
+    errors = []
+    if result.model_name != "primary" or not result.hedged:
+        errors.append(f"应在发出对冲请求后仍由主模型返回，实际 {result}")
+    if backup.cancelled != 1:
+        errors.append("主模型胜出后备用模型请求应被取消")
+    return errors
+
+
+async def case_primary_fails(hedger: LLMRequestHedger, deadline: float) -> List[str]:
+    primary, backup = FakeModel("primary", deadline / 10, fail=True), FakeModel("backup", deadline / 10)
+    _, result = await hedger.generate_response_async(primary, "你好", backup=backup)
+    errors = []
+    if result.model_name != "backup" or not result.failover:
+        errors.append(f"主模型失败后应切换到备用模型，实际 {result}")
+    if result.latency > deadline:
+        errors.append(f"耗时 {result.latency:.2f}秒，主模型失败后没有立即切换")
+    return errors
+
+
+async def case_both_fail(hedger: LLMRequestHedger, deadline: float) -> List[str]:
+    primary = FakeModel("primary", deadline * 2, fail=True)
+    backup = FakeModel("backup", deadline / 2, fail=True)
+    errors = []
+    try:
+        result = await hedger.generate_response_async(primary, "你好", backup=backup)
+        errors.append(f"两个模型都失败时应抛出异常，实际返回 {result}")
+    except RuntimeError:
+        pass
+    await asyncio.sleep(0)
+    if primary.calls != primary.completed + primary.cancelled or backup.calls != backup.completed:
+        errors.append("抛出异常后仍有未结束的请求")
+    return errors
+
+
+async def case_caller_cancels(hedger: LLMRequestHedger, deadline: float) -> List[str]:
+    primary, backup = FakeModel("primary", deadline * 10), FakeModel("backup", deadline * 10)
+    task = asyncio.create_task(hedger.generate_response_async(primary, "你好", backup=backup))
+    await asyncio.sleep(deadline * 2)
+    task.cancel()
+    errors = []
+    try:
+        await task
+        errors.append("调用方取消后请求不应正常返回")
+    except asyncio.CancelledError:
+        pass
+    await asyncio.sleep(0)
+    if backup.calls != 1:
+        errors.append("取消前应已发出对冲请求")
+    if primary.cancelled != 1 or backup.cancelled != 1:
+        errors.append(f"调用方取消后两个请求都应被取消（主模型 {primary.cancelled}，备用模型 {backup.cancelled}）")
+    return errors
+
+
+CASES: List[Tuple[str, Callable]] = [
+    ("主模型按时返回", case_primary_wins),
+    ("备用模型对冲胜出", case_hedge_wins),
+    ("对冲后主模型胜出", case_primary_wins_after_hedge),
+    ("主模型失败切换", case_primary_fails),
+    ("两个模型都失败", case_both_fail),
+    ("调用方取消", case_caller_cancels),
+]
+
+
+async def run_checks(deadline: float) -> int:
+    failures = 0
+    for name, case in CASES:
+        # 每项使用新的对冲器，耗时样本不足，截止时间固定为 default_deadline
+        hedger = LLMRequestHedger()
+        start_time = time.monotonic()
+        try:
+            errors = await case(hedger, deadline)
+        except Exception as e:
+            errors = [f"出现异常: {e!r}"]
+        elapsed = time.monotonic() - start_time
+        print(f"[{'通过' if not errors else '失败'}] {name} ({elapsed:.2f}秒)")
+        for error in errors:
+            print(f"    {error}")
+        failures += bool(errors)
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检查请求对冲在各种情形下的行为")
+    parser.add_argument("--deadline", type=float, default=0.2, help="模拟的主模型截止时间（秒），默认0.2")
+    args = parser.parse_args()
+
+    hedge_config = global_config.llm_hedge
+    hedge_config.enable = True
+    hedge_config.request_types = [REQUEST_TYPE]
+    hedge_config.default_deadline = args.deadline
+    hedge_config.min_deadline = args.deadline
+
+    failures = asyncio.run(run_checks(args.deadline))
+    print(f"\n共 {len(CASES)} 项，失败 {failures} 项")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
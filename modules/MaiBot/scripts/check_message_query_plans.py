@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+消息表查询计划检查
+
+在临时数据库中生成大量模拟消息（默认500万条），对 message_repository 中
+find_messages / count_messages 的常用查询模式以及统计任务的查询执行 EXPLAIN QUERY PLAN，
+任何一个查询退化为全表扫描（包括不带筛选条件地扫描整个索引，以及消息视图关联的聊天流表和发送者表）时以非零状态码退出。
+
+查询计划中出现 "USE TEMP B-TREE FOR ORDER BY" 只作提示：按多个 user_id 筛选时，
+各用户的消息分别来自索引，需要再排序一次，排序的行数只与命中的消息数有关。
+
+用法: python scripts/check_message_query_plans.py [--rows 5000000] [--db 路径] [--keep] [--analyze]
+"""
+
+import argparse
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from peewee import SqliteDatabase, fn
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.common.database.database_model import (  # noqa: E402
+    ChatStreams,
+    Messages,
+    MessageSenders,
+    MessageView,
+    create_message_view,
+)
+from src.common.message_repository import _apply_filter, _build_find_query  # noqa: E402
+
+BATCH_SIZE = 50000
+CHAT_COUNT = 2000
+USER_COUNT = 20000
+TIME_SPAN = 180 * 24 * 3600  # 模拟消息覆盖的时间范围（秒）
+
+MODELS = [ChatStreams, MessageSenders, Messages, MessageView]
+
+# 全表扫描：SCAN 后没有跟筛选条件（"SCAN m" 或 "SCAN m USING INDEX xxx"），任何一张表都不应出现
+FULL_SCAN_PATTERN = re.compile(r"^SCAN (?!CONSTANT ROW)")
+
+
+def generate_messages(database: SqliteDatabase, rows: int):
+    """建表并插入模拟的聊天流、发送者和消息，消息插入完成后再建索引（与旧数据库升级时的情况相同）"""
+    start_time = time.time() - TIME_SPAN
+    database.create_tables([ChatStreams, MessageSenders])
+    ChatStreams.insert_many(
+        [
+            {
+                "stream_id": f"chat_{i}",
+                "create_time": start_time,
+                "group_platform": "qq",
+                "group_id": str(i),
+                "group_name": f"群{i}",
+                "last_active_time": start_time,
+                "platform": "qq",
+                "user_platform": "qq",
+                "user_id": "bot",
+                "user_nickname": "nickname",
+            }
+            for i in range(CHAT_COUNT)
+        ]
+    ).execute()
+    with database.atomic():
+        for i in range(0, USER_COUNT, 1000):
+            MessageSenders.insert_many(
+                [
+                    {"id": j + 1, "platform": "qq", "user_id": f"user_{j}", "user_nickname": "nickname"}
+                    for j in range(i, min(USER_COUNT, i + 1000))
+                ]
+            ).execute()
+
+    Messages._schema.create_table(safe=True)
+    fields = [field for field in Messages._meta.sorted_fields if field.name != "id"]
+    columns = ", ".join(f'"{field.column_name}"' for field in fields)
+    placeholders = ", ".join("?" for _ in fields)
+    sql = f'INSERT INTO "messages" ({columns}) VALUES ({placeholders})'
+
+    rng = random.Random(42)
+    step = TIME_SPAN / rows
+    values = {"processed_plain_text": "模拟消息", "memorized_times": 0}
+    connection = database.connection()
+    for batch_start in range(0, rows, BATCH_SIZE):
+        batch = []
+        for i in range(batch_start, min(rows, batch_start + BATCH_SIZE)):
+            user = rng.randrange(USER_COUNT)
+            values.update(
+                message_id=str(i),
+                time=start_time + i * step,
+                chat_id=f"chat_{rng.randrange(CHAT_COUNT)}",
+                user_id=f"user_{user}",
+                sender_id=user + 1,
+            )
+            batch.append(tuple(values.get(field.name) for field in fields))
+        with database.atomic():
+            connection.executemany(sql, batch)
+        print(f"\r已插入 {min(rows, batch_start + BATCH_SIZE)}/{rows} 条消息", end="", flush=True)
+    print()
+
+    index_start = time.perf_counter()
+    Messages._schema.create_indexes(safe=True)
+    print(f"创建索引耗时 {time.perf_counter() - index_start:.1f}s")
+    create_message_view(database)
+
+
+def build_patterns(now: float) -> List[Tuple[str, Callable]]:
+    """与 chat_message_builder、utils 和统计任务中实际使用的查询模式一致"""
+    chat_id = "chat_1"
+    users = ["user_1", "user_2", "user_3"]
+    recent = now - 3600
+    day_ago = now - 24 * 3600
+
+    def find(message_filter, sort=None, limit=0, limit_mode="latest"):
+        return lambda: _build_find_query(message_filter, sort, limit, limit_mode)
+
+    def count(message_filter):
+        return lambda: _apply_filter(MessageView.select(fn.COUNT(MessageView.id)), message_filter)
+
+    chat_range = {"chat_id": chat_id, "time": {"$gt": recent, "$lt": now}}
+    chat_users_range = {"chat_id": chat_id, "time": {"$gt": recent, "$lt": now}, "user_id": {"$in": users}}
+    return [
+        ("按时间范围（全部聊天）", find({"time": {"$gt": recent, "$lt": now}}, [("time", 1)])),
+        ("按时间范围（全部聊天，最新N条）", find({"time": {"$gt": recent, "$lt": now}}, limit=30)),
+        ("按聊天和时间范围", find(chat_range, [("time", 1)])),
+        ("按聊天和时间范围（最新N条）", find(chat_range, limit=30)),
+        ("按聊天和时间范围（最早N条）", find(chat_range, limit=30, limit_mode="earliest")),
+        (
+            "按聊天和时间范围（含边界）",
+            find({"chat_id": chat_id, "time": {"$gte": recent, "$lte": now}}, limit=30),
+        ),
+        ("按聊天、用户和时间范围", find(chat_users_range, limit=30)),
+        (
+            "按用户和时间范围（全部聊天）",
+            find({"time": {"$gt": recent, "$lt": now}, "user_id": {"$in": users}}, limit=30),
+        ),
+        ("指定时间之前（按聊天）", find({"chat_id": chat_id, "time": {"$lt": now}}, [("time", 1)], limit=30)),
+        ("指定时间之前（按用户）", find({"time": {"$lt": now}, "user_id": {"$in": users}}, [("time", 1)], limit=30)),
+        ("聊天中最近的消息", find({"chat_id": chat_id}, [("time", -1)], limit=12)),
+        ("按聊天和时间范围计数", count(chat_range)),
+        ("按聊天、用户和时间范围计数", count(chat_users_range)),
+        ("最近发言统计计数", count({"time": {"$gte": recent}, "chat_id": chat_id, "user_id": "user_1"})),
+        ("消息统计（指定时间之后）", lambda: MessageView.select().where(MessageView.time >= day_ago)),
+    ]
+
+
+def explain(database: SqliteDatabase, query) -> List[str]:
+    sql, params = query.sql()
+    return [row[-1] for row in database.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检查消息表常用查询是否使用索引")
+    parser.add_argument("--rows", type=int, default=5_000_000, help="模拟消息条数，默认5000000")
+    parser.add_argument("--db", help="数据库文件路径，默认在临时目录中创建；文件已存在时直接使用其中的数据")
+    parser.add_argument("--keep", action="store_true", help="检查结束后保留临时数据库")
+    parser.add_argument("--analyze", action="store_true", help="检查前执行 ANALYZE（默认检查没有统计信息时的查询计划）")
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.db:
+        db_path = Path(args.db)
+    else:
+        temp_dir = Path(tempfile.mkdtemp(prefix="maibot_query_plans_"))
+        db_path = temp_dir / "messages.db"
+    reuse = db_path.exists()
+
+    database = SqliteDatabase(str(db_path), pragmas={"journal_mode": "wal", "synchronous": 0, "cache_size": -64000})
+    for model in MODELS:
+        model.bind(database, bind_refs=False, bind_backrefs=False)
+    failures = 0
+    try:
+        with database:
+            if reuse:
+                print(f"使用已有数据库 {db_path}")
+                Messages._schema.create_indexes(safe=True)
+                create_message_view(database)
+            else:
+                generate_messages(database, args.rows)
+            if args.analyze:
+                database.execute_sql("ANALYZE")
+
+            total = Messages.select().count()
+            now = Messages.select(fn.MAX(Messages.time)).scalar() or time.time()
+            print(f"消息表共 {total} 条消息\n")
+
+            for name, build_query in build_patterns(now):
+                query = build_query()
+                plan = explain(database, query)
+                full_scan = any(FULL_SCAN_PATTERN.match(detail) for detail in plan)
+                temp_sort = any("USE TEMP B-TREE FOR ORDER BY" in detail for detail in plan)
+
+                start_time = time.perf_counter()
+                rows = len(database.execute_sql(*query.sql()).fetchall())
+                elapsed = time.perf_counter() - start_time
+
+                status = "全表扫描" if full_scan else ("额外排序" if temp_sort else "OK")
+                failures += full_scan
+                print(f"[{status}] {name}: {rows} 行, {elapsed * 1000:.1f}ms")
+                for detail in plan:
+                    print(f"    {detail}")
+    finally:
+        if temp_dir is not None:
+            if args.keep:
+                print(f"\n数据库已保留: {db_path}")
+            else:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if failures:
+        print(f"\n{failures} 个查询退化为全表扫描")
+        return 1
+    print("\n所有查询均使用了索引")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
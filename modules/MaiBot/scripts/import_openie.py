@@ -156,10 +156,10 @@ def handle_import_openie(openie_data: OpenIE, embed_manager: EmbeddingManager, k
         logger.info(f"段落去重完成，剩余待处理的段落数量：{len(raw_paragraphs)}")
         logger.info("开始Embedding")
         embed_manager.store_new_data_set(raw_paragraphs, triple_list_data)
-        # Embedding-Faiss重索引
-        logger.info("正在重新构建向量索引")
-        embed_manager.rebuild_faiss_index()
-        logger.info("向量索引构建完成")
+        # Embedding-Faiss索引增量更新
+        logger.info("正在更新向量索引")
+        embed_manager.update_faiss_index()
+        logger.info("向量索引更新完成")
         embed_manager.save_to_file()
         logger.info("Embedding完成")
         # 构建新段落的RAG
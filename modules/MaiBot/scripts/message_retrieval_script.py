@@ -31,7 +31,7 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from src.chat.utils.chat_message_builder import build_readable_messages
-from src.common.database.database_model import Messages
+from src.common.database.database_model import MessageView
 from src.common.logger import get_logger
 from src.common.database.database import db
 from src.config.config import global_config
@@ -363,21 +363,21 @@ class MessageRetrievalScript:
             print("时间范围: 全部时间")
 
         # 构建查询条件
-        query = Messages.select()
+        query = MessageView.select()
 
         # 添加用户条件：包含bot消息或目标用户消息
         user_condition = (
-            (Messages.user_id == self.bot_qq)  # bot的消息
-            | (Messages.user_id == user_qq)  # 目标用户的消息
+            (MessageView.user_id == self.bot_qq)  # bot的消息
+            | (MessageView.user_id == user_qq)  # 目标用户的消息
         )
         query = query.where(user_condition)
 
         # 添加时间条件
         if start_timestamp:
-            query = query.where(Messages.time >= start_timestamp)
+            query = query.where(MessageView.time >= start_timestamp)
 
         # 按时间排序
-        query = query.order_by(Messages.time.asc())
+        query = query.order_by(MessageView.time.asc())
 
         print("正在执行数据库查询...")
         messages = list(query)
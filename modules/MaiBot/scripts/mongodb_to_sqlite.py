@@ -33,7 +33,7 @@ from src.common.database.database import db
 from src.common.database.database_model import (
     ChatStreams,
     Emoji,
-    Messages,
+    LegacyMessages,
     Images,
     ImageDescriptions,
     PersonInfo,
@@ -181,10 +181,10 @@ class MongoToSQLiteMigrator:
                 enable_validation=False,  # 禁用数据验证
                 unique_fields=["stream_id"],
             ),
-            # 消息迁移配置
+            # 消息迁移配置：先写入旧版结构的 messages_legacy 表，下次启动时自动转换为新结构
             MigrationConfig(
                 mongo_collection="messages",
-                target_model=Messages,
+                target_model=LegacyMessages,
                 field_mapping={
                     "message_id": "message_id",
                     "time": "time",
@@ -551,6 +551,9 @@ class MongoToSQLiteMigrator:
         logger.info(f"开始迁移: {config.mongo_collection} -> {config.target_model._meta.table_name}")
 
         try:
+            # 其他目标表由 initialize_database 创建，messages_legacy 只在迁移时使用
+            config.target_model.create_table(safe=True)
+
             # 获取MongoDB集合
             mongo_collection = self.mongo_db[config.mongo_collection]
 
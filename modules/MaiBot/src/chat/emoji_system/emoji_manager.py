@@ -15,7 +15,9 @@ import re
 from src.common.database.database_model import Emoji
 from src.common.database.database import db as peewee_db
 from src.config.config import global_config
-from src.chat.utils.utils_image import image_path_to_base64, get_image_manager
+from src.chat.utils.utils_image import image_path_to_base64
+from src.chat.utils.image_dedup import MAX_DEDUP_CANDIDATES, format_phash, hamming_distance, parse_phash
+from src.common.image_pipeline import image_pipeline
 from src.llm_models.utils_model import LLMRequest
 from src.common.logger import get_logger
 from rich.traceback import install
@@ -53,6 +55,7 @@ class MaiEmoji:
         self.register_time = time.time()
         self.is_deleted = False  # 标记是否已被删除
         self.format = ""
+        self.phash: Optional[int] = None  # 感知哈希，用于识别近似重复的表情包
 
     async def initialize_hash_format(self) -> Optional[bool]:
         """从文件创建表情包实例, 计算哈希值和格式"""
@@ -164,6 +167,7 @@ class MaiEmoji:
                     register_time=self.register_time,
                     usage_count=self.usage_count,
                     last_used_time=self.last_used_time,
+                    phash=format_phash(self.phash),
                 )
 
                 logger.info(f"[注册] 表情包信息保存到数据库: {self.filename} ({self.emotion})")
@@ -283,6 +287,7 @@ def _to_emoji_objects(data: Any) -> Tuple[List["MaiEmoji"], int]:
             emoji.register_time = db_register_time if db_register_time is not None else emoji.register_time
 
             emoji.format = emoji_data.format
+            emoji.phash = parse_phash(emoji_data.phash)
 
             emoji_objects.append(emoji)
 
@@ -563,6 +568,10 @@ class EmojiManager:
                         removed_count += 1
                         continue
 
+                    # 为之前注册、没有感知哈希的表情包补充感知哈希
+                    if emoji.phash is None and global_config.image_dedup.enable:
+                        await self._fill_phash(emoji)
+
                 except Exception as item_error:
                     logger.error(f"[错误] 处理表情包记录时出错 ({emoji.filename}): {str(item_error)}")
                     # 即使出错，也尝试继续检查下一个
@@ -695,6 +704,38 @@ class EmojiManager:
             logger.error(f"[错误] 从数据库获取表情包对象失败: {str(e)}")
             return []
 
+    @staticmethod
+    async def _fill_phash(emoji: "MaiEmoji") -> None:
+        """计算表情包的感知哈希并保存到数据库"""
+        with open(emoji.full_path, "rb") as f:
+            image_bytes = f.read()
+        emoji.phash = await image_pipeline.perceptual_hash(image_bytes)
+        if emoji.phash is not None:
+            Emoji.update(phash=format_phash(emoji.phash)).where(Emoji.emoji_hash == emoji.hash).execute()
+
+    async def _find_similar_emoji(self, image_bytes: bytes, phash: Optional[int]) -> Optional["MaiEmoji"]:
+        """查找与给定图片近似重复的已注册表情包（注册数量有上限，直接遍历）
+
+        感知哈希相近的表情包还要逐像素比较确认，同一模板只改了文字的表情包不算重复
+        """
+        if phash is None:
+            return None
+        max_distance = global_config.image_dedup.max_distance
+        candidates = []
+        for emoji in self.emoji_objects:
+            if emoji.is_deleted or emoji.phash is None:
+                continue
+            distance = hamming_distance(phash, emoji.phash)
+            if distance <= max_distance:
+                candidates.append((distance, emoji))
+        candidates.sort(key=lambda candidate: candidate[0])
+        for distance, emoji in candidates[:MAX_DEDUP_CANDIDATES]:
+            difference = await image_pipeline.pixel_difference(image_bytes, emoji.full_path)
+            if difference is not None and difference <= global_config.image_dedup.max_pixel_difference:
+                logger.debug(f"找到近似重复的表情包 {emoji.hash} (距离 {distance}，像素差 {difference:.2f})")
+                return emoji
+        return None
+
     async def get_emoji_from_manager(self, emoji_hash: str) -> Optional["MaiEmoji"]:
         """从内存中的 emoji_objects 列表获取表情包
 
@@ -848,18 +889,20 @@ class EmojiManager:
         """
         try:
             # 解码图片并获取格式
-            # 确保base64字符串只包含ASCII字符
-            if isinstance(image_base64, str):
-                image_base64 = image_base64.encode("ascii", errors="ignore").decode("ascii")
-            image_bytes = base64.b64decode(image_base64)
-            image_format = Image.open(io.BytesIO(image_bytes)).format.lower()
+            image = await image_pipeline.decode(image_base64)
+            image_format = image.format
 
             # 调用AI获取描述
-            if image_format == "gif" or image_format == "GIF":
-                image_base64 = get_image_manager().transform_gif(image_base64)
+            if image_format == "gif":
+                frame_strip = await image_pipeline.gif_to_frame_strip(image.data)
+                if frame_strip is None:
+                    return "", []
+                image_base64 = base64.b64encode(frame_strip).decode("utf-8")
+                image_format = "jpg"
                 prompt = "这是一个动态图表情包，每一张图代表了动态图的某一帧，黑色背景代表透明，描述一下表情包表达的情感和内容，描述细节，从互联网梗,meme的角度去分析"
-                description, _ = await self.vlm.generate_response_for_image(prompt, image_base64, "jpg")
+                description, _ = await self.vlm.generate_response_for_image(prompt, image_base64, image_format)
             else:
+                image_base64 = image.to_base64()
                 prompt = "这是一个表情包，请详细描述一下表情包所表达的情感和内容，描述细节，从互联网梗,meme的角度去分析"
                 description, _ = await self.vlm.generate_response_for_image(prompt, image_base64, image_format)
 
@@ -925,8 +968,15 @@ class EmojiManager:
                 return False
 
             # 2. 检查哈希是否已存在 (在内存中检查)
-            if await self.get_emoji_from_manager(new_emoji.hash):
-                logger.warning(f"[注册跳过] 表情包已存在 (Hash: {new_emoji.hash}): {filename}")
+            existing_emoji = await self.get_emoji_from_manager(new_emoji.hash)
+            if not existing_emoji and global_config.image_dedup.enable:
+                # 再检查是否与已注册的表情包近似重复（重新编码、缩放过的同一张图）
+                with open(file_full_path, "rb") as f:
+                    image_bytes = f.read()
+                new_emoji.phash = await image_pipeline.perceptual_hash(image_bytes)
+                existing_emoji = await self._find_similar_emoji(image_bytes, new_emoji.phash)
+            if existing_emoji:
+                logger.warning(f"[注册跳过] 表情包已存在 (Hash: {existing_emoji.hash}): {filename}")
                 # 删除重复的源文件
                 try:
                     os.remove(file_full_path)
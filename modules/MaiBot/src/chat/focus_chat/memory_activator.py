@@ -91,6 +91,13 @@ class MemoryActivator:
         if not global_config.memory.enable_memory:
             return []
 
+        if global_config.memory.enable_embedding_recall:
+            # 向量检索模式：直接用目标消息做一次嵌入检索，省去LLM提取关键词的往返
+            related_memory = await hippocampus_manager.get_memory_from_text(
+                text=target_message, max_memory_num=3, max_memory_length=2, max_depth=3, fast_retrieval=True
+            )
+            return self._update_running_memory(related_memory)
+
         # 将缓存的关键词转换为字符串，用于prompt
         cached_keywords_str = ", ".join(self.cached_keywords) if self.cached_keywords else "暂无历史关键词"
 
@@ -124,6 +131,10 @@ class MemoryActivator:
             valid_keywords=keywords, max_memory_num=3, max_memory_length=2, max_depth=3
         )
 
+        return self._update_running_memory(related_memory)
+
+    def _update_running_memory(self, related_memory: List) -> List[Dict]:
+        """将新获取的记忆合并到正在使用的记忆中"""
         logger.info(f"获取到的记忆: {related_memory}")
 
         # 激活时，所有已有记忆的duration+1，达到3则移除
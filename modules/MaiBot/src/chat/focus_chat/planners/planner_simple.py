@@ -2,7 +2,8 @@ import json  # <--- 确保导入 json
 import traceback
 from typing import List, Dict, Any, Optional
 from rich.traceback import install
-from src.llm_models.utils_model import LLMRequest
+from src.llm_models.utils_model import LLMRequest, PROMPT_CACHE_BREAKPOINT
+from src.llm_models.hedged_request import llm_request_hedger
 from src.config.config import global_config
 from src.chat.focus_chat.info.info_base import InfoBase
 from src.chat.focus_chat.info.obs_info import ObsInfo
@@ -21,36 +22,43 @@ install(extra_lines=3)
 
 
 def init_prompt():
+    # 身份与动作说明等静态内容在前，作为多次请求间不变的前缀，便于服务商的前缀缓存命中；时间与聊天内容在后
     Prompt(
         """
-{time_block}
 {indentify_block}
 你现在需要根据聊天内容，选择的合适的action来参与聊天。
-{chat_context_description}，以下是具体的聊天内容：
-{chat_content_block}
 {moderation_prompt}
-现在请你根据聊天内容选择合适的action:
+你可以选择的action如下:
 
 {action_options_text}
+"""
+        + PROMPT_CACHE_BREAKPOINT
+        + """
+{time_block}
+{chat_context_description}，以下是具体的聊天内容：
+{chat_content_block}
 
-请根据动作示例，以严格的 JSON 格式输出，且仅包含 JSON 内容：
+现在请你根据聊天内容选择合适的action，请根据动作示例，以严格的 JSON 格式输出，且仅包含 JSON 内容：
 """,
         "simple_planner_prompt",
     )
 
     Prompt(
         """
-{time_block}
 {indentify_block}
 你现在需要根据聊天内容，选择的合适的action来参与聊天。
-{chat_context_description}，以下是具体的聊天内容：
-{chat_content_block}
 {moderation_prompt}
-现在请你选择合适的action:
+你可以选择的action如下:
 
 {action_options_text}
+"""
+        + PROMPT_CACHE_BREAKPOINT
+        + """
+{time_block}
+{chat_context_description}，以下是具体的聊天内容：
+{chat_content_block}
 
-请根据动作示例，以严格的 JSON 格式输出，且仅包含 JSON 内容：
+现在请你选择合适的action，请根据动作示例，以严格的 JSON 格式输出，且仅包含 JSON 内容：
 """,
         "simple_planner_prompt_private",
     )
@@ -186,7 +194,9 @@ class ActionPlanner(BasePlanner):
             llm_content = None
             try:
                 prompt = f"{prompt}"
-                llm_content, (reasoning_content, _) = await self.planner_llm.generate_response_async(prompt=prompt)
+                (llm_content, (reasoning_content, _)), _ = await llm_request_hedger.generate_response_async(
+                    self.planner_llm, prompt
+                )
 
                 logger.info(f"{self.log_prefix}规划器原始提示词: {prompt}")
                 logger.info(f"{self.log_prefix}规划器原始响应: {llm_content}")
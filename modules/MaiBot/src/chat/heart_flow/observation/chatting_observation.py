@@ -8,17 +8,16 @@ from src.chat.utils.chat_message_builder import (
     get_person_id_list,
 )
 from src.chat.utils.prompt_builder import global_prompt_manager, Prompt
+from src.llm_models.utils_model import PROMPT_CACHE_BREAKPOINT
 from src.chat.heart_flow.observation.observation import Observation
 from src.common.logger import get_logger
 from src.chat.heart_flow.utils_chat import get_chat_type_and_target_info
 
 logger = get_logger("observation")
 
-# 定义提示模板
+# 定义提示模板，固定的要求在前，作为多次请求间不变的前缀，便于服务商的前缀缓存命中；聊天记录在后
 Prompt(
-    """这是{chat_type_description}，请总结以下聊天记录的主题：
-{chat_logs}
-请概括这段聊天记录的主题和主要内容
+    """请概括下面这段聊天记录的主题和主要内容
 主题：简短的概括，包括时间，人物和事件，不要超过20个字
 内容：具体的信息内容，包括人物、事件和信息，不要超过200个字，不要分点。
 
@@ -27,6 +26,11 @@ Prompt(
     "theme": "主题，例如 2025-06-14 10:00:00 群聊 麦麦 和 网友 讨论了 游戏 的话题",
     "content": "内容，可以是对聊天记录的概括，也可以是聊天记录的详细内容"
 }}
+"""
+    + PROMPT_CACHE_BREAKPOINT
+    + """
+这是{chat_type_description}，请总结以下聊天记录的主题：
+{chat_logs}
 """,
     "chat_summary_prompt",
 )
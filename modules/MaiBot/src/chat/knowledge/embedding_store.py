@@ -1,7 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 import json
 import os
 import math
+import threading
+import time
+from collections.abc import Mapping
 from typing import Dict, List, Tuple
 
 import numpy as np
@@ -55,6 +59,7 @@ EMBEDDING_TEST_STRINGS = [
 ]
 EMBEDDING_TEST_FILE = os.path.join(ROOT_PATH, "data", "embedding_model_test.json")
 EMBEDDING_SIM_THRESHOLD = 0.99
+IVF_MIN_POINTS_PER_LIST = 39  # 训练IVF索引时每个聚类至少需要的向量数（低于此值faiss会给出警告）
 
 
 def cosine_similarity(a, b):
@@ -67,6 +72,39 @@ def cosine_similarity(a, b):
     return dot / (norm_a * norm_b)
 
 
+def _index_kind(faiss_index) -> str:
+    """FaissIndex的类型：flat / ivf / hnsw"""
+    if isinstance(faiss_index, faiss.IndexIDMap):
+        faiss_index = faiss.downcast_index(faiss_index.index)
+    if isinstance(faiss_index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(faiss_index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def _apply_search_params(faiss_index) -> None:
+    """设置IVF的nprobe与HNSW的efSearch（不随索引文件保存，每次加载后按配置设置）"""
+    if isinstance(faiss_index, faiss.IndexIDMap):
+        faiss_index = faiss.downcast_index(faiss_index.index)
+    if isinstance(faiss_index, faiss.IndexIVF):
+        faiss_index.nprobe = global_config["embedding"]["ivf_nprobe"]
+    elif isinstance(faiss_index, faiss.IndexHNSW):
+        faiss_index.hnsw.efSearch = global_config["embedding"]["hnsw_ef_search"]
+
+
+def _flat_index_vectors(flat_index) -> np.ndarray:
+    """IndexFlat内部向量缓冲区的 (ntotal, d) 视图
+
+    视图不持有缓冲区：索引扩容、删除或被释放后视图即失效，需重新获取，且只能在持有 _index_lock 时读取。
+    """
+    if not flat_index.ntotal:
+        return np.empty((0, flat_index.d), dtype=np.float32)
+    return faiss.rev_swig_ptr(flat_index.get_xb(), flat_index.ntotal * flat_index.d).reshape(
+        flat_index.ntotal, flat_index.d
+    )
+
+
 @dataclass
 class EmbeddingStoreItem:
     """嵌入库中的项"""
@@ -85,23 +123,105 @@ class EmbeddingStoreItem:
         }
 
 
+class EmbeddingStoreMapping(Mapping):
+    """嵌入库的只读映射视图：hash -> EmbeddingStoreItem
+
+    数据按列存放在 EmbeddingStore 中，只在访问时构造 EmbeddingStoreItem，
+    其 embedding 为向量缓冲区中对应行的副本（在 _index_lock 下复制，不受索引扩容或重建的影响）。
+    """
+
+    def __init__(self, embedding_store: "EmbeddingStore"):
+        self._embedding_store = embedding_store
+
+    def __getitem__(self, item_hash: str) -> EmbeddingStoreItem:
+        embedding_store = self._embedding_store
+        with embedding_store._index_lock:
+            idx = embedding_store.hash2idx[item_hash]
+            return EmbeddingStoreItem(item_hash, embedding_store._get_vector(idx), embedding_store.strs[idx])
+
+    def __contains__(self, item_hash) -> bool:
+        return item_hash in self._embedding_store.hash2idx
+
+    def __iter__(self):
+        return iter(self._embedding_store.hashes)
+
+    def __len__(self) -> int:
+        return len(self._embedding_store.hashes)
+
+
 class EmbeddingStore:
+    """嵌入库
+
+    按列存储：hash、原文与稳定id存放在 {namespace}_meta.parquet，L2归一化后的向量按行序存放在连续的
+    {namespace}_vectors.npy 中（float32，可配置为float16）。加载时向量文件以内存映射方式打开。
+
+    FaissIndex以稳定id（而非行号）为标签，新增的向量只追加到已有索引，删除时按id从索引中移除。
+    Flat索引在首次检索时构建，之后嵌入库直接引用其内部的向量缓冲区，内存中每个向量只保留一份；
+    IVF/HNSW索引构建代价高，保存为 {namespace}_faiss.index 及 {namespace}_faiss_ids.npy，
+    加载后只需追加其后新增的向量。
+    """
+
     def __init__(self, llm_client: LLMClient, namespace: str, dir_path: str):
         self.namespace = namespace
         self.llm_client = llm_client
         self.dir = dir_path
-        self.embedding_file_path = dir_path + "/" + namespace + ".parquet"
-        self.index_file_path = dir_path + "/" + namespace + ".index"
-        self.idx2hash_file_path = dir_path + "/" + namespace + "_i2h.json"
+        self.meta_file_path = dir_path + "/" + namespace + "_meta.parquet"
+        self.vector_file_path = dir_path + "/" + namespace + "_vectors.npy"
+        self.index_file_path = dir_path + "/" + namespace + "_faiss.index"
+        self.index_ids_file_path = dir_path + "/" + namespace + "_faiss_ids.npy"
+        self.legacy_embedding_file_path = dir_path + "/" + namespace + ".parquet"
+
+        self.hashes: List[str] = []
+        """第i行的hash"""
 
-        self.store = dict()
+        self.strs: List[str] = []
+        """第i行的原文"""
+
+        self.ids: List[int] = []
+        """第i行的稳定id（FaissIndex中的标签，删除其他行后保持不变）"""
+
+        self.hash2idx: Dict[str, int] = {}
+        """hash -> 行号"""
+
+        self.id2idx: Dict[int, int] = {}
+        """稳定id -> 行号"""
+
+        self.next_id = 0
+        """下一个新增项的id"""
+
+        self.vectors: np.ndarray | None = None
+        """已合并的向量（内存映射文件、内存数组或Flat索引缓冲区视图），对应前 len(self.vectors) 行
+
+        为Flat索引缓冲区视图时，索引扩容或被替换后即失效，只能在持有 _index_lock 时读取
+        """
+
+        self.new_vectors: List[np.ndarray] = []
+        """加载或建索引之后新增、尚未合并的向量"""
+
+        self.store = EmbeddingStoreMapping(self)
 
         self.faiss_index = None
-        self.idx2hash = None
+        self.indexed_rows = 0
+        """已加入FaissIndex的行数（索引总是覆盖前 indexed_rows 行）"""
+
+        self._index_lock = threading.Lock()
 
     def _get_embedding(self, s: str) -> List[float]:
         return self.llm_client.send_embedding_request(global_config["embedding"]["model"], s)
 
+    def _get_embeddings_with_retry(self, strs: List[str]) -> List[List[float]]:
+        """批量获取嵌入，失败时按指数退避重试"""
+        max_retries = global_config["embedding"]["max_retries"]
+        for attempt in range(max_retries + 1):
+            try:
+                return self.llm_client.send_embedding_batch_request(global_config["embedding"]["model"], strs)
+            except Exception as e:
+                if attempt >= max_retries:
+                    raise
+                wait_time = min(2**attempt, 60)
+                logger.warning(f"嵌入请求失败（{attempt + 1}/{max_retries}），{wait_time}秒后重试：{e}")
+                time.sleep(wait_time)
+
     def get_test_file_path(self):
         return EMBEDDING_TEST_FILE
 
@@ -143,7 +263,24 @@ class EmbeddingStore:
         return True
 
     def batch_insert_strs(self, strs: List[str], times: int) -> None:
-        """向库中存入字符串"""
+        """向库中存入字符串
+
+        待嵌入的字符串按 batch_size 分批，最多 max_concurrency 个批量请求同时进行；
+        每新增 checkpoint_interval 条嵌入就把库写入parquet文件，导入中断后重新运行会跳过已嵌入的字符串。
+        """
+        batch_size = max(1, global_config["embedding"]["batch_size"])
+        max_concurrency = max(1, global_config["embedding"]["max_concurrency"])
+        checkpoint_interval = global_config["embedding"]["checkpoint_interval"]
+
+        # 计算hash去重（同时去除本批次内的重复字符串）
+        pending: Dict[str, str] = {}
+        for s in strs:
+            item_hash = self.namespace + "-" + get_sha256(s)
+            if item_hash not in self.store:
+                pending[item_hash] = s
+        pending_items = list(pending.items())
+        batches = [pending_items[i : i + batch_size] for i in range(0, len(pending_items), batch_size)]
+
         total = len(strs)
         with Progress(
             SpinnerColumn(),
@@ -158,108 +295,349 @@ class EmbeddingStore:
             transient=False,
         ) as progress:
             task = progress.add_task(f"存入嵌入库：({times}/{TOTAL_EMBEDDING_TIMES})", total=total)
-            for s in strs:
-                # 计算hash去重
-                item_hash = self.namespace + "-" + get_sha256(s)
-                if item_hash in self.store:
-                    progress.update(task, advance=1)
-                    continue
-
-                # 获取embedding
-                embedding = self._get_embedding(s)
-
-                # 存入
-                self.store[item_hash] = EmbeddingStoreItem(item_hash, embedding, s)
-                progress.update(task, advance=1)
-
-    def save_to_file(self) -> None:
-        """保存到文件"""
-        data = []
-        logger.info(f"正在保存{self.namespace}嵌入库到文件{self.embedding_file_path}")
-        for item in self.store.values():
-            data.append(item.to_dict())
-        data_frame = pd.DataFrame(data)
-
+            # 已存在于库中的字符串直接计入进度
+            progress.update(task, advance=total - len(pending_items))
+            if not batches:
+                return
+
+            unsaved = 0
+            executor = ThreadPoolExecutor(max_workers=max_concurrency)
+            try:
+                future_to_batch = {
+                    executor.submit(self._get_embeddings_with_retry, [s for _, s in batch]): batch for batch in batches
+                }
+                for future in as_completed(future_to_batch):
+                    batch = future_to_batch[future]
+                    embeddings = future.result()
+
+                    # 存入
+                    self._append_items(batch, embeddings)
+                    progress.update(task, advance=len(batch))
+
+                    unsaved += len(batch)
+                    if checkpoint_interval and unsaved >= checkpoint_interval:
+                        self.save_store_to_file()
+                        unsaved = 0
+            except BaseException:
+                # 出错或被中断时保存已完成的部分，下次导入从断点继续
+                executor.shutdown(wait=False, cancel_futures=True)
+                if unsaved:
+                    logger.warning(f"嵌入过程中断，正在保存已完成的{self.namespace}嵌入进度")
+                    self.save_store_to_file()
+                raise
+            finally:
+                executor.shutdown(wait=True)
+
+    def _append_items(self, items: List[Tuple[str, str]], embeddings: List[List[float]]) -> None:
+        """追加一批 (hash, 原文) 及其嵌入，向量归一化后暂存于 new_vectors"""
+        vectors = np.array(embeddings, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        with self._index_lock:
+            for (item_hash, s), vector in zip(items, vectors, strict=True):
+                self.hash2idx[item_hash] = len(self.hashes)
+                self.id2idx[self.next_id] = len(self.hashes)
+                self.hashes.append(item_hash)
+                self.strs.append(s)
+                self.ids.append(self.next_id)
+                self.new_vectors.append(vector)
+                self.next_id += 1
+
+    def _set_rows(self, hashes: List[str], strs: List[str], ids: List[int]) -> None:
+        """替换全部行的元数据并重建hash/id到行号的映射"""
+        self.hashes = hashes
+        self.strs = strs
+        self.ids = ids
+        self.hash2idx = {item_hash: idx for idx, item_hash in enumerate(hashes)}
+        self.id2idx = {item_id: idx for idx, item_id in enumerate(ids)}
+        self.next_id = max(ids) + 1 if ids else 0
+
+    def get_vector(self, idx: int) -> np.ndarray:
+        """获取第idx行的向量（副本，不受之后索引扩容的影响）"""
+        with self._index_lock:
+            return self._get_vector(idx)
+
+    def _get_vector(self, idx: int) -> np.ndarray:
+        """获取第idx行的向量副本，调用方需持有 _index_lock"""
+        merged = 0 if self.vectors is None else len(self.vectors)
+        if idx < merged:
+            return np.array(self.vectors[idx], dtype=np.float32)
+        return self.new_vectors[idx - merged]
+
+    def _vectors_from(self, start: int) -> np.ndarray:
+        """获取第start行及之后的向量组成的连续float32矩阵（全部来自同一块float32缓冲区时不复制）"""
+        merged = 0 if self.vectors is None else len(self.vectors)
+        parts = []
+        if start < merged:
+            parts.append(self.vectors[start:])
+        if self.new_vectors[max(0, start - merged) :]:
+            parts.append(np.vstack(self.new_vectors[max(0, start - merged) :]))
+        if not parts:
+            return np.empty((0, self._dim()), dtype=np.float32)
+        if len(parts) == 1:
+            return np.ascontiguousarray(parts[0], dtype=np.float32)
+        return np.concatenate(parts).astype(np.float32, copy=False)
+
+    def _merged_vectors(self) -> np.ndarray:
+        """获取全部向量组成的连续float32矩阵（无新增向量且已是float32时不复制）"""
+        return self._vectors_from(0)
+
+    def save_store_to_file(self) -> None:
+        """仅保存嵌入数据，用于导入过程中的断点保存"""
+        logger.info(f"正在保存{self.namespace}嵌入库到文件{self.meta_file_path}")
         if not os.path.exists(self.dir):
             os.makedirs(self.dir, exist_ok=True)
-        if not os.path.exists(self.embedding_file_path):
-            open(self.embedding_file_path, "w").close()
 
-        data_frame.to_parquet(self.embedding_file_path, engine="pyarrow", index=False)
+        with self._index_lock:
+            # 向量文件先于meta文件写入：中断时向量文件只可能多出尾部行，加载时会被截断
+            # 两个文件都先写临时文件再替换，避免写入中途被中断导致已有的嵌入库损坏
+            if self.new_vectors or not isinstance(self.vectors, np.memmap):
+                # 内存映射的向量即文件本身，无新增时无需重写
+                if self.new_vectors and self._flat_index() is None:
+                    self.vectors = self._merged_vectors()
+                    self.new_vectors = []
+                vectors = self._merged_vectors()
+                dtype = np.float16 if global_config["embedding"]["storage_dtype"] == "float16" else np.float32
+                tmp_file_path = self.vector_file_path + ".tmp"
+                with open(tmp_file_path, "wb") as f:
+                    np.save(f, vectors.astype(dtype, copy=False))
+                os.replace(tmp_file_path, self.vector_file_path)
+
+            data_frame = pd.DataFrame({"hash": self.hashes, "str": self.strs, "id": np.array(self.ids, dtype=np.int64)})
+
+        tmp_file_path = self.meta_file_path + ".tmp"
+        data_frame.to_parquet(tmp_file_path, engine="pyarrow", index=False)
+        os.replace(tmp_file_path, self.meta_file_path)
         logger.info(f"{self.namespace}嵌入库保存成功")
 
-        if self.faiss_index is not None and self.idx2hash is not None:
+    def _save_faiss_index(self) -> None:
+        """保存IVF/HNSW索引及其包含的id（Flat索引可由向量文件直接重建，不保存）"""
+        with self._index_lock:
+            if self.faiss_index is None or _index_kind(self.faiss_index) == "flat":
+                return
             logger.info(f"正在保存{self.namespace}嵌入库的FaissIndex到文件{self.index_file_path}")
-            faiss.write_index(self.faiss_index, self.index_file_path)
+            if not os.path.exists(self.dir):
+                os.makedirs(self.dir, exist_ok=True)
+            # id文件记录索引覆盖的行，加载时据此判断索引是否与嵌入库一致
+            tmp_file_path = self.index_ids_file_path + ".tmp"
+            with open(tmp_file_path, "wb") as f:
+                np.save(f, np.array(self.ids[: self.indexed_rows], dtype=np.int64))
+            os.replace(tmp_file_path, self.index_ids_file_path)
+            tmp_file_path = self.index_file_path + ".tmp"
+            faiss.write_index(self.faiss_index, tmp_file_path)
+            os.replace(tmp_file_path, self.index_file_path)
             logger.info(f"{self.namespace}嵌入库的FaissIndex保存成功")
-            logger.info(f"正在保存{self.namespace}嵌入库的idx2hash映射到文件{self.idx2hash_file_path}")
-            with open(self.idx2hash_file_path, "w", encoding="utf-8") as f:
-                f.write(json.dumps(self.idx2hash, ensure_ascii=False, indent=4))
-            logger.info(f"{self.namespace}嵌入库的idx2hash映射保存成功")
+
+    def save_to_file(self) -> None:
+        """保存到文件"""
+        # 索引先于嵌入库写入：中断时索引至多缺少或多出部分id，加载时校验不通过会重建
+        self._save_faiss_index()
+        self.save_store_to_file()
+
+    def _migrate_legacy_file(self) -> None:
+        """将旧版（每行一个embedding列表的parquet）嵌入库转换为列式存储"""
+        logger.info(f"检测到旧版{self.namespace}嵌入库文件{self.legacy_embedding_file_path}，正在转换为新格式")
+        data_frame = pd.read_parquet(self.legacy_embedding_file_path, engine="pyarrow")
+        self._set_rows(data_frame["hash"].tolist(), data_frame["str"].tolist(), list(range(len(data_frame))))
+        if len(data_frame):
+            vectors = np.vstack(data_frame["embedding"].to_numpy()).astype(np.float32)
+            faiss.normalize_L2(vectors)
+            self.vectors = vectors
+        self.new_vectors = []
+        self.save_store_to_file()
+        logger.info(
+            f"{self.namespace}嵌入库转换完成，旧文件{self.legacy_embedding_file_path}及其.index/_i2h.json文件已不再使用，可自行删除"
+        )
 
     def load_from_file(self) -> None:
-        """从文件中加载"""
-        if not os.path.exists(self.embedding_file_path):
-            raise Exception(f"文件{self.embedding_file_path}不存在")
+        """从文件中加载（向量以内存映射方式打开，FaissIndex在首次检索时加载或构建）"""
+        if not (os.path.exists(self.meta_file_path) and os.path.exists(self.vector_file_path)):
+            if not os.path.exists(self.legacy_embedding_file_path):
+                raise Exception(f"文件{self.meta_file_path}不存在")
+            self._migrate_legacy_file()
+
         logger.info("正在加载嵌入库...")
-        logger.debug(f"正在从文件{self.embedding_file_path}中加载{self.namespace}嵌入库")
-        data_frame = pd.read_parquet(self.embedding_file_path, engine="pyarrow")
-        total = len(data_frame)
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            TaskProgressColumn(),
-            MofNCompleteColumn(),
-            "•",
-            TimeElapsedColumn(),
-            "<",
-            TimeRemainingColumn(),
-            transient=False,
-        ) as progress:
-            task = progress.add_task("加载嵌入库", total=total)
-            for _, row in data_frame.iterrows():
-                self.store[row["hash"]] = EmbeddingStoreItem(row["hash"], row["embedding"], row["str"])
-                progress.update(task, advance=1)
-        logger.info(f"{self.namespace}嵌入库加载成功")
+        logger.debug(f"正在从文件{self.meta_file_path}中加载{self.namespace}嵌入库")
+        data_frame = pd.read_parquet(self.meta_file_path, engine="pyarrow")
+        hashes = data_frame["hash"].tolist()
+        strs = data_frame["str"].tolist()
+        # 没有id列的meta文件（尚未删除过任何项）以行号作为id
+        ids = data_frame["id"].tolist() if "id" in data_frame.columns else list(range(len(hashes)))
+        vectors = np.load(self.vector_file_path, mmap_mode="r")
+        if len(vectors) < len(hashes):
+            raise Exception(f"{self.namespace}嵌入库的向量文件与meta文件行数不一致（{len(vectors)} < {len(hashes)}）")
+
+        with self._index_lock:
+            self._set_rows(hashes, strs, ids)
+            self.vectors = vectors[: len(hashes)]
+            self.new_vectors = []
+            self.faiss_index = None
+            self.indexed_rows = 0
+        logger.info(f"{self.namespace}嵌入库加载成功，共{len(hashes)}条")
+
+    def _flat_index(self):
+        """若当前索引为Flat索引，返回其内部的IndexFlat，否则返回None"""
+        if self.faiss_index is None or _index_kind(self.faiss_index) != "flat":
+            return None
+        return faiss.downcast_index(self.faiss_index.index)
+
+    def _dim(self) -> int:
+        """向量维度"""
+        if self.vectors is not None:
+            return self.vectors.shape[1]
+        if self.new_vectors:
+            return len(self.new_vectors[0])
+        return global_config["embedding"]["dimension"]
+
+    def _create_faiss_index(self):
+        """按配置的index_type创建（并训练）空索引，以内积（归一化后即余弦相似度）为度量"""
+        dim = self._dim()
+        index_type = global_config["embedding"]["index_type"]
+        if index_type == "ivf":
+            nlist = global_config["embedding"]["ivf_nlist"]
+            if len(self.hashes) >= nlist * IVF_MIN_POINTS_PER_LIST:
+                quantizer = faiss.IndexFlatIP(dim)
+                faiss_index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+                faiss_index.train(self._merged_vectors())
+                return faiss_index
+            logger.warning(
+                f"{self.namespace}嵌入库共{len(self.hashes)}条，不足以训练nlist={nlist}的IVF索引"
+                f"（至少需要{nlist * IVF_MIN_POINTS_PER_LIST}条），暂时使用Flat索引"
+            )
+        elif index_type == "hnsw":
+            return faiss.IndexIDMap2(
+                faiss.IndexHNSWFlat(dim, global_config["embedding"]["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+            )
+        elif index_type != "flat":
+            logger.warning(f"未知的索引类型{index_type}，使用Flat索引")
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    def _load_faiss_index(self) -> bool:
+        """加载已保存的IVF/HNSW索引，调用方需持有 _index_lock
 
+        Returns:
+            是否加载成功（索引类型与配置不符、或与嵌入库不一致时返回False）
+        """
+        if global_config["embedding"]["index_type"] not in ("ivf", "hnsw"):
+            return False
+        if not (os.path.exists(self.index_file_path) and os.path.exists(self.index_ids_file_path)):
+            return False
+        logger.info(f"正在加载{self.namespace}嵌入库的FaissIndex...")
         try:
-            if os.path.exists(self.index_file_path):
-                logger.info(f"正在加载{self.namespace}嵌入库的FaissIndex...")
-                logger.debug(f"正在从文件{self.index_file_path}中加载{self.namespace}嵌入库的FaissIndex")
-                self.faiss_index = faiss.read_index(self.index_file_path)
-                logger.info(f"{self.namespace}嵌入库的FaissIndex加载成功")
-            else:
-                raise Exception(f"文件{self.index_file_path}不存在")
-            if os.path.exists(self.idx2hash_file_path):
-                logger.info(f"正在加载{self.namespace}嵌入库的idx2hash映射...")
-                logger.debug(f"正在从文件{self.idx2hash_file_path}中加载{self.namespace}嵌入库的idx2hash映射")
-                with open(self.idx2hash_file_path, "r") as f:
-                    self.idx2hash = json.load(f)
-                logger.info(f"{self.namespace}嵌入库的idx2hash映射加载成功")
-            else:
-                raise Exception(f"文件{self.idx2hash_file_path}不存在")
+            faiss_index = faiss.read_index(self.index_file_path)
+            index_ids = np.load(self.index_ids_file_path)
         except Exception as e:
             logger.error(f"加载{self.namespace}嵌入库的FaissIndex时发生错误：{e}")
-            logger.warning("正在重建Faiss索引")
-            self.build_faiss_index()
-            logger.info(f"{self.namespace}嵌入库的FaissIndex重建成功")
-            self.save_to_file()
+            return False
+        if _index_kind(faiss_index) != global_config["embedding"]["index_type"]:
+            logger.warning(f"{self.namespace}嵌入库已保存的FaissIndex类型与配置不符，将重建索引")
+            return False
+        if (
+            faiss_index.ntotal != len(index_ids)
+            or len(index_ids) > len(self.ids)
+            or not np.array_equal(index_ids, np.array(self.ids[: len(index_ids)], dtype=np.int64))
+        ):
+            logger.warning(f"{self.namespace}嵌入库已保存的FaissIndex与嵌入数据不一致，将重建索引")
+            return False
+        _apply_search_params(faiss_index)
+        self.faiss_index = faiss_index
+        self.indexed_rows = len(index_ids)
+        logger.info(f"{self.namespace}嵌入库的FaissIndex加载成功，共{len(index_ids)}条")
+        return True
+
+    def _sync_faiss_index(self) -> None:
+        """把尚未加入索引的行追加到索引中，调用方需持有 _index_lock"""
+        start = self.indexed_rows
+        if start < len(self.hashes):
+            self.faiss_index.add_with_ids(self._vectors_from(start), np.array(self.ids[start:], dtype=np.int64))
+            self.indexed_rows = len(self.hashes)
+        flat_index = self._flat_index()
+        if flat_index is not None:
+            # 之后只保留Flat索引内部的一份向量，嵌入库通过视图读取
+            self.vectors = _flat_index_vectors(flat_index)
+            self.new_vectors = []
 
     def build_faiss_index(self) -> None:
-        """重新构建Faiss索引，以余弦相似度为度量"""
-        # 获取所有的embedding
-        array = []
-        self.idx2hash = dict()
-        for key in self.store:
-            array.append(self.store[key].embedding)
-            self.idx2hash[str(len(array) - 1)] = key
-        embeddings = np.array(array, dtype=np.float32)
-        # L2归一化
-        faiss.normalize_L2(embeddings)
-        # 构建索引
-        self.faiss_index = faiss.IndexFlatIP(global_config["embedding"]["dimension"])
-        self.faiss_index.add(embeddings)
+        """重新构建Faiss索引，以余弦相似度为度量（库中的向量已归一化）"""
+        with self._index_lock:
+            self._build_faiss_index()
+
+    def _build_faiss_index(self) -> None:
+        """构建Faiss索引，调用方需持有 _index_lock"""
+        if self._flat_index() is not None:
+            # 向量是旧索引缓冲区的视图，替换索引会释放该缓冲区，先复制出来
+            self.vectors = np.array(self.vectors)
+        self.faiss_index = self._create_faiss_index()
+        self.indexed_rows = 0
+        _apply_search_params(self.faiss_index)
+        self._sync_faiss_index()
+
+    def _ensure_faiss_index(self) -> None:
+        """确保索引存在且包含全部行：首次使用时加载或构建，之后只追加新增的行，调用方需持有 _index_lock"""
+        if self.faiss_index is None and not self._load_faiss_index():
+            logger.info(f"正在构建{self.namespace}嵌入库的FaissIndex")
+            self._build_faiss_index()
+            return
+        if self.indexed_rows < len(self.hashes):
+            logger.debug(f"向{self.namespace}嵌入库的FaissIndex追加{len(self.hashes) - self.indexed_rows}条")
+        self._sync_faiss_index()
+
+    def update_faiss_index(self) -> None:
+        """增量更新Faiss索引：新增的向量追加到已有索引，不重建
+
+        Flat索引不保存到文件，尚未构建时留到首次检索再构建。
+        """
+        with self._index_lock:
+            if self.faiss_index is None and global_config["embedding"]["index_type"] not in ("ivf", "hnsw"):
+                return
+            self._ensure_faiss_index()
+
+    def delete_items(self, item_hashes: List[str]) -> int:
+        """从库与索引中删除指定hash的项，其余项的id保持不变
+
+        Returns:
+            实际删除的项数
+        """
+        with self._index_lock:
+            rows = sorted({self.hash2idx[item_hash] for item_hash in item_hashes if item_hash in self.hash2idx})
+            if not rows:
+                return 0
+            if self.faiss_index is None and global_config["embedding"]["index_type"] == "ivf":
+                # IVF索引支持按id删除，先加载已保存的索引，免得删除后整体重建
+                self._load_faiss_index()
+            if self.faiss_index is not None:
+                self._sync_faiss_index()
+            removed_ids = np.array([self.ids[row] for row in rows], dtype=np.int64)
+            keep = np.ones(len(self.hashes), dtype=bool)
+            keep[rows] = False
+
+            flat_index = self._flat_index()
+            if flat_index is not None:
+                # Flat索引删除后按原顺序紧凑排列，与删除后的行一一对应
+                self.faiss_index.remove_ids(removed_ids)
+                self.vectors = _flat_index_vectors(flat_index)
+            else:
+                self.vectors = self._merged_vectors()[keep]
+                if self.faiss_index is not None:
+                    try:
+                        self.faiss_index.remove_ids(removed_ids)
+                    except RuntimeError:
+                        logger.warning(f"{self.namespace}嵌入库的FaissIndex不支持删除，将在下次检索时重建")
+                        self.faiss_index = None
+                if self.faiss_index is None:
+                    # 已保存的索引包含被删除的id，丢弃以免之后被复用的id误匹配
+                    for path in (self.index_file_path, self.index_ids_file_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+            self.new_vectors = []
+
+            self._set_rows(
+                [item_hash for item_hash, k in zip(self.hashes, keep, strict=True) if k],
+                [s for s, k in zip(self.strs, keep, strict=True) if k],
+                [item_id for item_id, k in zip(self.ids, keep, strict=True) if k],
+            )
+            self.indexed_rows = len(self.hashes) if self.faiss_index is not None else 0
+        logger.info(f"已从{self.namespace}嵌入库中删除{len(rows)}条")
+        return len(rows)
 
     def search_top_k(self, query: List[float], k: int) -> List[Tuple[str, float]]:
         """搜索最相似的k个项，以余弦相似度为度量
@@ -269,26 +647,23 @@ class EmbeddingStore:
         Returns:
             result: 最相似的k个项的(hash, 余弦相似度)列表
         """
-        if self.faiss_index is None:
-            logger.debug("FaissIndex尚未构建,返回None")
-            return None
-        if self.idx2hash is None:
-            logger.warning("idx2hash尚未构建,返回None")
+        if not self.hashes:
+            logger.debug("嵌入库为空,返回None")
             return None
 
         # L2归一化
-        faiss.normalize_L2(np.array([query], dtype=np.float32))
-        # 搜索
-        distances, indices = self.faiss_index.search(np.array([query]), k)
-        # 整理结果
-        indices = list(indices.flatten())
-        distances = list(distances.flatten())
-        result = [
-            (self.idx2hash[str(int(idx))], float(sim))
-            for (idx, sim) in zip(indices, distances)
-            if idx in range(len(self.idx2hash))
-        ]
-
+        query_vector = np.array([query], dtype=np.float32)
+        faiss.normalize_L2(query_vector)
+        # 搜索（与索引的追加、删除互斥）
+        with self._index_lock:
+            self._ensure_faiss_index()
+            distances, labels = self.faiss_index.search(query_vector, k)
+        # 整理结果（标签为稳定id，-1表示结果不足k个）
+        result = []
+        for label, sim in zip(labels.flatten(), distances.flatten(), strict=True):
+            idx = self.id2idx.get(int(label))
+            if idx is not None:
+                result.append((self.hashes[idx], float(sim)))
         return result
 
 
@@ -370,8 +745,20 @@ class EmbeddingManager:
         self.entities_embedding_store.save_to_file()
         self.relation_embedding_store.save_to_file()
 
+    def update_faiss_index(self):
+        """增量更新Faiss索引，只追加新增的向量（请在添加新数据后调用）"""
+        self.paragraphs_embedding_store.update_faiss_index()
+        self.entities_embedding_store.update_faiss_index()
+        self.relation_embedding_store.update_faiss_index()
+
     def rebuild_faiss_index(self):
-        """重建Faiss索引（请在添加新数据后调用）"""
+        """完全重建Faiss索引（更改索引类型或参数后调用）"""
         self.paragraphs_embedding_store.build_faiss_index()
         self.entities_embedding_store.build_faiss_index()
         self.relation_embedding_store.build_faiss_index()
+
+    def delete_paragraphs(self, pg_hashes: List[str]) -> int:
+        """从段落嵌入库中删除段落，返回实际删除的数量"""
+        deleted = self.paragraphs_embedding_store.delete_items(pg_hashes)
+        self.stored_pg_hashes.difference_update(pg_hashes)
+        return deleted
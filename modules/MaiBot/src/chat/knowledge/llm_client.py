@@ -1,4 +1,4 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 
 class LLMMessage:
@@ -18,6 +18,10 @@ class LLMClient:
             base_url=url,
             api_key=api_key,
         )
+        self.async_client = AsyncOpenAI(
+            base_url=url,
+            api_key=api_key,
+        )
 
     def send_chat_request(self, model, messages):
         """发送对话请求，等待返回结果"""
@@ -43,3 +47,17 @@ class LLMClient:
         """发送嵌入请求，等待返回结果"""
         text = text.replace("\n", " ")
         return self.client.embeddings.create(input=[text], model=model).data[0].embedding
+
+    async def send_embedding_request_async(self, model, text):
+        """异步发送嵌入请求，供事件循环中的调用方使用"""
+        text = text.replace("\n", " ")
+        response = await self.async_client.embeddings.create(input=[text], model=model)
+        return response.data[0].embedding
+
+    def send_embedding_batch_request(self, model, texts):
+        """发送批量嵌入请求（一次请求多个文本），返回与输入顺序一致的嵌入列表"""
+        texts = [text.replace("\n", " ") for text in texts]
+        data = self.client.embeddings.create(input=texts, model=model).data
+        if len(data) != len(texts):
+            raise ValueError(f"嵌入结果数量({len(data)})与输入数量({len(texts)})不一致")
+        return [item.embedding for item in sorted(data, key=lambda item: item.index)]
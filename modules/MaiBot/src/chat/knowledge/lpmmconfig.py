@@ -56,7 +56,8 @@ def _load_config(config, config_file_path):
         config["rdf_build"] = file_config["rdf_build"]
 
     if "embedding" in file_config:
-        config["embedding"] = file_config["embedding"]
+        # 合并而非覆盖，旧配置文件缺少的批量导入参数使用默认值
+        config["embedding"].update(file_config["embedding"])
 
     if "rag" in file_config:
         config["rag"] = file_config["rag"]
@@ -97,6 +98,16 @@ global_config = dict(
             "provider": "localhost",
             "model": "Pro/BAAI/bge-m3",
             "dimension": 1024,
+            "batch_size": 32,
+            "max_concurrency": 4,
+            "max_retries": 5,
+            "checkpoint_interval": 2000,
+            "storage_dtype": "float32",
+            "index_type": "flat",
+            "ivf_nlist": 4096,
+            "ivf_nprobe": 32,
+            "hnsw_m": 32,
+            "hnsw_ef_search": 128,
         },
         "rag": {
             "params": {
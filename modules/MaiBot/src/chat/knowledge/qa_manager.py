@@ -1,4 +1,6 @@
+import asyncio
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, List, Dict, Optional
 
 from .global_logger import logger
@@ -12,6 +14,10 @@ from .utils.dyn_topk import dyn_select_top_k
 
 
 MAX_KNOWLEDGE_LENGTH = 10000  # 最大知识长度
+QA_WORKER_THREADS = 2  # 异步查询时执行Faiss检索与PageRank的线程数
+
+# 异步查询的Faiss检索与PageRank在此线程池中执行，不阻塞事件循环
+_qa_executor = ThreadPoolExecutor(max_workers=QA_WORKER_THREADS, thread_name_prefix="lpmm-qa")
 
 
 class QAManager:
@@ -42,6 +48,29 @@ class QAManager:
         part_end_time = time.perf_counter()
         logger.debug(f"Embedding用时：{part_end_time - part_start_time:.5f}s")
 
+        return self._search(question_embedding)
+
+    async def process_query_async(
+        self, question: str
+    ) -> Tuple[List[Tuple[str, float, float]], Optional[Dict[str, float]]]:
+        """异步处理查询：Embedding请求使用异步客户端，Faiss检索与PageRank在线程池中执行"""
+
+        # 生成问题的Embedding
+        part_start_time = time.perf_counter()
+        question_embedding = await self.llm_client_list["embedding"].send_embedding_request_async(
+            global_config["embedding"]["model"], question
+        )
+        part_end_time = time.perf_counter()
+        logger.debug(f"Embedding用时：{part_end_time - part_start_time:.5f}s")
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_qa_executor, self._search, question_embedding)
+
+    def _search(
+        self, question_embedding: List[float]
+    ) -> Tuple[List[Tuple[str, float, float]], Optional[Dict[str, float]]]:
+        """根据问题Embedding检索关系与文段，必要时进行KG检索（CPU密集，同步执行）"""
+
         # 根据问题Embedding查询Relation Embedding库
         part_start_time = time.perf_counter()
         relation_search_res = self.embed_manager.relation_embedding_store.search_top_k(
@@ -104,7 +133,14 @@ class QAManager:
     def get_knowledge(self, question: str) -> str:
         """获取知识"""
         # 处理查询
-        processed_result = self.process_query(question)
+        return self._format_knowledge(self.process_query(question))
+
+    async def get_knowledge_async(self, question: str) -> str:
+        """异步获取知识，不阻塞事件循环"""
+        return self._format_knowledge(await self.process_query_async(question))
+
+    def _format_knowledge(self, processed_result) -> Optional[str]:
+        """将查询结果整理为知识文本"""
         if processed_result is not None:
             query_res = processed_result[0]
             knowledge = [
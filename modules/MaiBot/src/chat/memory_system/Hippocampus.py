@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import datetime
 import math
 import random
@@ -7,23 +8,28 @@ import re
 import json
 from itertools import combinations
 
-import jieba
 import networkx as nx
 import numpy as np
 from collections import Counter
 from ...llm_models.utils_model import LLMRequest
 from src.common.logger import get_logger
 from src.chat.memory_system.sample_distribution import MemoryBuildScheduler  # 分布生成器
+from src.chat.memory_system.memory_index import TopicTokenIndex
+from src.chat.memory_system.activation_engine import SpreadingActivationEngine
+from src.chat.memory_system.memory_embedding import MemoryEmbeddingIndex
 from ..utils.chat_message_builder import (
     get_raw_msg_by_timestamp,
     build_readable_messages,
     get_raw_msg_by_timestamp_with_chat,
 )  # 导入 build_readable_messages
 from ..utils.utils import translate_timestamp_to_human_readable
+from ..utils.segmentation import segmenter
 from rich.traceback import install
 
 from ...config.config import global_config
 from src.common.database.database_model import Messages, GraphNodes, GraphEdges  # Peewee Models导入
+from src.common.message_cache import recent_message_cache
+from peewee import Tuple
 
 install(extra_lines=3)
 
@@ -58,6 +64,60 @@ logger = get_logger("memory")
 class MemoryGraph:
     def __init__(self):
         self.G = nx.Graph()  # 使用 networkx 的图结构
+        self.token_index = TopicTokenIndex()  # 节点名称的倒排分词索引
+
+        # 自上次同步数据库以来的变更记录，供增量同步使用
+        self.dirty_nodes: set[str] = set()  # 新增或修改过的节点
+        self.dirty_edges: set[tuple[str, str]] = set()  # 新增或修改过的边
+        self.removed_nodes: set[str] = set()  # 被删除的节点（墓碑）
+        self.removed_edges: set[tuple[str, str]] = set()  # 被删除的边（墓碑）
+
+    @staticmethod
+    def edge_key(concept1, concept2) -> tuple[str, str]:
+        """无向边的规范化键"""
+        return (concept1, concept2) if concept1 <= concept2 else (concept2, concept1)
+
+    def mark_node_dirty(self, concept):
+        """标记节点已修改（直接修改节点属性后需调用）"""
+        self.dirty_nodes.add(concept)
+        self.removed_nodes.discard(concept)
+
+    def mark_edge_dirty(self, concept1, concept2):
+        """标记边已修改（直接修改边属性后需调用）"""
+        key = self.edge_key(concept1, concept2)
+        self.dirty_edges.add(key)
+        self.removed_edges.discard(key)
+
+    def pop_changes(self) -> tuple[set[str], set[tuple[str, str]], set[str], set[tuple[str, str]]]:
+        """取出并清空变更记录
+
+        Returns:
+            tuple: (dirty_nodes, dirty_edges, removed_nodes, removed_edges)
+        """
+        changes = (self.dirty_nodes, self.dirty_edges, self.removed_nodes, self.removed_edges)
+        self.dirty_nodes, self.dirty_edges, self.removed_nodes, self.removed_edges = set(), set(), set(), set()
+        return changes
+
+    def restore_changes(self, changes: tuple[set[str], set[tuple[str, str]], set[str], set[tuple[str, str]]]):
+        """同步失败时把取出的变更记录放回，留待下次同步"""
+        dirty_nodes, dirty_edges, removed_nodes, removed_edges = changes
+        self.removed_nodes |= removed_nodes - self.dirty_nodes
+        self.removed_edges |= removed_edges - self.dirty_edges
+        self.dirty_nodes |= dirty_nodes - self.removed_nodes
+        self.dirty_edges |= dirty_edges - self.removed_edges
+
+    def add_edge(self, concept1, concept2, **attrs):
+        """添加或覆盖一条边"""
+        self.G.add_edge(concept1, concept2, **attrs)
+        self.mark_edge_dirty(concept1, concept2)
+
+    def remove_edge(self, concept1, concept2):
+        """移除一条边"""
+        if self.G.has_edge(concept1, concept2):
+            self.G.remove_edge(concept1, concept2)
+        key = self.edge_key(concept1, concept2)
+        self.dirty_edges.discard(key)
+        self.removed_edges.add(key)
 
     def connect_dot(self, concept1, concept2):
         # 避免自连接
@@ -80,6 +140,7 @@ class MemoryGraph:
                 created_time=current_time,  # 添加创建时间
                 last_modified=current_time,
             )  # 添加最后修改时间
+        self.mark_edge_dirty(concept1, concept2)
 
     def add_dot(self, concept, memory):
         current_time = datetime.datetime.now().timestamp()
@@ -105,6 +166,24 @@ class MemoryGraph:
                 created_time=current_time,  # 添加创建时间
                 last_modified=current_time,
             )  # 添加最后修改时间
+        self.token_index.add_node(concept)
+        self.mark_node_dirty(concept)
+
+    def remove_dot(self, concept):
+        """移除节点及其所有连接，并同步更新分词索引"""
+        if concept in self.G:
+            for neighbor in list(self.G.neighbors(concept)):
+                self.remove_edge(concept, neighbor)
+            self.G.remove_node(concept)
+        self.token_index.remove_node(concept)
+        self.dirty_nodes.discard(concept)
+        self.removed_nodes.add(concept)
+
+    def clear(self):
+        """清空整个记忆图（同时清空变更记录）"""
+        self.G.clear()
+        self.token_index.clear()
+        self.pop_changes()
 
     def get_dot(self, concept):
         # 检查节点是否存在于图中
@@ -181,9 +260,10 @@ class MemoryGraph:
                 # 更新节点的记忆项
                 if memory_items:
                     self.G.nodes[topic]["memory_items"] = memory_items
+                    self.mark_node_dirty(topic)
                 else:
                     # 如果没有记忆项了，删除整个节点
-                    self.G.remove_node(topic)
+                    self.remove_dot(topic)
 
                 return removed_item
 
@@ -194,6 +274,8 @@ class MemoryGraph:
 class Hippocampus:
     def __init__(self):
         self.memory_graph = MemoryGraph()
+        self.activation_engine = SpreadingActivationEngine()
+        self.embedding_index = None  # 向量检索模式下的记忆向量索引
         self.model_summary = None
         self.entorhinal_cortex = None
         self.parahippocampal_gyrus = None
@@ -204,13 +286,32 @@ class Hippocampus:
         self.parahippocampal_gyrus = ParahippocampalGyrus(self)
         # 从数据库加载记忆图
         self.entorhinal_cortex.sync_memory_from_db()
+        self.refresh_activation_snapshot()
+        if global_config.memory.enable_embedding_recall:
+            self.embedding_index = MemoryEmbeddingIndex()
+            self.embedding_index.load()
         # TODO: API-Adapter修改标记
         self.model_summary = LLMRequest(global_config.model.memory_summary, request_type="memory")
+        # 记忆构建使用单独的request_type，以便在请求调度中排在回复相关的请求之后
+        self.model_summary_build = LLMRequest(global_config.model.memory_summary, request_type="memory.build")
 
     def get_all_node_names(self) -> list:
         """获取记忆图中所有节点的名字列表"""
         return list(self.memory_graph.G.nodes())
 
+    def refresh_activation_snapshot(self):
+        """记忆图发生构建、遗忘或整合后，重建扩散激活使用的CSR快照"""
+        self.activation_engine.refresh(self.memory_graph.G)
+
+    async def sync_embedding_index(self):
+        """向量检索模式下，将记忆图的变化同步到向量索引（批量嵌入新增的节点和记忆项）"""
+        if self.embedding_index is None:
+            return
+        try:
+            await self.embedding_index.sync(self.memory_graph.G)
+        except Exception as e:
+            logger.error(f"同步记忆向量索引失败: {e}")
+
     @staticmethod
     def calculate_node_hash(concept, memory_items) -> int:
         """计算节点的特征值"""
@@ -276,29 +377,18 @@ class Hippocampus:
         if not keyword:
             return []
 
-        # 获取所有节点
-        all_nodes = list(self.memory_graph.G.nodes())
         memories = []
 
-        # 计算关键词的词集合
-        keyword_words = set(jieba.cut(keyword))
-
-        # 遍历所有节点，计算相似度
-        for node in all_nodes:
-            node_words = set(jieba.cut(node))
-            all_words = keyword_words | node_words
-            v1 = [1 if word in keyword_words else 0 for word in all_words]
-            v2 = [1 if word in node_words else 0 for word in all_words]
-            similarity = cosine_similarity(v1, v2)
-
-            # 如果相似度超过阈值，获取该节点的记忆
-            if similarity >= 0.3:  # 可以调整这个阈值
-                node_data = self.memory_graph.G.nodes[node]
-                memory_items = node_data.get("memory_items", [])
-                if not isinstance(memory_items, list):
-                    memory_items = [memory_items] if memory_items else []
+        # 通过倒排索引只在共享词的节点中计算相似度
+        for node, similarity in self.memory_graph.token_index.search(keyword, 0.3):  # 可以调整这个阈值
+            if node not in self.memory_graph.G:
+                continue
+            node_data = self.memory_graph.G.nodes[node]
+            memory_items = node_data.get("memory_items", [])
+            if not isinstance(memory_items, list):
+                memory_items = [memory_items] if memory_items else []
 
-                memories.append((node, memory_items, similarity))
+            memories.append((node, memory_items, similarity))
 
         # 按相似度降序排序
         memories.sort(key=lambda x: x[2], reverse=True)
@@ -322,6 +412,7 @@ class Hippocampus:
             fast_retrieval (bool, optional): 是否使用快速检索。默认为False。
                 如果为True，使用jieba分词和TF-IDF提取关键词，速度更快但可能不够准确。
                 如果为False，使用LLM提取关键词，速度较慢但更准确。
+                启用向量检索（memory.enable_embedding_recall）时忽略此参数，改用向量近邻搜索。
 
         Returns:
             list: 记忆列表，每个元素是一个元组 (topic, memory_items, similarity)
@@ -332,9 +423,25 @@ class Hippocampus:
         if not text:
             return []
 
-        if fast_retrieval:
+        # 向量检索模式：一次嵌入请求 + 近邻搜索得到关键词节点，不再需要LLM提取关键词
+        query_vector = None
+        if self.embedding_index is not None:
+            query_vector = await self.embedding_index.embed_query(text)
+
+        if query_vector is not None:
+            keywords = [
+                node
+                for node, _ in self.embedding_index.search_nodes(
+                    query_vector,
+                    global_config.memory.embedding_recall_top_k,
+                    global_config.memory.embedding_recall_threshold,
+                )
+            ]
+            logger.debug(f"向量检索关键词: {keywords}")
+
+        elif fast_retrieval:
             # 使用jieba分词提取关键词
-            words = jieba.cut(text)
+            words = segmenter.cut(text)
             # 过滤掉停用词和单字词
             keywords = [word for word in words if len(word) > 1]
             # 去重
@@ -371,55 +478,8 @@ class Hippocampus:
 
         logger.debug(f"有效的关键词: {', '.join(valid_keywords)}")
 
-        # 从每个关键词获取记忆
-        activate_map = {}  # 存储每个词的累计激活值
-
-        # 对每个关键词进行扩散式检索
-        for keyword in valid_keywords:
-            logger.debug(f"开始以关键词 '{keyword}' 为中心进行扩散检索 (最大深度: {max_depth}):")
-            # 初始化激活值
-            activation_values = {keyword: 1.0}
-            # 记录已访问的节点
-            visited_nodes = {keyword}
-            # 待处理的节点队列，每个元素是(节点, 激活值, 当前深度)
-            nodes_to_process = [(keyword, 1.0, 0)]
-
-            while nodes_to_process:
-                current_node, current_activation, current_depth = nodes_to_process.pop(0)
-
-                # 如果激活值小于0或超过最大深度，停止扩散
-                if current_activation <= 0 or current_depth >= max_depth:
-                    continue
-
-                # 获取当前节点的所有邻居
-                neighbors = list(self.memory_graph.G.neighbors(current_node))
-
-                for neighbor in neighbors:
-                    if neighbor in visited_nodes:
-                        continue
-
-                    # 获取连接强度
-                    edge_data = self.memory_graph.G[current_node][neighbor]
-                    strength = edge_data.get("strength", 1)
-
-                    # 计算新的激活值
-                    new_activation = current_activation - (1 / strength)
-
-                    if new_activation > 0:
-                        activation_values[neighbor] = new_activation
-                        visited_nodes.add(neighbor)
-                        nodes_to_process.append((neighbor, new_activation, current_depth + 1))
-                        # logger.debug(
-                        # f"节点 '{neighbor}' 被激活，激活值: {new_activation:.2f} (通过 '{current_node}' 连接，强度: {strength}, 深度: {current_depth + 1})"
-                        # )  # noqa: E501
-
-            # 更新激活映射
-            for node, activation_value in activation_values.items():
-                if activation_value > 0:
-                    if node in activate_map:
-                        activate_map[node] += activation_value
-                    else:
-                        activate_map[node] = activation_value
+        # 基于记忆图快照对所有关键词批量进行扩散式检索，得到每个节点的累计激活值
+        activate_map = self.activation_engine.activate(valid_keywords, max_depth)
 
         # 输出激活映射
         # logger.info("激活映射统计:")
@@ -455,6 +515,8 @@ class Hippocampus:
         # logger.info("开始从选中的节点中提取记忆:")
         for node, activation in remember_map.items():
             logger.debug(f"处理节点 '{node}' (激活值: {activation:.2f}):")
+            if node not in self.memory_graph.G:
+                continue  # 快照更新前已被遗忘的节点
             node_data = self.memory_graph.G.nodes[node]
             memory_items = node_data.get("memory_items", [])
             if not isinstance(memory_items, list):
@@ -464,14 +526,18 @@ class Hippocampus:
                 logger.debug(f"节点包含 {len(memory_items)} 条记忆")
                 # 计算每条记忆与输入文本的相似度
                 memory_similarities = []
+                text_words = segmenter.cut_set(text)
                 for memory in memory_items:
-                    # 计算与输入文本的相似度
-                    memory_words = set(jieba.cut(memory))
-                    text_words = set(jieba.cut(text))
-                    all_words = memory_words | text_words
-                    v1 = [1 if word in memory_words else 0 for word in all_words]
-                    v2 = [1 if word in text_words else 0 for word in all_words]
-                    similarity = cosine_similarity(v1, v2)
+                    # 计算与输入文本的相似度，已向量化的记忆项使用向量相似度
+                    similarity = None
+                    if query_vector is not None:
+                        similarity = self.embedding_index.item_similarity(query_vector, node, str(memory))
+                    if similarity is None:
+                        memory_words = segmenter.cut_set(memory)
+                        all_words = memory_words | text_words
+                        v1 = [1 if word in memory_words else 0 for word in all_words]
+                        v2 = [1 if word in text_words else 0 for word in all_words]
+                        similarity = cosine_similarity(v1, v2)
                     memory_similarities.append((memory, similarity))
 
                 # 按相似度排序
@@ -542,55 +608,8 @@ class Hippocampus:
 
         logger.debug(f"有效的关键词: {', '.join(valid_keywords)}")
 
-        # 从每个关键词获取记忆
-        activate_map = {}  # 存储每个词的累计激活值
-
-        # 对每个关键词进行扩散式检索
-        for keyword in valid_keywords:
-            logger.debug(f"开始以关键词 '{keyword}' 为中心进行扩散检索 (最大深度: {max_depth}):")
-            # 初始化激活值
-            activation_values = {keyword: 1.0}
-            # 记录已访问的节点
-            visited_nodes = {keyword}
-            # 待处理的节点队列，每个元素是(节点, 激活值, 当前深度)
-            nodes_to_process = [(keyword, 1.0, 0)]
-
-            while nodes_to_process:
-                current_node, current_activation, current_depth = nodes_to_process.pop(0)
-
-                # 如果激活值小于0或超过最大深度，停止扩散
-                if current_activation <= 0 or current_depth >= max_depth:
-                    continue
-
-                # 获取当前节点的所有邻居
-                neighbors = list(self.memory_graph.G.neighbors(current_node))
-
-                for neighbor in neighbors:
-                    if neighbor in visited_nodes:
-                        continue
-
-                    # 获取连接强度
-                    edge_data = self.memory_graph.G[current_node][neighbor]
-                    strength = edge_data.get("strength", 1)
-
-                    # 计算新的激活值
-                    new_activation = current_activation - (1 / strength)
-
-                    if new_activation > 0:
-                        activation_values[neighbor] = new_activation
-                        visited_nodes.add(neighbor)
-                        nodes_to_process.append((neighbor, new_activation, current_depth + 1))
-                        # logger.debug(
-                        # f"节点 '{neighbor}' 被激活，激活值: {new_activation:.2f} (通过 '{current_node}' 连接，强度: {strength}, 深度: {current_depth + 1})"
-                        # )  # noqa: E501
-
-            # 更新激活映射
-            for node, activation_value in activation_values.items():
-                if activation_value > 0:
-                    if node in activate_map:
-                        activate_map[node] += activation_value
-                    else:
-                        activate_map[node] = activation_value
+        # 基于记忆图快照对所有关键词批量进行扩散式检索，得到每个节点的累计激活值
+        activate_map = self.activation_engine.activate(valid_keywords, max_depth)
 
         # 基于激活值平方的独立概率选择
         remember_map = {}
@@ -621,6 +640,8 @@ class Hippocampus:
         # logger.info("开始从选中的节点中提取记忆:")
         for node, activation in remember_map.items():
             logger.debug(f"处理节点 '{node}' (激活值: {activation:.2f}):")
+            if node not in self.memory_graph.G:
+                continue  # 快照更新前已被遗忘的节点
             node_data = self.memory_graph.G.nodes[node]
             memory_items = node_data.get("memory_items", [])
             if not isinstance(memory_items, list):
@@ -632,7 +653,7 @@ class Hippocampus:
                 memory_similarities = []
                 for memory in memory_items:
                     # 计算与输入文本的相似度
-                    memory_words = set(jieba.cut(memory))
+                    memory_words = segmenter.cut_set(memory)
                     text_words = set(keywords)
                     all_words = memory_words | text_words
                     v1 = [1 if word in memory_words else 0 for word in all_words]
@@ -692,7 +713,7 @@ class Hippocampus:
 
         if fast_retrieval:
             # 使用jieba分词提取关键词
-            words = jieba.cut(text)
+            words = segmenter.cut(text)
             # 过滤掉停用词和单字词
             keywords = [word for word in words if len(word) > 1]
             # 去重
@@ -728,54 +749,8 @@ class Hippocampus:
 
         logger.debug(f"有效的关键词: {', '.join(valid_keywords)}")
 
-        # 从每个关键词获取记忆
-        activate_map = {}  # 存储每个词的累计激活值
-
-        # 对每个关键词进行扩散式检索
-        for keyword in valid_keywords:
-            logger.debug(f"开始以关键词 '{keyword}' 为中心进行扩散检索 (最大深度: {max_depth}):")
-            # 初始化激活值
-            activation_values = {keyword: 1.0}
-            # 记录已访问的节点
-            visited_nodes = {keyword}
-            # 待处理的节点队列，每个元素是(节点, 激活值, 当前深度)
-            nodes_to_process = [(keyword, 1.0, 0)]
-
-            while nodes_to_process:
-                current_node, current_activation, current_depth = nodes_to_process.pop(0)
-
-                # 如果激活值小于0或超过最大深度，停止扩散
-                if current_activation <= 0 or current_depth >= max_depth:
-                    continue
-
-                # 获取当前节点的所有邻居
-                neighbors = list(self.memory_graph.G.neighbors(current_node))
-
-                for neighbor in neighbors:
-                    if neighbor in visited_nodes:
-                        continue
-
-                    # 获取连接强度
-                    edge_data = self.memory_graph.G[current_node][neighbor]
-                    strength = edge_data.get("strength", 1)
-
-                    # 计算新的激活值
-                    new_activation = current_activation - (1 / strength)
-
-                    if new_activation > 0:
-                        activation_values[neighbor] = new_activation
-                        visited_nodes.add(neighbor)
-                        nodes_to_process.append((neighbor, new_activation, current_depth + 1))
-                        # logger.debug(
-                        # f"节点 '{neighbor}' 被激活，激活值: {new_activation:.2f} (通过 '{current_node}' 连接，强度: {strength}, 深度: {current_depth + 1})")  # noqa: E501
-
-            # 更新激活映射
-            for node, activation_value in activation_values.items():
-                if activation_value > 0:
-                    if node in activate_map:
-                        activate_map[node] += activation_value
-                    else:
-                        activate_map[node] = activation_value
+        # 基于记忆图快照对所有关键词批量进行扩散式检索，得到每个节点的累计激活值
+        activate_map = self.activation_engine.activate(valid_keywords, max_depth)
 
         # 输出激活映射
         # logger.info("激活映射统计:")
@@ -880,6 +855,11 @@ class EntorhinalCortex:
                             Messages.update(memorized_times=current_memorized_times + 1).where(
                                 Messages.message_id == message["message_id"]
                             ).execute()
+                            recent_message_cache.update(
+                                message["message_id"],
+                                chat_id=message["chat_id"],
+                                memorized_times=current_memorized_times + 1,
+                            )
                         return messages  # 直接返回原始的消息列表
 
             # 如果获取失败或消息无效，增加尝试次数
@@ -890,170 +870,117 @@ class EntorhinalCortex:
         return None
 
     async def sync_memory_to_db(self):
-        """将记忆图同步到数据库"""
+        """将记忆图自上次同步以来的变更增量写入数据库
+
+        只处理 MemoryGraph 记录的脏节点、脏边和墓碑，在一个事务内批量删除与批量写入，
+        耗时与变更量成正比，而与记忆图的总规模无关。
+        """
         start_time = time.time()
         current_time = datetime.datetime.now().timestamp()
-
-        # 获取数据库中所有节点和内存中所有节点
-        db_nodes = {node.concept: node for node in GraphNodes.select()}
-        memory_nodes = list(self.memory_graph.G.nodes(data=True))
-
-        # 批量准备节点数据
-        nodes_to_create = []
-        nodes_to_update = []
-        nodes_to_delete = set()
-
-        # 处理节点
-        for concept, data in memory_nodes:
-            if not concept or not isinstance(concept, str):
-                self.memory_graph.G.remove_node(concept)
+        graph = self.memory_graph
+
+        # 清理无效节点：非字符串概念、没有记忆项的节点（例如仅因连接而被隐式创建的节点）
+        candidates = set(graph.dirty_nodes)
+        for source, target in graph.dirty_edges:
+            candidates.add(source)
+            candidates.add(target)
+        for concept in candidates:
+            if concept not in graph.G:
                 continue
+            memory_items = graph.G.nodes[concept].get("memory_items", [])
+            if not concept or not isinstance(concept, str) or not memory_items:
+                graph.remove_dot(concept)
+
+        changes = graph.pop_changes()
+        dirty_nodes, dirty_edges, removed_nodes, removed_edges = changes
+        if not any(changes):
+            logger.debug("[同步] 记忆图没有变化，跳过同步")
+            return
 
+        # 准备节点数据
+        nodes_data = []
+        for concept in dirty_nodes:
+            if concept not in graph.G:
+                continue
+            data = graph.G.nodes[concept]
             memory_items = data.get("memory_items", [])
             if not isinstance(memory_items, list):
                 memory_items = [memory_items] if memory_items else []
-
-            if not memory_items:
-                self.memory_graph.G.remove_node(concept)
-                continue
-
-            # 计算内存中节点的特征值
-            memory_hash = self.hippocampus.calculate_node_hash(concept, memory_items)
-            created_time = data.get("created_time", current_time)
-            last_modified = data.get("last_modified", current_time)
-
-            # 将memory_items转换为JSON字符串
             try:
                 memory_items = [str(item) for item in memory_items]
                 memory_items_json = json.dumps(memory_items, ensure_ascii=False)
-                if not memory_items_json:
-                    continue
-            except Exception:
-                self.memory_graph.G.remove_node(concept)
+            except Exception as e:
+                logger.error(f"准备节点 {concept} 数据时发生错误: {e}")
                 continue
+            nodes_data.append(
+                {
+                    "concept": concept,
+                    "memory_items": memory_items_json,
+                    "hash": self.hippocampus.calculate_node_hash(concept, memory_items),
+                    "tokens": self._dump_node_tokens(concept),
+                    "created_time": data.get("created_time", current_time),
+                    "last_modified": data.get("last_modified", current_time),
+                }
+            )
 
-            if concept not in db_nodes:
-                nodes_to_create.append(
-                    {
-                        "concept": concept,
-                        "memory_items": memory_items_json,
-                        "hash": memory_hash,
-                        "created_time": created_time,
-                        "last_modified": last_modified,
-                    }
-                )
-            else:
-                db_node = db_nodes[concept]
-                if db_node.hash != memory_hash:
-                    nodes_to_update.append(
-                        {
-                            "concept": concept,
-                            "memory_items": memory_items_json,
-                            "hash": memory_hash,
-                            "last_modified": last_modified,
-                        }
-                    )
-
-        # 计算需要删除的节点
-        memory_concepts = {concept for concept, _ in memory_nodes}
-        nodes_to_delete = set(db_nodes.keys()) - memory_concepts
-
-        # 批量处理节点
-        if nodes_to_create:
-            batch_size = 100
-            for i in range(0, len(nodes_to_create), batch_size):
-                batch = nodes_to_create[i : i + batch_size]
-                GraphNodes.insert_many(batch).execute()
-
-        if nodes_to_update:
-            batch_size = 100
-            for i in range(0, len(nodes_to_update), batch_size):
-                batch = nodes_to_update[i : i + batch_size]
-                for node_data in batch:
-                    GraphNodes.update(**{k: v for k, v in node_data.items() if k != "concept"}).where(
-                        GraphNodes.concept == node_data["concept"]
-                    ).execute()
-
-        if nodes_to_delete:
-            GraphNodes.delete().where(GraphNodes.concept.in_(nodes_to_delete)).execute()
-
-        # 处理边的信息
-        db_edges = list(GraphEdges.select())
-        memory_edges = list(self.memory_graph.G.edges(data=True))
+        # 准备边数据
+        edges_data = []
+        for source, target in dirty_edges:
+            if not graph.G.has_edge(source, target):
+                continue
+            data = graph.G[source][target]
+            edges_data.append(
+                {
+                    "source": source,
+                    "target": target,
+                    "strength": data.get("strength", 1),
+                    "hash": self.hippocampus.calculate_edge_hash(source, target),
+                    "created_time": data.get("created_time", current_time),
+                    "last_modified": data.get("last_modified", current_time),
+                }
+            )
 
-        # 创建边的哈希值字典
-        db_edge_dict = {}
-        for edge in db_edges:
-            edge_hash = self.hippocampus.calculate_edge_hash(edge.source, edge.target)
-            db_edge_dict[(edge.source, edge.target)] = {"hash": edge_hash, "strength": edge.strength}
+        # 需要从数据库删除的边：墓碑 + 将被重写的脏边（数据库中可能以任一方向存储）
+        edge_keys_to_delete = list(removed_edges | dirty_edges)
+        edge_keys_to_delete += [(target, source) for source, target in edge_keys_to_delete]
 
-        # 批量准备边数据
-        edges_to_create = []
-        edges_to_update = []
+        batch_size = 100
+        try:
+            with GraphNodes._meta.database.atomic():
+                removed_node_list = list(removed_nodes)
+                for i in range(0, len(removed_node_list), batch_size * 5):
+                    batch = removed_node_list[i : i + batch_size * 5]
+                    GraphNodes.delete().where(GraphNodes.concept.in_(batch)).execute()
 
-        # 处理边
-        for source, target, data in memory_edges:
-            edge_hash = self.hippocampus.calculate_edge_hash(source, target)
-            edge_key = (source, target)
-            strength = data.get("strength", 1)
-            created_time = data.get("created_time", current_time)
-            last_modified = data.get("last_modified", current_time)
-
-            if edge_key not in db_edge_dict:
-                edges_to_create.append(
-                    {
-                        "source": source,
-                        "target": target,
-                        "strength": strength,
-                        "hash": edge_hash,
-                        "created_time": created_time,
-                        "last_modified": last_modified,
-                    }
-                )
-            elif db_edge_dict[edge_key]["hash"] != edge_hash:
-                edges_to_update.append(
-                    {
-                        "source": source,
-                        "target": target,
-                        "strength": strength,
-                        "hash": edge_hash,
-                        "last_modified": last_modified,
-                    }
-                )
+                for i in range(0, len(edge_keys_to_delete), batch_size * 4):
+                    batch = edge_keys_to_delete[i : i + batch_size * 4]
+                    GraphEdges.delete().where(Tuple(GraphEdges.source, GraphEdges.target).in_(batch)).execute()
 
-        # 计算需要删除的边
-        memory_edge_keys = {(source, target) for source, target, _ in memory_edges}
-        edges_to_delete = set(db_edge_dict.keys()) - memory_edge_keys
-
-        # 批量处理边
-        if edges_to_create:
-            batch_size = 100
-            for i in range(0, len(edges_to_create), batch_size):
-                batch = edges_to_create[i : i + batch_size]
-                GraphEdges.insert_many(batch).execute()
-
-        if edges_to_update:
-            batch_size = 100
-            for i in range(0, len(edges_to_update), batch_size):
-                batch = edges_to_update[i : i + batch_size]
-                for edge_data in batch:
-                    GraphEdges.update(**{k: v for k, v in edge_data.items() if k not in ["source", "target"]}).where(
-                        (GraphEdges.source == edge_data["source"]) & (GraphEdges.target == edge_data["target"])
-                    ).execute()
+                for i in range(0, len(nodes_data), batch_size):
+                    GraphNodes.insert_many(nodes_data[i : i + batch_size]).on_conflict_replace().execute()
 
-        if edges_to_delete:
-            for source, target in edges_to_delete:
-                GraphEdges.delete().where((GraphEdges.source == source) & (GraphEdges.target == target)).execute()
+                for i in range(0, len(edges_data), batch_size):
+                    GraphEdges.insert_many(edges_data[i : i + batch_size]).execute()
+        except Exception as e:
+            logger.error(f"[同步] 增量同步失败，变更将在下次同步时重试: {e}")
+            graph.restore_changes(changes)
+            return
 
         end_time = time.time()
         logger.info(f"[同步] 总耗时: {end_time - start_time:.2f}秒")
-        logger.info(f"[同步] 同步了 {len(memory_nodes)} 个节点和 {len(memory_edges)} 条边")
+        logger.info(
+            f"[同步] 写入 {len(nodes_data)} 个节点和 {len(edges_data)} 条边，"
+            f"删除 {len(removed_nodes)} 个节点和 {len(removed_edges)} 条边"
+        )
 
     async def resync_memory_to_db(self):
         """清空数据库并重新同步所有记忆数据"""
         start_time = time.time()
         logger.info("[数据库] 开始重新同步所有记忆数据...")
 
+        # 全量重写覆盖了所有未同步的变更
+        self.memory_graph.pop_changes()
+
         # 清空数据库
         clear_start = time.time()
         GraphNodes.delete().execute()
@@ -1084,6 +1011,7 @@ class EntorhinalCortex:
                         "concept": concept,
                         "memory_items": memory_items_json,
                         "hash": self.hippocampus.calculate_node_hash(concept, memory_items),
+                        "tokens": self._dump_node_tokens(concept),
                         "created_time": data.get("created_time", current_time),
                         "last_modified": data.get("last_modified", current_time),
                     }
@@ -1136,13 +1064,19 @@ class EntorhinalCortex:
         logger.info(f"[数据库] 重新同步完成，总耗时: {end_time - start_time:.2f}秒")
         logger.info(f"[数据库] 同步了 {len(nodes_data)} 个节点和 {len(edges_data)} 条边")
 
+    def _dump_node_tokens(self, concept) -> str:
+        """将节点的分词结果序列化为JSON，随节点一同持久化，重启后用于恢复倒排索引并预热分词缓存"""
+        return json.dumps(list(segmenter.cut(concept)), ensure_ascii=False)
+
     def sync_memory_from_db(self):
         """从数据库同步数据到内存中的图结构"""
         current_time = datetime.datetime.now().timestamp()
         need_update = False
+        tokens_to_backfill = []
+        orphan_edges = []
 
         # 清空当前图
-        self.memory_graph.G.clear()
+        self.memory_graph.clear()
 
         # 从数据库加载所有节点
         nodes = list(GraphNodes.select())
@@ -1173,6 +1107,12 @@ class EntorhinalCortex:
                 self.memory_graph.G.add_node(
                     concept, memory_items=memory_items, created_time=created_time, last_modified=last_modified
                 )
+
+                # 恢复倒排索引，旧数据没有分词结果时现场分词并回填
+                tokens = json.loads(node.tokens) if node.tokens else None
+                self.memory_graph.token_index.add_node(concept, tokens)
+                if tokens is None:
+                    tokens_to_backfill.append(concept)
             except Exception as e:
                 logger.error(f"加载节点 {concept} 时发生错误: {e}")
                 continue
@@ -1207,6 +1147,24 @@ class EntorhinalCortex:
                 self.memory_graph.G.add_edge(
                     source, target, strength=strength, created_time=created_time, last_modified=last_modified
                 )
+            else:
+                orphan_edges.append((source, target))
+
+        # 增量同步只处理变更，端点已不存在的残留边在加载时一并清理
+        if orphan_edges:
+            with GraphEdges._meta.database.atomic():
+                for i in range(0, len(orphan_edges), 400):
+                    batch = orphan_edges[i : i + 400]
+                    GraphEdges.delete().where(Tuple(GraphEdges.source, GraphEdges.target).in_(batch)).execute()
+            logger.info(f"[数据库] 已清理 {len(orphan_edges)} 条端点不存在的连接")
+
+        if tokens_to_backfill:
+            with GraphNodes._meta.database.atomic():
+                for concept in tokens_to_backfill:
+                    GraphNodes.update(tokens=self._dump_node_tokens(concept)).where(
+                        GraphNodes.concept == concept
+                    ).execute()
+            logger.info(f"[数据库] 已为 {len(tokens_to_backfill)} 个节点补充分词索引")
 
         if need_update:
             logger.info("[数据库] 已为缺失的时间字段进行补充")
@@ -1217,6 +1175,24 @@ class ParahippocampalGyrus:
     def __init__(self, hippocampus: Hippocampus):
         self.hippocampus = hippocampus
         self.memory_graph = hippocampus.memory_graph
+        # 限制记忆构建时同时进行的LLM请求数量（所有样本共享）
+        self.summary_semaphore = asyncio.Semaphore(max(1, global_config.memory.memory_build_concurrency))
+
+    async def _generate_summary(self, prompt: str) -> tuple | None:
+        """在并发限制和超时保护下调用记忆概括模型，失败或超时返回None
+
+        超时从请求发出时开始计算，在服务商调度器中排队的时间不计入
+        """
+        async with self.summary_semaphore:
+            try:
+                return await self.hippocampus.model_summary_build.generate_response_async(
+                    prompt, timeout=global_config.memory.memory_summary_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"记忆概括请求超时（{global_config.memory.memory_summary_timeout}秒）")
+            except Exception as e:
+                logger.error(f"记忆概括请求失败: {e}")
+            return None
 
     async def memory_compress(self, messages: list, compress_rate=0.1):
         """压缩和总结消息内容，生成记忆主题和摘要。
@@ -1226,19 +1202,16 @@ class ParahippocampalGyrus:
             compress_rate (float, optional): 压缩率，用于控制生成的主题数量。默认为0.1。
 
         Returns:
-            tuple: (compressed_memory, similar_topics_dict)
-                - compressed_memory: set, 压缩后的记忆集合，每个元素是一个元组 (topic, summary)
-                - similar_topics_dict: dict, 相似主题字典
+            set: 压缩后的记忆集合，每个元素是一个元组 (topic, summary)
 
         Process:
             1. 使用 build_readable_messages 生成包含时间、人物信息的格式化文本。
             2. 使用LLM提取关键主题。
             3. 过滤掉包含禁用关键词的主题。
             4. 为每个主题生成摘要。
-            5. 查找与现有记忆中的相似主题。
         """
         if not messages:
-            return set(), {}
+            return set()
 
         # 1. 使用 build_readable_messages 生成格式化文本
         # build_readable_messages 只返回一个字符串，不需要解包
@@ -1252,7 +1225,7 @@ class ParahippocampalGyrus:
         # 如果生成的可读文本为空（例如所有消息都无效），则直接返回
         if not input_text:
             logger.warning("无法从提供的消息生成可读文本，跳过记忆压缩。")
-            return set(), {}
+            return set()
 
         current_date = f"当前日期: {datetime.datetime.now().isoformat()}"
         input_text = f"{current_date}\n{input_text}"
@@ -1261,9 +1234,11 @@ class ParahippocampalGyrus:
 
         # 2. 使用LLM提取关键主题
         topic_num = self.hippocampus.calculate_topic_num(input_text, compress_rate)
-        topics_response, (reasoning_content, model_name) = await self.hippocampus.model_summary.generate_response_async(
-            self.hippocampus.find_topic_llm(input_text, topic_num)
-        )
+        response = await self._generate_summary(self.hippocampus.find_topic_llm(input_text, topic_num))
+        if not response:
+            logger.warning("提取记忆主题失败，跳过记忆压缩。")
+            return set()
+        topics_response, (reasoning_content, model_name) = response
 
         # 提取<>中的内容
         topics = re.findall(r"<([^>]+)>", topics_response)
@@ -1284,48 +1259,29 @@ class ParahippocampalGyrus:
 
         logger.debug(f"过滤后话题: {filtered_topics}")
 
-        # 4. 创建所有话题的摘要生成任务
-        tasks = []
-        for topic in filtered_topics:
-            # 调用修改后的 topic_what，不再需要 time_info
-            topic_what_prompt = self.hippocampus.topic_what(input_text, topic)
-            try:
-                task = self.hippocampus.model_summary.generate_response_async(topic_what_prompt)
-                tasks.append((topic.strip(), task))
-            except Exception as e:
-                logger.error(f"生成话题 '{topic}' 的摘要时发生错误: {e}")
-                continue
+        # 4. 并发生成所有话题的摘要，单个话题失败或超时不影响其他话题
+        topics_to_summarize = [topic.strip() for topic in filtered_topics]
+        responses = await asyncio.gather(
+            *(self._generate_summary(self.hippocampus.topic_what(input_text, topic)) for topic in topics_to_summarize)
+        )
 
-        # 等待所有任务完成
         compressed_memory = set()
-        similar_topics_dict = {}
-
-        for topic, task in tasks:
-            response = await task
-            if response:
-                compressed_memory.add((topic, response[0]))
-
-                existing_topics = list(self.memory_graph.G.nodes())
-                similar_topics = []
-
-                for existing_topic in existing_topics:
-                    topic_words = set(jieba.cut(topic))
-                    existing_words = set(jieba.cut(existing_topic))
-
-                    all_words = topic_words | existing_words
-                    v1 = [1 if word in topic_words else 0 for word in all_words]
-                    v2 = [1 if word in existing_words else 0 for word in all_words]
-
-                    similarity = cosine_similarity(v1, v2)
-
-                    if similarity >= 0.7:
-                        similar_topics.append((existing_topic, similarity))
+        for topic, response in zip(topics_to_summarize, responses, strict=True):
+            if not response:
+                logger.warning(f"话题 '{topic}' 的摘要生成失败，已跳过")
+                continue
+            compressed_memory.add((topic, response[0]))
 
-                similar_topics.sort(key=lambda x: x[1], reverse=True)
-                similar_topics = similar_topics[:3]
-                similar_topics_dict[topic] = similar_topics
+        return compressed_memory
 
-        return compressed_memory, similar_topics_dict
+    def _find_similar_topics(self, topic: str) -> list[tuple[str, float]]:
+        """查找记忆图中与主题相似的已有节点（最多3个）"""
+        similar_topics = [
+            (existing_topic, similarity)
+            for existing_topic, similarity in self.memory_graph.token_index.search(topic, 0.7)
+            if existing_topic in self.memory_graph.G
+        ]
+        return similar_topics[:3]
 
     async def operation_build_memory(self):
         logger.info("------------------------------------开始构建记忆--------------------------------------")
@@ -1334,14 +1290,27 @@ class ParahippocampalGyrus:
         all_added_nodes = []
         all_connected_nodes = []
         all_added_edges = []
-        for i, messages in enumerate(memory_samples, 1):
+
+        # 并发压缩多个样本，写入记忆图时仍按样本顺序进行；
+        # 相似主题在写入每个样本前查找，因此能连接到同一次构建中先写入的样本的主题
+        sample_semaphore = asyncio.Semaphore(max(1, global_config.memory.memory_build_sample_concurrency))
+        compress_rate = global_config.memory.memory_compress_rate
+
+        async def compress_sample(messages):
+            async with sample_semaphore:
+                try:
+                    return await self.memory_compress(messages, compress_rate)
+                except Exception as e:
+                    logger.error(f"压缩记忆时发生错误: {e}")
+                    return None
+
+        compress_results = await asyncio.gather(*(compress_sample(messages) for messages in memory_samples))
+
+        for i, compressed_memory in enumerate(compress_results, 1):
             all_topics = []
-            compress_rate = global_config.memory.memory_compress_rate
-            try:
-                compressed_memory, similar_topics_dict = await self.memory_compress(messages, compress_rate)
-            except Exception as e:
-                logger.error(f"压缩记忆时发生错误: {e}")
+            if compressed_memory is None:
                 continue
+            similar_topics_dict = {topic: self._find_similar_topics(topic) for topic, _ in compressed_memory}
             for topic, memory in compressed_memory:
                 logger.info(f"取得记忆: {topic} - {memory}")
             for topic, similar_topics in similar_topics_dict.items():
@@ -1367,7 +1336,7 @@ class ParahippocampalGyrus:
                             all_connected_nodes.append(topic)
                             all_connected_nodes.append(similar_topic)
 
-                            self.memory_graph.G.add_edge(
+                            self.memory_graph.add_edge(
                                 topic,
                                 similar_topic,
                                 strength=strength,
@@ -1394,8 +1363,11 @@ class ParahippocampalGyrus:
             logger.info(f"强化连接节点: {', '.join(all_connected_nodes)}")
 
         await self.hippocampus.entorhinal_cortex.sync_memory_to_db()
+        self.hippocampus.refresh_activation_snapshot()
+        await self.hippocampus.sync_embedding_index()
 
         end_time = time.time()
+        logger.debug(f"分词缓存统计: {segmenter.get_stats()}")
         logger.info(f"---------------------记忆构建耗时: {end_time - start_time:.2f} 秒---------------------")
 
     async def operation_forget_topic(self, percentage=0.005):
@@ -1453,11 +1425,12 @@ class ParahippocampalGyrus:
                 new_strength = current_strength - 1
 
                 if new_strength <= 0:
-                    self.memory_graph.G.remove_edge(source, target)
+                    self.memory_graph.remove_edge(source, target)
                     edge_changes["removed"].append(f"{source} -> {target}")
                 else:
                     edge_data["strength"] = new_strength
                     edge_data["last_modified"] = current_time
+                    self.memory_graph.mark_edge_dirty(source, target)
                     edge_changes["weakened"].append(f"{source}-{target} (强度: {current_strength} -> {new_strength})")
         edge_check_end = time.time()
         logger.info(f"[遗忘] 连接检查耗时: {edge_check_end - edge_check_start:.2f}秒")
@@ -1479,7 +1452,7 @@ class ParahippocampalGyrus:
             # 新增：检查节点是否为空
             if not memory_items:
                 try:
-                    self.memory_graph.G.remove_node(node)
+                    self.memory_graph.remove_dot(node)
                     node_changes["removed"].append(f"{node}(空节点)")  # 标记为空节点移除
                     logger.debug(f"[遗忘] 移除了空的节点: {node}")
                 except nx.NetworkXError as e:
@@ -1503,11 +1476,12 @@ class ParahippocampalGyrus:
                             if memory_items:  # 如果移除后列表不为空
                                 # self.memory_graph.G.nodes[node]["memory_items"] = memory_items # 直接修改列表即可
                                 self.memory_graph.G.nodes[node]["last_modified"] = current_time  # 更新修改时间
+                                self.memory_graph.mark_node_dirty(node)
                                 node_changes["reduced"].append(f"{node} (数量: {current_count} -> {len(memory_items)})")
                             else:  # 如果移除后列表为空
                                 # 尝试移除节点，处理可能的错误
                                 try:
-                                    self.memory_graph.G.remove_node(node)
+                                    self.memory_graph.remove_dot(node)
                                     node_changes["removed"].append(f"{node}(遗忘清空)")  # 标记为遗忘清空
                                     logger.debug(f"[遗忘] 节点 {node} 因移除最后一项而被清空。")
                                 except nx.NetworkXError as e:
@@ -1521,7 +1495,9 @@ class ParahippocampalGyrus:
         if any(edge_changes.values()) or any(node_changes.values()):
             sync_start = time.time()
 
-            await self.hippocampus.entorhinal_cortex.resync_memory_to_db()
+            await self.hippocampus.entorhinal_cortex.sync_memory_to_db()
+            self.hippocampus.refresh_activation_snapshot()
+            await self.hippocampus.sync_embedding_index()
 
             sync_end = time.time()
             logger.info(f"[遗忘] 数据库同步耗时: {sync_end - sync_start:.2f}秒")
@@ -1628,6 +1604,7 @@ class ParahippocampalGyrus:
                         merged_count += 1
                         nodes_modified.add(node)
                         node_data["last_modified"] = current_timestamp  # 更新修改时间
+                        self.memory_graph.mark_node_dirty(node)
                         _merged_in_this_node = True
                         break  # 每个节点每次检查只合并一对
                     except ValueError:
@@ -1644,8 +1621,10 @@ class ParahippocampalGyrus:
             logger.info(f"[整合] 共合并了 {merged_count} 对相似记忆项，分布在 {len(nodes_modified)} 个节点中。")
             sync_start = time.time()
             logger.info("[整合] 开始将变更同步到数据库...")
-            # 使用 resync 更安全地处理删除和添加
-            await self.hippocampus.entorhinal_cortex.resync_memory_to_db()
+            # 只同步发生变化的节点
+            await self.hippocampus.entorhinal_cortex.sync_memory_to_db()
+            self.hippocampus.refresh_activation_snapshot()
+            await self.hippocampus.sync_embedding_index()
             sync_end = time.time()
             logger.info(f"[整合] 数据库同步耗时: {sync_end - sync_start:.2f}秒")
         else:
@@ -1657,8 +1636,8 @@ class ParahippocampalGyrus:
     @staticmethod
     def _calculate_item_similarity(item1: str, item2: str) -> float:
         """计算两条记忆项文本的余弦相似度"""
-        words1 = set(jieba.cut(item1))
-        words2 = set(jieba.cut(item2))
+        words1 = segmenter.cut_set(item1)
+        words2 = segmenter.cut_set(item2)
         all_words = words1 | words2
         if not all_words:
             return 0.0
@@ -1685,13 +1664,14 @@ class HippocampusManager:
         memory_graph = self._hippocampus.memory_graph.G
         node_count = len(memory_graph.nodes())
         edge_count = len(memory_graph.edges())
+        index_stats = self._hippocampus.memory_graph.token_index.get_stats()
 
         logger.info(f"""--------------------------------
                     记忆系统参数配置:
                     构建间隔: {global_config.memory.memory_build_interval}秒|样本数: {global_config.memory.memory_build_sample_num},长度: {global_config.memory.memory_build_sample_length}|压缩率: {global_config.memory.memory_compress_rate}
                     记忆构建分布: {global_config.memory.memory_build_distribution}
                     遗忘间隔: {global_config.memory.forget_memory_interval}秒|遗忘比例: {global_config.memory.memory_forget_percentage}|遗忘: {global_config.memory.memory_forget_time}小时之后
-                    记忆图统计信息: 节点数量: {node_count}, 连接数量: {edge_count}
+                    记忆图统计信息: 节点数量: {node_count}, 连接数量: {edge_count}, 索引词数: {index_stats["tokens"]}
                     --------------------------------""")  # noqa: E501
 
         return self._hippocampus
@@ -1779,6 +1759,12 @@ class HippocampusManager:
             raise RuntimeError("HippocampusManager 尚未初始化，请先调用 initialize 方法")
         return self._hippocampus.get_all_node_names()
 
+    def get_index_stats(self) -> dict:
+        """获取记忆节点分词索引统计信息（节点数、词数、命中/未命中次数）的公共接口"""
+        if not self._initialized:
+            raise RuntimeError("HippocampusManager 尚未初始化，请先调用 initialize 方法")
+        return self._hippocampus.memory_graph.token_index.get_stats()
+
 
 # 创建全局实例
 hippocampus_manager = HippocampusManager()
@@ -0,0 +1,155 @@
+import numpy as np
+import networkx as nx
+from scipy import sparse
+
+from src.common.logger import get_logger
+
+logger = get_logger("memory")
+
+
+class MemoryGraphSnapshot:
+    """记忆图的CSR快照
+
+    将 networkx 图压缩为整数节点ID + CSR邻接矩阵，边权为 1/strength，
+    供扩散激活内核直接在 NumPy 数组上运算，避免逐邻居的 Python 迭代。
+    快照本身不可变，记忆图变化后通过 `build` 重新生成并整体替换。
+    """
+
+    def __init__(self, node_names: list[str], adjacency: sparse.csr_matrix):
+        self.node_names = node_names
+        """节点ID -> 节点名称"""
+
+        self.node_ids = {name: i for i, name in enumerate(node_names)}
+        """节点名称 -> 节点ID"""
+
+        self.indptr = adjacency.indptr
+        self.indices = adjacency.indices
+        self.weights = adjacency.data
+        """边权（激活值衰减量），即 1/strength"""
+
+    @classmethod
+    def build(cls, graph: nx.Graph) -> "MemoryGraphSnapshot":
+        """从 networkx 图构建快照"""
+        node_names = list(graph.nodes())
+        node_ids = {name: i for i, name in enumerate(node_names)}
+        n = len(node_names)
+
+        edges = list(graph.edges(data="strength", default=1))
+        if edges:
+            sources = np.fromiter((node_ids[u] for u, _, _ in edges), dtype=np.int32, count=len(edges))
+            targets = np.fromiter((node_ids[v] for _, v, _ in edges), dtype=np.int32, count=len(edges))
+            strengths = np.fromiter((s for _, _, s in edges), dtype=np.float64, count=len(edges))
+            # 强度不为正的边不会传递激活
+            valid = strengths > 0
+            sources, targets, strengths = sources[valid], targets[valid], strengths[valid]
+            weights = 1.0 / strengths
+        else:
+            sources = targets = np.empty(0, dtype=np.int32)
+            weights = np.empty(0, dtype=np.float64)
+
+        # 无向图：两个方向各存一份
+        adjacency = sparse.csr_matrix(
+            (
+                np.concatenate([weights, weights]),
+                (np.concatenate([sources, targets]), np.concatenate([targets, sources])),
+            ),
+            shape=(n, n),
+        )
+        adjacency.sum_duplicates()
+        return cls(node_names, adjacency)
+
+    def __contains__(self, concept: str) -> bool:
+        return concept in self.node_ids
+
+    def __len__(self) -> int:
+        return len(self.node_names)
+
+    def spread(self, seeds: list[str], max_depth: int) -> np.ndarray:
+        """以多个关键词为起点，一次性批量进行扩散激活
+
+        每个起点独立扩散：起点激活值为1.0，每经过一条边激活值减少 1/strength，
+        节点只在首次被正激活值触达时记录（同一层有多个来源时取最大值），最多扩散 max_depth 层。
+
+        Args:
+            seeds: 起点节点名称列表，必须都在快照中
+            max_depth: 最大扩散深度
+
+        Returns:
+            np.ndarray: 形状为 (len(seeds), 节点数) 的激活值矩阵，未被激活的节点为0
+        """
+        k, n = len(seeds), len(self.node_names)
+        activation = np.zeros((k, n), dtype=np.float64)
+        visited = np.zeros((k, n), dtype=bool)
+        if k == 0 or n == 0:
+            return activation
+
+        rows = np.arange(k)
+        nodes = np.fromiter((self.node_ids[seed] for seed in seeds), dtype=np.int64, count=k)
+        activation[rows, nodes] = 1.0
+        visited[rows, nodes] = True
+
+        for _ in range(max_depth):
+            starts = self.indptr[nodes]
+            counts = self.indptr[nodes + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                break
+
+            # 展开当前层所有 (起点行, 邻居) 对
+            edge_rows = np.repeat(rows, counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            edge_idx = np.repeat(starts, counts) + offsets
+            neighbors = self.indices[edge_idx]
+            new_activation = np.repeat(activation[rows, nodes], counts) - self.weights[edge_idx]
+
+            mask = (new_activation > 0) & ~visited[edge_rows, neighbors]
+            if not mask.any():
+                break
+            keys = edge_rows[mask].astype(np.int64) * n + neighbors[mask]
+            values = new_activation[mask]
+
+            # 同一 (行, 节点) 有多个来源时保留最大激活值
+            order = np.lexsort((-values, keys))
+            keys, values = keys[order], values[order]
+            keys, first = np.unique(keys, return_index=True)
+            values = values[first]
+
+            activation.flat[keys] = values
+            visited.flat[keys] = True
+            rows, nodes = np.divmod(keys, n)
+
+        return activation
+
+
+class SpreadingActivationEngine:
+    """扩散激活引擎，持有记忆图的最新快照"""
+
+    def __init__(self):
+        self.snapshot = MemoryGraphSnapshot([], sparse.csr_matrix((0, 0)))
+
+    def refresh(self, graph: nx.Graph):
+        """根据当前记忆图重建快照"""
+        self.snapshot = MemoryGraphSnapshot.build(graph)
+        logger.debug(f"记忆图快照已更新: {len(self.snapshot)} 个节点, {len(self.snapshot.indices) // 2} 条连接")
+
+    def activate(self, keywords: list[str], max_depth: int) -> dict[str, float]:
+        """对所有关键词进行扩散激活并累加各节点的激活值
+
+        Returns:
+            dict[str, float]: 节点名称 -> 累计激活值，只包含被激活的节点
+        """
+        snapshot = self.snapshot
+        seeds = [keyword for keyword in keywords if keyword in snapshot]
+
+        activate_map: dict[str, float] = {}
+        if seeds:
+            totals = snapshot.spread(seeds, max_depth).sum(axis=0)
+            for node_id in np.flatnonzero(totals > 0):
+                activate_map[snapshot.node_names[node_id]] = float(totals[node_id])
+
+        # 快照更新前新加入的节点，至少激活其自身
+        for keyword in keywords:
+            if keyword not in snapshot:
+                activate_map[keyword] = activate_map.get(keyword, 0.0) + 1.0
+
+        return activate_map
@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+
+import faiss
+import networkx as nx
+import numpy as np
+
+from src.common.logger import get_logger
+from src.config.config import global_config
+from src.llm_models.utils_model import LLMRequest
+
+logger = get_logger("memory")
+
+ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+MEMORY_EMBEDDING_DIR = os.path.join(ROOT_PATH, "data", "embedding")  # 与LPMM嵌入库放在同一目录
+NODE_INDEX_FILE = os.path.join(MEMORY_EMBEDDING_DIR, "memory_nodes.index")
+ITEM_INDEX_FILE = os.path.join(MEMORY_EMBEDDING_DIR, "memory_items.index")
+ID_MAP_FILE = os.path.join(MEMORY_EMBEDDING_DIR, "memory_id_map.json")
+
+EMBEDDING_BATCH_SIZE = 32  # 单次嵌入请求的文本数量
+
+
+class MemoryEmbeddingIndex:
+    """记忆节点与记忆项的向量索引
+
+    为每个记忆节点（概念）和每条记忆项保存一个嵌入向量，存放在两个 FAISS 内积索引中（向量已L2归一化，
+    内积即余弦相似度）。检索时只需一次嵌入请求加一次 top-k 搜索，无需再让LLM提取关键词。
+    """
+
+    def __init__(self):
+        self.llm_model = LLMRequest(model=global_config.model.embedding, request_type="memory_embedding")
+        self.dimension: int | None = None
+
+        self.node_index = None
+        self.item_index = None
+
+        self.node_ids: dict[str, int] = {}
+        """节点概念 -> 向量ID"""
+
+        self.item_ids: dict[tuple[str, str], int] = {}
+        """(节点概念, 记忆项) -> 向量ID"""
+
+        self.id_to_node: dict[int, str] = {}
+        self.next_id = 0
+
+        self._sync_lock = asyncio.Lock()
+        """同步过程中会等待嵌入请求，同一时间只允许一次同步修改索引"""
+
+    def _reset(self, dimension: int):
+        """以指定维度创建空索引"""
+        self.dimension = dimension
+        self.node_index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self.item_index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self.node_ids.clear()
+        self.item_ids.clear()
+        self.id_to_node.clear()
+        self.next_id = 0
+
+    def load(self):
+        """从文件加载向量索引，文件不存在或损坏时保持为空，待下次同步时重建"""
+        if not (os.path.exists(NODE_INDEX_FILE) and os.path.exists(ITEM_INDEX_FILE) and os.path.exists(ID_MAP_FILE)):
+            logger.info("未找到记忆向量索引，将在下次记忆同步时构建")
+            return
+        try:
+            self.node_index = faiss.read_index(NODE_INDEX_FILE)
+            self.item_index = faiss.read_index(ITEM_INDEX_FILE)
+            with open(ID_MAP_FILE, "r", encoding="utf-8") as f:
+                id_map = json.load(f)
+            self.dimension = self.node_index.d
+            self.next_id = id_map["next_id"]
+            self.node_ids = {concept: vector_id for concept, vector_id in id_map["nodes"]}
+            self.item_ids = {(concept, item): vector_id for concept, item, vector_id in id_map["items"]}
+            self.id_to_node = {vector_id: concept for concept, vector_id in self.node_ids.items()}
+            logger.info(f"记忆向量索引加载成功: {len(self.node_ids)} 个节点, {len(self.item_ids)} 条记忆")
+        except Exception as e:
+            logger.error(f"加载记忆向量索引失败，将在下次记忆同步时重建: {e}")
+            self.node_index = self.item_index = None
+            self.dimension = None
+            self.node_ids.clear()
+            self.item_ids.clear()
+            self.id_to_node.clear()
+            self.next_id = 0
+
+    def save(self):
+        """保存向量索引到文件
+
+        耗时随索引大小增长，同步过程中通过 asyncio.to_thread 在线程中调用，调用方需持有同步锁
+        """
+        if self.node_index is None:
+            return
+        os.makedirs(MEMORY_EMBEDDING_DIR, exist_ok=True)
+        faiss.write_index(self.node_index, NODE_INDEX_FILE)
+        faiss.write_index(self.item_index, ITEM_INDEX_FILE)
+        id_map = {
+            "next_id": self.next_id,
+            "nodes": [[concept, vector_id] for concept, vector_id in self.node_ids.items()],
+            "items": [[concept, item, vector_id] for (concept, item), vector_id in self.item_ids.items()],
+        }
+        with open(ID_MAP_FILE, "w", encoding="utf-8") as f:
+            json.dump(id_map, f, ensure_ascii=False)
+
+    @staticmethod
+    def _normalize(vectors: list[list[float]]) -> np.ndarray:
+        array = np.array(vectors, dtype=np.float32)
+        faiss.normalize_L2(array)
+        return array
+
+    async def _embed(self, texts: list[str]) -> np.ndarray | None:
+        """分批获取文本的归一化嵌入向量"""
+        vectors = []
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            batch = await self.llm_model.get_embeddings(texts[i : i + EMBEDDING_BATCH_SIZE])
+            if not batch or any(vector is None for vector in batch):
+                return None
+            vectors.extend(batch)
+        return self._normalize(vectors)
+
+    async def embed_query(self, text: str) -> np.ndarray | None:
+        """获取查询文本的归一化嵌入向量"""
+        try:
+            vectors = await self._embed([text])
+        except Exception as e:
+            logger.error(f"获取记忆查询向量失败: {e}")
+            return None
+        if vectors is None or (self.dimension is not None and vectors.shape[1] != self.dimension):
+            return None
+        return vectors[0]
+
+    def _allocate_ids(self, count: int) -> np.ndarray:
+        ids = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+        self.next_id += count
+        return ids
+
+    async def sync(self, graph: nx.Graph):
+        """让向量索引与记忆图保持一致：删除已不存在的节点/记忆项，批量嵌入新增的节点/记忆项"""
+        async with self._sync_lock:
+            await self._sync(graph)
+
+    async def _sync(self, graph: nx.Graph):
+        """同步的实际过程，调用方需持有同步锁"""
+        current_nodes = set()
+        current_items = set()
+        for concept, data in graph.nodes(data=True):
+            memory_items = data.get("memory_items", [])
+            if not isinstance(memory_items, list):
+                memory_items = [memory_items] if memory_items else []
+            current_nodes.add(concept)
+            current_items.update((concept, str(item)) for item in memory_items)
+
+        # 删除
+        removed_nodes = [concept for concept in self.node_ids if concept not in current_nodes]
+        removed_items = [key for key in self.item_ids if key not in current_items]
+        if removed_nodes:
+            ids = np.array([self.node_ids.pop(concept) for concept in removed_nodes], dtype=np.int64)
+            for vector_id in ids:
+                self.id_to_node.pop(int(vector_id), None)
+            self.node_index.remove_ids(ids)
+        if removed_items:
+            ids = np.array([self.item_ids.pop(key) for key in removed_items], dtype=np.int64)
+            self.item_index.remove_ids(ids)
+
+        # 新增
+        new_nodes = [concept for concept in current_nodes if concept not in self.node_ids]
+        new_items = [key for key in current_items if key not in self.item_ids]
+        if not new_nodes and not new_items:
+            if removed_nodes or removed_items:
+                await asyncio.to_thread(self.save)
+            return
+
+        try:
+            vectors = await self._embed(new_nodes + [item for _, item in new_items])
+        except Exception as e:
+            logger.error(f"记忆向量化失败，将在下次同步时重试: {e}")
+            vectors = None
+        if vectors is None:
+            if removed_nodes or removed_items:
+                await asyncio.to_thread(self.save)
+            return
+
+        if self.dimension != vectors.shape[1]:
+            if self.dimension is not None:
+                logger.warning(f"嵌入模型维度变化 ({self.dimension} -> {vectors.shape[1]})，重建记忆向量索引")
+                self._reset(vectors.shape[1])
+                await self._sync(graph)
+                return
+            self._reset(vectors.shape[1])
+
+        node_vectors, item_vectors = vectors[: len(new_nodes)], vectors[len(new_nodes) :]
+        if new_nodes:
+            ids = self._allocate_ids(len(new_nodes))
+            self.node_index.add_with_ids(node_vectors, ids)
+            for concept, vector_id in zip(new_nodes, ids, strict=True):
+                self.node_ids[concept] = int(vector_id)
+                self.id_to_node[int(vector_id)] = concept
+        if new_items:
+            ids = self._allocate_ids(len(new_items))
+            self.item_index.add_with_ids(item_vectors, ids)
+            for key, vector_id in zip(new_items, ids, strict=True):
+                self.item_ids[key] = int(vector_id)
+
+        await asyncio.to_thread(self.save)
+        logger.info(
+            f"记忆向量索引已更新: 新增 {len(new_nodes)} 个节点和 {len(new_items)} 条记忆，"
+            f"移除 {len(removed_nodes)} 个节点和 {len(removed_items)} 条记忆"
+        )
+
+    def search_nodes(self, query_vector: np.ndarray, top_k: int, threshold: float) -> list[tuple[str, float]]:
+        """近邻搜索与查询最相似的记忆节点
+
+        Returns:
+            list[tuple[str, float]]: (节点, 余弦相似度) 列表，按相似度降序排列
+        """
+        if self.node_index is None or self.node_index.ntotal == 0:
+            return []
+        similarities, ids = self.node_index.search(query_vector.reshape(1, -1), min(top_k, self.node_index.ntotal))
+        return [
+            (self.id_to_node[int(vector_id)], float(similarity))
+            for vector_id, similarity in zip(ids[0], similarities[0], strict=True)
+            if vector_id != -1 and similarity >= threshold and int(vector_id) in self.id_to_node
+        ]
+
+    def item_similarity(self, query_vector: np.ndarray, concept: str, item: str) -> float | None:
+        """计算查询与某条记忆项的余弦相似度，该记忆项尚未向量化时返回None"""
+        vector_id = self.item_ids.get((concept, item))
+        if vector_id is None:
+            return None
+        return float(np.dot(self.item_index.reconstruct(vector_id), query_vector))
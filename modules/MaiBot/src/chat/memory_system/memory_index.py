@@ -0,0 +1,129 @@
+import math
+from typing import Iterable
+
+from src.chat.utils.segmentation import segmenter
+from src.common.logger import get_logger
+
+logger = get_logger("memory")
+
+
+class TopicTokenIndex:
+    """记忆节点的倒排分词索引
+
+    维护 词 -> 节点集合 的倒排表，并缓存每个节点的分词集合与向量模长，
+    使相似主题查找只需要在至少共享一个词的节点中进行，而不必遍历整张记忆图并重复分词。
+    """
+
+    def __init__(self):
+        self.token_to_nodes: dict[str, set[str]] = {}
+        """倒排表：词 -> 包含该词的节点集合"""
+
+        self.node_tokens: dict[str, frozenset[str]] = {}
+        """节点 -> 节点名称的分词集合"""
+
+        self.node_norms: dict[str, float] = {}
+        """节点 -> 二值词向量的模长"""
+
+        self.hits = 0
+        """分词缓存命中次数"""
+
+        self.misses = 0
+        """分词缓存未命中次数（交由全局分词缓存处理）"""
+
+    def __contains__(self, concept: str) -> bool:
+        return concept in self.node_tokens
+
+    def __len__(self) -> int:
+        return len(self.node_tokens)
+
+    def clear(self):
+        """清空索引（计数器保留）"""
+        self.token_to_nodes.clear()
+        self.node_tokens.clear()
+        self.node_norms.clear()
+
+    def tokens_of(self, text: str) -> frozenset[str]:
+        """获取文本的分词集合，已索引的节点直接复用缓存"""
+        tokens = self.node_tokens.get(text)
+        if tokens is not None:
+            self.hits += 1
+            return tokens
+        self.misses += 1
+        return segmenter.cut_set(text)
+
+    def add_node(self, concept: str, tokens: Iterable[str] | None = None):
+        """将节点加入索引，已存在则忽略
+
+        Args:
+            concept: 节点名称
+            tokens: 预先计算好的分词结果（例如从数据库恢复），为None时现场分词
+        """
+        if concept in self.node_tokens:
+            return
+        if tokens is not None:
+            tokens = tuple(tokens)
+            segmenter.warm(concept, tokens)
+            token_set = frozenset(tokens)
+        else:
+            token_set = self.tokens_of(concept)
+        self.node_tokens[concept] = token_set
+        self.node_norms[concept] = math.sqrt(len(token_set))
+        for token in token_set:
+            self.token_to_nodes.setdefault(token, set()).add(concept)
+
+    def remove_node(self, concept: str):
+        """将节点从索引中移除"""
+        token_set = self.node_tokens.pop(concept, None)
+        self.node_norms.pop(concept, None)
+        if token_set is None:
+            return
+        for token in token_set:
+            nodes = self.token_to_nodes.get(token)
+            if nodes is None:
+                continue
+            nodes.discard(concept)
+            if not nodes:
+                del self.token_to_nodes[token]
+
+    def search(self, text: str, threshold: float) -> list[tuple[str, float]]:
+        """查找与文本相似的节点
+
+        候选节点仅限与文本共享至少一个词的节点，相似度为二值词向量的余弦相似度，
+        与逐节点 `cosine_similarity` 的计算结果一致。
+
+        Returns:
+            list[tuple[str, float]]: (节点, 相似度) 列表，按相似度降序排列
+        """
+        query_tokens = self.tokens_of(text)
+        if not query_tokens:
+            return []
+        query_norm = math.sqrt(len(query_tokens))
+
+        # 统计每个候选节点与查询共享的词数（即稀疏点积）
+        overlaps: dict[str, int] = {}
+        for token in query_tokens:
+            for node in self.token_to_nodes.get(token, ()):
+                overlaps[node] = overlaps.get(node, 0) + 1
+
+        results = []
+        for node, overlap in overlaps.items():
+            norm = self.node_norms[node]
+            if norm == 0:
+                continue
+            similarity = overlap / (query_norm * norm)
+            if similarity >= threshold:
+                results.append((node, similarity))
+
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results
+
+    def get_stats(self) -> dict[str, int | float]:
+        """获取索引统计信息"""
+        total = self.hits + self.misses
+        return {
+            "nodes": len(self.node_tokens),
+            "tokens": len(self.token_to_nodes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
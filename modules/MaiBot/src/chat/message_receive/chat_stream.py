@@ -7,6 +7,8 @@ from typing import Dict, Optional, TYPE_CHECKING
 
 from ...common.database.database import db
 from ...common.database.database_model import ChatStreams  # 新增导入
+from ...common.message_cache import MAX_CACHED_CHATS
+from ...common.message_repository import preload_recent_messages
 from maim_message import GroupInfo, UserInfo
 
 # 避免循环导入，使用TYPE_CHECKING进行类型提示
@@ -21,6 +23,8 @@ install(extra_lines=3)
 
 logger = get_logger("chat_stream")
 
+PRELOAD_ACTIVE_WINDOW = 24 * 3600  # 启动时预先缓存最近消息的聊天：在这段时间内活跃过（秒）
+
 
 class ChatMessageContext:
     """聊天消息上下文，存储消息的上下文信息"""
@@ -395,6 +399,19 @@ class ChatManager:
                     stream.set_context(self.last_messages[stream.stream_id])
         except Exception as e:
             logger.error(f"从数据库加载所有聊天流失败 (Peewee): {e}", exc_info=True)
+            return
+
+        # 预先缓存最近活跃的聊天的消息，之后构建回复上下文时不必再查询数据库
+        try:
+            active_streams = sorted(
+                (s for s in self.streams.values() if s.last_active_time > time.time() - PRELOAD_ACTIVE_WINDOW),
+                key=lambda s: s.last_active_time,
+                reverse=True,
+            )[:MAX_CACHED_CHATS]
+            preload_recent_messages([stream.stream_id for stream in active_streams])
+            logger.info(f"已缓存 {len(active_streams)} 个最近活跃聊天的消息")
+        except Exception as e:
+            logger.error(f"预先缓存聊天消息失败: {e}", exc_info=True)
 
 
 chat_manager = None
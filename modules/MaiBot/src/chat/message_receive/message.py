@@ -10,6 +10,8 @@ from src.common.logger import get_logger
 if TYPE_CHECKING:
     from .chat_stream import ChatStream
 from ..utils.utils_image import get_image_manager
+from ..utils.vlm_queue import DescriptionPriority
+from src.config.config import global_config
 from maim_message import Seg, UserInfo, BaseMessageInfo, MessageBase
 from rich.traceback import install
 
@@ -20,6 +22,15 @@ logger = get_logger("chat_message")
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+
+def _is_positive(value: Any) -> bool:
+    """值可以转为大于0的数"""
+    try:
+        return float(value) > 0
+    except (TypeError, ValueError):
+        return False
+
+
 # 这个类是消息数据类，用于存储和管理消息数据。
 # 它定义了消息的属性，包括群组ID、用户ID、消息ID、原始消息内容、纯文本内容和时间戳。
 # 它还定义了两个辅助属性：keywords用于提取消息的关键词，is_plain_text用于判断消息是否为纯文本。
@@ -111,6 +122,7 @@ class MessageRecv(Message):
         self.is_mentioned = 0.0
         self.priority_mode = "interest"
         self.priority_info = None
+        self.description_priority = DescriptionPriority.NORMAL
 
     def update_chat_stream(self, chat_stream: "ChatStream"):
         self.chat_stream = chat_stream
@@ -120,9 +132,30 @@ class MessageRecv(Message):
 
         这个方法必须在创建实例后显式调用，因为它包含异步操作。
         """
+        self.description_priority = self._get_description_priority()
         self.processed_plain_text = await self._process_message_segments(self.message_segment)
         self.detailed_plain_text = self._generate_detailed_text()
 
+    def _get_description_priority(self) -> DescriptionPriority:
+        """私聊或提到麦麦的消息大概率会被回复，其中的图片优先识别"""
+        if self.message_info.group_info is None:
+            return DescriptionPriority.REPLY
+        additional_config = self.message_info.additional_config or {}
+        if _is_positive(additional_config.get("is_mentioned")):
+            return DescriptionPriority.REPLY
+
+        names = [global_config.bot.nickname, *global_config.bot.alias_names]
+        pending = [self.message_segment]
+        while pending:
+            segment = pending.pop()
+            if segment.type == "seglist":
+                pending.extend(segment.data)
+            elif segment.type == "mention_bot" and _is_positive(segment.data):
+                return DescriptionPriority.REPLY
+            elif segment.type == "text" and any(name and name in segment.data for name in names):
+                return DescriptionPriority.REPLY
+        return DescriptionPriority.NORMAL
+
     async def _process_single_segment(self, segment: Seg) -> str:
         """处理单个消息段
 
@@ -141,13 +174,13 @@ class MessageRecv(Message):
                     self.is_picid = True
                     image_manager = get_image_manager()
                     # print(f"segment.data: {segment.data}")
-                    _, processed_text = await image_manager.process_image(segment.data)
+                    _, processed_text = await image_manager.process_image(segment.data, self.description_priority)
                     return processed_text
                 return "[发了一张图片，网卡了加载不出来]"
             elif segment.type == "emoji":
                 self.is_emoji = True
                 if isinstance(segment.data, str):
-                    return await get_image_manager().get_emoji_description(segment.data)
+                    return await get_image_manager().get_emoji_description(segment.data, self.description_priority)
                 return "[发了一个表情包，网卡了加载不出来]"
             elif segment.type == "mention_bot":
                 self.is_mentioned = float(segment.data)
@@ -230,11 +263,12 @@ class MessageProcessBase(Message):
             elif seg.type == "image":
                 # 如果是base64图片数据
                 if isinstance(seg.data, str):
-                    return await get_image_manager().get_image_description(seg.data)
+                    # 麦麦自己发送的消息
+                    return await get_image_manager().get_image_description(seg.data, DescriptionPriority.REPLY)
                 return "[图片，网卡了加载不出来]"
             elif seg.type == "emoji":
                 if isinstance(seg.data, str):
-                    return await get_image_manager().get_emoji_description(seg.data)
+                    return await get_image_manager().get_emoji_description(seg.data, DescriptionPriority.REPLY)
                 return "[表情，网卡了加载不出来]"
             elif seg.type == "at":
                 return f"[@{seg.data}]"
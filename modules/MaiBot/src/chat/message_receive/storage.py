@@ -6,6 +6,8 @@ from .message import MessageSending, MessageRecv
 from .chat_stream import ChatStream
 from ...common.database.database_model import Messages, RecalledMessages  # Import Peewee models
 from src.common.logger import get_logger
+from src.common.message_buffer import message_write_buffer
+from src.common.message_cache import recent_message_cache
 
 logger = get_logger("message_storage")
 
@@ -13,7 +15,7 @@ logger = get_logger("message_storage")
 class MessageStorage:
     @staticmethod
     async def store_message(message: Union[MessageSending, MessageRecv], chat_stream: ChatStream) -> None:
-        """存储消息到数据库"""
+        """存储消息到数据库（先进入写入缓冲，由后台任务批量写入）"""
         try:
             # 莫越权 救世啊
             pattern = r"<MainRule>.*?</MainRule>|<schedule>.*?</schedule>|<UserMessage>.*?</UserMessage>"
@@ -53,7 +55,7 @@ class MessageStorage:
             # 安全地获取 user_info, 如果为 None 则视为空字典 (以防万一)
             user_info_from_chat = chat_info_dict.get("user_info") or {}
 
-            Messages.create(
+            row = message_write_buffer.add(
                 message_id=msg_id,
                 time=float(message.message_info.time),
                 chat_id=chat_stream.stream_id,
@@ -80,6 +82,7 @@ class MessageStorage:
                 display_message=filtered_display_message,
                 memorized_times=message.memorized_times,
             )
+            recent_message_cache.add(row)
         except Exception:
             logger.exception("存储消息失败")
 
@@ -122,6 +125,14 @@ class MessageStorage:
             if not qq_message_id:
                 logger.info("消息不存在message_id，无法更新")
                 return
+            recent_message_cache.update(mmc_message_id, message_id=str(qq_message_id))
+            # 消息可能还在写入缓冲中，直接修改缓冲中的记录
+            pending_message = message_write_buffer.find_latest(mmc_message_id)
+            if pending_message is not None:
+                pending_message["message_id"] = str(qq_message_id)
+                logger.info(f"更新消息ID成功: {mmc_message_id} -> {qq_message_id}")
+                return
+
             # 查询最新一条匹配消息
             matched_message = (
                 Messages.select().where((Messages.message_id == mmc_message_id)).order_by(Messages.time.desc()).first()
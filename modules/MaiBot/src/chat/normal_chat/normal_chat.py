@@ -23,6 +23,7 @@ from src.chat.utils.chat_message_builder import (
     get_raw_msg_by_timestamp_with_chat_inclusive,
     get_raw_msg_before_timestamp_with_chat,
     num_new_messages_since,
+    num_messages_by_timestamp_with_chat_inclusive,
 )
 from .priority_manager import PriorityManager
 import traceback
@@ -282,8 +283,7 @@ class NormalChat:
 
     def _count_messages_in_timerange(self, start_time: float, end_time: float) -> int:
         """计算指定时间范围内的消息数量（包含边界）"""
-        messages = get_raw_msg_by_timestamp_with_chat_inclusive(self.stream_id, start_time, end_time)
-        return len(messages)
+        return num_messages_by_timestamp_with_chat_inclusive(self.stream_id, start_time, end_time)
 
     def _count_messages_between(self, start_time: float, end_time: float) -> int:
         """计算两个时间点之间的消息数量（不包含边界），用于间隔检查"""
@@ -530,51 +530,59 @@ class NormalChat:
         await message_manager.add_message(thinking_message)
         return thinking_id
 
-    # 改为实例方法
-    async def _add_messages_to_manager(
-        self, message: MessageRecv, response_set: List[str], thinking_id
-    ) -> Optional[MessageSending]:
-        """发送回复消息"""
+    async def _take_thinking_message(self, thinking_id: str) -> Optional[MessageThinking]:
+        """从发送队列中取出思考消息，未找到（可能已超时被移除）时返回None"""
         container = await message_manager.get_container(self.stream_id)  # 使用 self.stream_id
-        thinking_message = None
-
         for msg in container.messages[:]:
             if isinstance(msg, MessageThinking) and msg.message_info.message_id == thinking_id:
-                thinking_message = msg
                 container.messages.remove(msg)
-                break
+                return msg
+
+        logger.warning(f"[{self.stream_name}] 未找到对应的思考消息 {thinking_id}，可能已超时被移除")
+        return None
+
+    def _build_bot_message(
+        self, message: MessageRecv, text: str, thinking_id: str, thinking_start_time: float, is_head: bool
+    ) -> MessageSending:
+        """构建一条回复消息"""
+        if global_config.experimental.debug_show_chat_mode:
+            text += "ⁿ"
+        message_segment = Seg(type="text", data=text)
+        return MessageSending(
+            message_id=thinking_id,
+            chat_stream=self.chat_stream,  # 使用 self.chat_stream
+            bot_user_info=UserInfo(
+                user_id=global_config.bot.qq_account,
+                user_nickname=global_config.bot.nickname,
+                platform=message.message_info.platform,
+            ),
+            sender_info=message.message_info.user_info,
+            message_segment=message_segment,
+            reply=message,
+            is_head=is_head,
+            is_emoji=False,
+            thinking_start_time=thinking_start_time,
+            apply_set_reply_logic=True,
+        )
 
+    # 改为实例方法
+    async def _add_messages_to_manager(
+        self, message: MessageRecv, response_set: List[str], thinking_id
+    ) -> Optional[MessageSending]:
+        """发送回复消息"""
+        thinking_message = await self._take_thinking_message(thinking_id)
         if not thinking_message:
-            logger.warning(f"[{self.stream_name}] 未找到对应的思考消息 {thinking_id}，可能已超时被移除")
             return None
 
         thinking_start_time = thinking_message.thinking_start_time
         message_set = MessageSet(self.chat_stream, thinking_id)  # 使用 self.chat_stream
 
-        mark_head = False
         first_bot_msg = None
         for msg in response_set:
-            if global_config.experimental.debug_show_chat_mode:
-                msg += "ⁿ"
-            message_segment = Seg(type="text", data=msg)
-            bot_message = MessageSending(
-                message_id=thinking_id,
-                chat_stream=self.chat_stream,  # 使用 self.chat_stream
-                bot_user_info=UserInfo(
-                    user_id=global_config.bot.qq_account,
-                    user_nickname=global_config.bot.nickname,
-                    platform=message.message_info.platform,
-                ),
-                sender_info=message.message_info.user_info,
-                message_segment=message_segment,
-                reply=message,
-                is_head=not mark_head,
-                is_emoji=False,
-                thinking_start_time=thinking_start_time,
-                apply_set_reply_logic=True,
+            bot_message = self._build_bot_message(
+                message, msg, thinking_id, thinking_start_time, is_head=first_bot_msg is None
             )
-            if not mark_head:
-                mark_head = True
+            if first_bot_msg is None:
                 first_bot_msg = bot_message
             message_set.add_message(bot_message)
 
@@ -840,6 +848,41 @@ class NormalChat:
                 logger.error(f"[{self.stream_name}] 回复生成出现错误：{str(e)} {traceback.format_exc()}")
                 return None
 
+        async def stream_normal_response():
+            """流式生成回复，每生成一句就加入发送队列，返回已发送的句子"""
+            response_set = []
+            thinking_start_time = None
+            try:
+                async for sentence in self.gpt.generate_response_stream(
+                    message=message,
+                    available_actions=available_actions,
+                ):
+                    if not response_set:
+                        # 发送第一句前等待规划器的决策，选择了其他（非并行）动作时不再回复
+                        if self.enable_planner:
+                            await asyncio.wait([plan_task])
+                            if self.action_type not in ["no_action"] and not self.is_parallel_action:
+                                return None
+                        if self._disabled:
+                            return None
+                        thinking_message = await self._take_thinking_message(thinking_id)
+                        if not thinking_message:
+                            return None
+                        thinking_start_time = thinking_message.thinking_start_time
+                        # 已开始发送回复，之后的生成不再受思考超时限制
+                        first_segment_sent.set()
+                    elif self._disabled:
+                        break
+
+                    bot_message = self._build_bot_message(
+                        message, sentence, thinking_id, thinking_start_time, is_head=not response_set
+                    )
+                    await message_manager.add_message(bot_message)
+                    response_set.append(sentence)
+            except Exception as e:
+                logger.error(f"[{self.stream_name}] 流式回复生成出现错误：{str(e)} {traceback.format_exc()}")
+            return response_set or None
+
         async def plan_and_execute_actions():
             """规划和执行额外动作"""
             if not self.enable_planner:
@@ -904,19 +947,39 @@ class NormalChat:
         self.action_type = None  # 初始化动作类型
         self.is_parallel_action = False  # 初始化并行动作标志
 
-        gen_task = asyncio.create_task(generate_normal_response())
+        streaming = global_config.response_splitter.enable_streaming_reply
+        first_segment_sent = asyncio.Event()
         plan_task = asyncio.create_task(plan_and_execute_actions())
+        gen_task = asyncio.create_task(stream_normal_response() if streaming else generate_normal_response())
 
         try:
             gather_timeout = global_config.normal_chat.thinking_timeout
-            results = await asyncio.wait_for(
-                asyncio.gather(gen_task, plan_task, return_exceptions=True),
-                timeout=gather_timeout,
-            )
+            if streaming:
+                # 流式回复只限制第一句发出前的时间，较长的回复不会在发送到一半时被取消
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + gather_timeout
+                first_segment_task = asyncio.create_task(first_segment_sent.wait())
+                try:
+                    await asyncio.wait_for(
+                        asyncio.wait([gen_task, first_segment_task], return_when=asyncio.FIRST_COMPLETED),
+                        timeout=gather_timeout,
+                    )
+                finally:
+                    first_segment_task.cancel()
+                # 动作规划仍受思考超时限制，规划器卡住时不会一直等待
+                if not plan_task.done():
+                    await asyncio.wait_for(asyncio.wait([plan_task]), timeout=max(deadline - loop.time(), 0))
+                results = await asyncio.gather(gen_task, plan_task, return_exceptions=True)
+            else:
+                results = await asyncio.wait_for(
+                    asyncio.gather(gen_task, plan_task, return_exceptions=True),
+                    timeout=gather_timeout,
+                )
             response_set, plan_result = results
         except asyncio.TimeoutError:
             logger.warning(
-                f"[{self.stream_name}] 并行执行回复生成和动作规划超时 ({gather_timeout}秒)，正在取消相关任务..."
+                f"[{self.stream_name}] 并行执行回复生成和动作规划超时 ({gather_timeout}秒)"
+                f"{'，回复的第一句仍未生成' if streaming else ''}，正在取消相关任务..."
             )
             self.timeout_count += 1
             if self.timeout_count > 5:
@@ -965,11 +1028,16 @@ class NormalChat:
             logger.info(f"[{self.stream_name}] 已停用，忽略 normal_response。")
             return False
 
-        # 发送回复 (不再需要传入 chat)
-        first_bot_msg = await self._add_messages_to_manager(message, response_set, thinking_id)
+        if streaming:
+            # 流式回复的各句已在生成时加入发送队列
+            replied = True
+        else:
+            # 发送回复 (不再需要传入 chat)
+            first_bot_msg = await self._add_messages_to_manager(message, response_set, thinking_id)
+            # 检查 first_bot_msg 是否为 None (例如思考消息已被移除的情况)
+            replied = first_bot_msg is not None
 
-        # 检查 first_bot_msg 是否为 None (例如思考消息已被移除的情况)
-        if first_bot_msg:
+        if replied:
             # 消息段已在接收消息时更新，这里不需要额外处理
 
             # 记录回复信息到最近回复列表中
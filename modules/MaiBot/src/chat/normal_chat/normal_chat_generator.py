@@ -1,3 +1,5 @@
+from typing import AsyncIterator, Tuple
+
 from src.llm_models.utils_model import LLMRequest
 from src.config.config import global_config
 from src.chat.message_receive.message import MessageThinking
@@ -26,6 +28,18 @@ class NormalChatGenerator:
         self.model_sum = LLMRequest(model=global_config.model.memory_summary, temperature=0.7, request_type="relation")
         self.memory_activator = MemoryActivator()
 
+    @staticmethod
+    async def _get_reply_target(message: MessageThinking) -> Tuple[str, str]:
+        """获取回复对象的关系信息与 reply_to 字符串"""
+        person_id = PersonInfoManager.get_person_id(
+            message.chat_stream.user_info.platform, message.chat_stream.user_info.user_id
+        )
+        person_info_manager = get_person_info_manager()
+        person_name = await person_info_manager.get_value(person_id, "person_name")
+        relation_info = await person_info_manager.get_value(person_id, "short_impression")
+        reply_to_str = f"{person_name}:{message.processed_plain_text}"
+        return relation_info, reply_to_str
+
     async def generate_response(
         self,
         message: MessageThinking,
@@ -34,13 +48,7 @@ class NormalChatGenerator:
         logger.info(
             f"NormalChat思考:{message.processed_plain_text[:30] + '...' if len(message.processed_plain_text) > 30 else message.processed_plain_text}"
         )
-        person_id = PersonInfoManager.get_person_id(
-            message.chat_stream.user_info.platform, message.chat_stream.user_info.user_id
-        )
-        person_info_manager = get_person_info_manager()
-        person_name = await person_info_manager.get_value(person_id, "person_name")
-        relation_info = await person_info_manager.get_value(person_id, "short_impression")
-        reply_to_str = f"{person_name}:{message.processed_plain_text}"
+        relation_info, reply_to_str = await self._get_reply_target(message)
 
         try:
             success, reply_set, prompt = await generator_api.generate_reply(
@@ -70,3 +78,29 @@ class NormalChatGenerator:
         except Exception:
             logger.exception("生成回复时出错")
             return None
+
+    async def generate_response_stream(
+        self,
+        message: MessageThinking,
+        available_actions=None,
+    ) -> AsyncIterator[str]:
+        """流式生成回复，每生成一句完整的话就产出一句（已经过分句与错别字处理）"""
+        logger.info(
+            f"NormalChat流式思考:{message.processed_plain_text[:30] + '...' if len(message.processed_plain_text) > 30 else message.processed_plain_text}"
+        )
+        relation_info, reply_to_str = await self._get_reply_target(message)
+
+        try:
+            async for reply_seg in generator_api.generate_reply_stream(
+                chat_stream=message.chat_stream,
+                reply_to=reply_to_str,
+                relation_info=relation_info,
+                available_actions=available_actions,
+                enable_tool=global_config.tool.enable_in_normal_chat,
+                model_configs=self.model_configs,
+                request_type="normal.replyer",
+            ):
+                if reply_seg[0] == "text":
+                    yield reply_seg[1]
+        except Exception:
+            logger.exception("流式生成回复时出错")
@@ -2,6 +2,7 @@ import json
 from typing import Dict, Any
 from rich.traceback import install
 from src.llm_models.utils_model import LLMRequest
+from src.llm_models.hedged_request import llm_request_hedger
 from src.config.config import global_config
 from src.common.logger import get_logger
 from src.chat.utils.prompt_builder import Prompt, global_prompt_manager
@@ -156,7 +157,9 @@ class NormalChatPlanner:
 
             # 使用LLM生成动作决策
             try:
-                content, (reasoning_content, model_name) = await self.planner_llm.generate_response_async(prompt)
+                (content, (reasoning_content, model_name)), _ = await llm_request_hedger.generate_response_async(
+                    self.planner_llm, prompt
+                )
 
                 logger.info(f"{self.log_prefix}规划器原始提示词: {prompt}")
                 logger.info(f"{self.log_prefix}规划器原始响应: {content}")
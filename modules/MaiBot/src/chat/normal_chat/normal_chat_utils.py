@@ -1,6 +1,6 @@
 import time
 from src.config.config import global_config
-from src.common.message_repository import count_messages
+from src.common.message_repository import count_messages_by_field
 
 
 def get_recent_message_stats(minutes: int = 30, chat_id: str = None) -> dict:
@@ -20,11 +20,9 @@ def get_recent_message_stats(minutes: int = 30, chat_id: str = None) -> dict:
     if chat_id is not None:
         filter_base["chat_id"] = chat_id
 
-    # 总消息数
-    total_message_count = count_messages(filter_base)
-    # bot自身回复数
-    bot_filter = filter_base.copy()
-    bot_filter["user_id"] = bot_id
-    bot_reply_count = count_messages(bot_filter)
+    # 按发送者分组计数，一次得到总消息数和bot自身回复数
+    count_by_user = count_messages_by_field(filter_base, "user_id")
+    total_message_count = sum(count_by_user.values())
+    bot_reply_count = count_by_user.get(str(bot_id), 0)
 
     return {"bot_reply_count": bot_reply_count, "total_message_count": total_message_count}
@@ -1,12 +1,13 @@
 import traceback
-from typing import List, Optional, Dict, Any, Tuple
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
 
 from src.chat.message_receive.message import MessageRecv, MessageThinking, MessageSending
 from src.chat.message_receive.message import Seg  # Local import needed after move
 from src.chat.message_receive.message import UserInfo
 from src.chat.message_receive.chat_stream import get_chat_manager
 from src.common.logger import get_logger
-from src.llm_models.utils_model import LLMRequest
+from src.llm_models.utils_model import LLMRequest, PROMPT_CACHE_BREAKPOINT
+from src.llm_models.hedged_request import llm_request_hedger
 from src.config.config import global_config
 from src.chat.utils.timer_calculator import Timer  # <--- Import Timer
 from src.chat.focus_chat.heartFC_sender import HeartFCSender
@@ -39,8 +40,19 @@ def init_prompt():
     Prompt("和{sender_name}聊天", "chat_target_private2")
     Prompt("\n你有以下这些**知识**：\n{prompt_info}\n请你**记住上面的知识**，之后可能会用到。\n", "knowledge_prompt")
 
+    # 身份、动作说明与规则等静态内容在前，作为多次请求间不变的前缀，便于服务商的前缀缓存命中；每轮变化的内容在后
     Prompt(
         """
+{identity}
+你正在{chat_target_2}。
+{action_descriptions}请回复的平淡一些，简短一些，说中文，不要刻意突出自身学科背景，注意不要复读你说过的话。
+{config_expression_style}。
+请注意不要输出多余内容(包括前后缀，冒号和引号，at或 @等 )。只输出回复内容。
+{moderation_prompt}
+不要浮夸，不要夸张修辞，不要输出多余内容(包括前后缀，冒号和引号，括号()，表情包，at或 @等 )。只输出回复内容
+"""
+        + PROMPT_CACHE_BREAKPOINT
+        + """
 {expression_habits_block}
 {tool_info_block}
 {knowledge_prompt}
@@ -52,16 +64,9 @@ def init_prompt():
 {time_block}
 {chat_info}
 {reply_target_block}
-{identity}
 
-{action_descriptions}
-你正在{chat_target_2},现在请你读读之前的聊天记录，{mood_prompt}，请你给出回复
-{config_expression_style}。
-请回复的平淡一些，简短一些，说中文，不要刻意突出自身学科背景，注意不要复读你说过的话。
-{keywords_reaction_prompt}
-请注意不要输出多余内容(包括前后缀，冒号和引号，at或 @等 )。只输出回复内容。
-{moderation_prompt}
-不要浮夸，不要夸张修辞，不要输出多余内容(包括前后缀，冒号和引号，括号()，表情包，at或 @等 )。只输出回复内容""",
+现在请你读读之前的聊天记录，{mood_prompt}，请你给出回复
+{keywords_reaction_prompt}""",
         "default_generator_prompt",
     )
 
@@ -166,6 +171,55 @@ class DefaultReplyer:
         await self.heart_fc_sender.register_thinking(thinking_message)
         return None
 
+    async def _build_reply_prompt(
+        self,
+        reply_data: Optional[Dict[str, Any]],
+        reply_to: str,
+        relation_info: str,
+        extra_info: str,
+        available_actions: Optional[List[str]],
+    ) -> str:
+        """整理回复数据并构建回复的Prompt"""
+        if available_actions is None:
+            available_actions = []
+        if not reply_data:
+            reply_data = {
+                "reply_to": reply_to,
+                "relation_info": relation_info,
+                "extra_info": extra_info,
+            }
+            for key, value in reply_data.items():
+                if not value:
+                    logger.info(f"{self.log_prefix} 回复数据跳过{key}，生成回复时将忽略。")
+
+        with Timer("构建Prompt", {}):  # 内部计时器，可选保留
+            return await self.build_prompt_reply_context(
+                reply_data=reply_data,  # 传递action_data
+                available_actions=available_actions,
+            )
+
+    def _create_express_model(self) -> LLMRequest:
+        """加权随机选择一个模型配置并创建请求对象"""
+        selected_model_config = self._select_weighted_model_config()
+        logger.info(
+            f"{self.log_prefix} 使用模型配置: {selected_model_config.get('name', 'N/A')} (权重: {selected_model_config.get('weight', 1.0)})"
+        )
+        return LLMRequest(
+            model=selected_model_config,
+            request_type=self.request_type,
+        )
+
+    def _create_backup_model(self, primary: LLMRequest) -> Optional[LLMRequest]:
+        """启用请求对冲时，从其余的回复模型中选择备用模型，没有其余模型时返回None（使用配置的备用模型）"""
+        if not llm_request_hedger.is_enabled_for(self.request_type):
+            return None
+        configs = [config for config in self.express_model_configs if config.get("name") != primary.model_name]
+        if not configs:
+            return None
+        weights = [config.get("weight", 1.0) for config in configs]
+        selected_config = random.choices(population=configs, weights=weights, k=1)[0]
+        return LLMRequest(model=selected_config, request_type=self.request_type)
+
     async def generate_reply_with_context(
         self,
         reply_data: Dict[str, Any] = None,
@@ -178,27 +232,9 @@ class DefaultReplyer:
         回复器 (Replier): 核心逻辑，负责生成回复文本。
         (已整合原 HeartFCGenerator 的功能)
         """
-        if available_actions is None:
-            available_actions = []
-        if reply_data is None:
-            reply_data = {}
         try:
-            if not reply_data:
-                reply_data = {
-                    "reply_to": reply_to,
-                    "relation_info": relation_info,
-                    "extra_info": extra_info,
-                }
-                for key, value in reply_data.items():
-                    if not value:
-                        logger.info(f"{self.log_prefix} 回复数据跳过{key}，生成回复时将忽略。")
-
             # 3. 构建 Prompt
-            with Timer("构建Prompt", {}):  # 内部计时器，可选保留
-                prompt = await self.build_prompt_reply_context(
-                    reply_data=reply_data,  # 传递action_data
-                    available_actions=available_actions,
-                )
+            prompt = await self._build_reply_prompt(reply_data, reply_to, relation_info, extra_info, available_actions)
 
             # 4. 调用 LLM 生成回复
             content = None
@@ -207,19 +243,12 @@ class DefaultReplyer:
 
             try:
                 with Timer("LLM生成", {}):  # 内部计时器，可选保留
-                    # 加权随机选择一个模型配置
-                    selected_model_config = self._select_weighted_model_config()
-                    logger.info(
-                        f"{self.log_prefix} 使用模型配置: {selected_model_config.get('name', 'N/A')} (权重: {selected_model_config.get('weight', 1.0)})"
-                    )
-
-                    express_model = LLMRequest(
-                        model=selected_model_config,
-                        request_type=self.request_type,
-                    )
+                    express_model = self._create_express_model()
 
                     logger.info(f"{self.log_prefix}Prompt:\n{prompt}\n")
-                    content, (reasoning_content, model_name) = await express_model.generate_response_async(prompt)
+                    (content, (reasoning_content, model_name)), _ = await llm_request_hedger.generate_response_async(
+                        express_model, prompt, backup=self._create_backup_model(express_model)
+                    )
 
                     logger.info(f"最终回复: {content}")
 
@@ -235,6 +264,32 @@ class DefaultReplyer:
             traceback.print_exc()
             return False, None
 
+    async def generate_reply_stream_with_context(
+        self,
+        reply_data: Dict[str, Any] = None,
+        reply_to: str = "",
+        relation_info: str = "",
+        extra_info: str = "",
+        available_actions: List[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        流式回复器：与 generate_reply_with_context 使用相同的Prompt，逐段产出模型输出的文本增量（未经后处理）。
+        生成失败时记录错误并结束迭代。
+        """
+        try:
+            prompt = await self._build_reply_prompt(reply_data, reply_to, relation_info, extra_info, available_actions)
+            express_model = self._create_express_model()
+            logger.info(f"{self.log_prefix}Prompt:\n{prompt}\n")
+
+            content = ""
+            async for delta in express_model.generate_response_stream(prompt):
+                content += delta
+                yield delta
+            logger.info(f"最终回复: {content}")
+
+        except Exception as e:
+            logger.error(f"{self.log_prefix}流式回复生成失败: {e}")
+
     async def rewrite_reply_with_context(
         self,
         reply_data: Dict[str, Any],
@@ -278,7 +333,9 @@ class DefaultReplyer:
                         request_type=self.request_type,
                     )
 
-                    content, (reasoning_content, model_name) = await express_model.generate_response_async(prompt)
+                    (content, (reasoning_content, model_name)), _ = await llm_request_hedger.generate_response_async(
+                        express_model, prompt, backup=self._create_backup_model(express_model)
+                    )
 
                     logger.info(f"想要表达：{raw_reply}||理由：{reason}||生成回复: {content}\n")
 
@@ -525,12 +582,13 @@ class DefaultReplyer:
             show_actions=True,
         )
 
-        # 并行执行四个构建任务
-        expression_habits_block, relation_info, memory_block, tool_info = await asyncio.gather(
+        # 并行执行五个构建任务
+        expression_habits_block, relation_info, memory_block, tool_info, prompt_info = await asyncio.gather(
             self.build_expression_habits(chat_talking_prompt_half, target),
             self.build_relation_info(reply_data, chat_talking_prompt_half),
             self.build_memory_block(chat_talking_prompt_half, target),
             self.build_tool_info(reply_data, chat_talking_prompt_half),
+            get_prompt_info(target, threshold=0.38),
         )
 
         keywords_reaction_prompt = await self.build_keywords_reaction_prompt(target)
@@ -601,7 +659,6 @@ class DefaultReplyer:
 
         mood_prompt = mood_manager.get_mood_prompt()
 
-        prompt_info = await get_prompt_info(target, threshold=0.38)
         if prompt_info:
             prompt_info = await global_prompt_manager.format_prompt("knowledge_prompt", prompt_info=prompt_info)
 
@@ -956,7 +1013,7 @@ async def get_prompt_info(message: str, threshold: float):
     logger.debug(f"获取知识库内容，元消息：{message[:30]}...，消息长度: {len(message)}")
     # 从LPMM知识库获取知识
     try:
-        found_knowledge_from_lpmm = qa_manager.get_knowledge(message)
+        found_knowledge_from_lpmm = await qa_manager.get_knowledge_async(message)
 
         end_time = time.time()
         if found_knowledge_from_lpmm is not None:
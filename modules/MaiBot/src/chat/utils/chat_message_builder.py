@@ -83,8 +83,12 @@ def get_raw_msg_by_timestamp_random(
     """
     先在范围时间戳内随机选择一条消息，取得消息的chat_id，然后根据chat_id获取该聊天在指定时间戳范围内的消息
     """
-    # 获取所有消息，只取chat_id字段
-    all_msgs = get_raw_msg_by_timestamp(timestamp_start, timestamp_end)
+    # 获取所有消息，只取chat_id和time字段
+    all_msgs = find_messages(
+        message_filter={"time": {"$gt": timestamp_start, "$lt": timestamp_end}},
+        sort=[("time", 1)],
+        fields=["chat_id", "time"],
+    )
     if not all_msgs:
         return []
     # 随机选一条
@@ -152,6 +156,12 @@ def num_new_messages_since(chat_id: str, timestamp_start: float = 0.0, timestamp
     return count_messages(message_filter=filter_query)
 
 
+def num_messages_by_timestamp_with_chat_inclusive(chat_id: str, timestamp_start: float, timestamp_end: float) -> int:
+    """计算特定聊天从指定时间戳到指定时间戳（包含边界）的消息数量，与 get_raw_msg_by_timestamp_with_chat_inclusive 返回的条数相同"""
+    filter_query = {"chat_id": chat_id, "time": {"$gte": timestamp_start, "$lte": timestamp_end}}
+    return count_messages(message_filter=filter_query)
+
+
 def num_new_messages_since_with_users(
     chat_id: str, timestamp_start: float, timestamp_end: float, person_ids: list
 ) -> int:
@@ -0,0 +1,86 @@
+from typing import Dict, List, Optional, Tuple
+
+MAX_DEDUP_CANDIDATES = 3  # 感知哈希相近的图片中最多逐像素比较确认的数量
+
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    """两个感知哈希之间不同的位数"""
+    return (hash1 ^ hash2).bit_count()
+
+
+def format_phash(phash: Optional[int]) -> Optional[str]:
+    """感知哈希转为数据库中保存的16位十六进制字符串"""
+    return f"{phash:016x}" if phash is not None else None
+
+
+def parse_phash(value: Optional[str]) -> Optional[int]:
+    """解析数据库中保存的感知哈希，无效时返回None"""
+    if not value:
+        return None
+    try:
+        return int(value, 16)
+    except ValueError:
+        return None
+
+
+class _BKNode:
+    __slots__ = ("phash", "keys", "children")
+
+    def __init__(self, phash: int, key: str):
+        self.phash = phash
+        self.keys: List[str] = [key]
+        self.children: Dict[int, "_BKNode"] = {}
+
+
+class PerceptualHashIndex:
+    """感知哈希的BK树索引，按汉明距离查找近似重复的图片
+
+    每个子节点按它与父节点的距离挂在父节点下。由三角不等式，查找与目标距离不超过d的哈希时，
+    只需进入与当前节点距离在 [x-d, x+d] 内的子树（x为目标与当前节点的距离），不必遍历全部哈希。
+    """
+
+    def __init__(self):
+        self._root: Optional[_BKNode] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, phash: int, key: str):
+        """添加一个哈希，key为对应记录的标识（如图片的MD5）"""
+        self._size += 1
+        if self._root is None:
+            self._root = _BKNode(phash, key)
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(phash, node.phash)
+            if distance == 0:
+                node.keys.append(key)
+                return
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = _BKNode(phash, key)
+                return
+            node = child
+
+    def find_all(self, phash: int, max_distance: int) -> List[Tuple[str, int]]:
+        """查找与给定哈希距离不超过max_distance的全部记录
+
+        Returns:
+            List[Tuple[str, int]]: (key, 距离)，按距离从近到远排列
+        """
+        matches: List[Tuple[str, int]] = []
+        if self._root is None:
+            return matches
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(phash, node.phash)
+            if distance <= max_distance:
+                matches.extend((key, distance) for key in node.keys)
+            for child_distance, child in node.children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[1])
+        return matches
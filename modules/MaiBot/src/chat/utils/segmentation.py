@@ -0,0 +1,111 @@
+import sys
+import threading
+from collections import Counter, OrderedDict
+from typing import Iterable
+
+import jieba
+
+from src.common.logger import get_logger
+from src.config.config import global_config
+
+logger = get_logger("segmentation")
+
+
+class SegmentationCache:
+    """进程内共享的 jieba 分词缓存
+
+    以 LRU 策略缓存 文本 -> 分词元组，同时限制条目数量和估算的内存占用。
+    记忆系统、聊天工具函数与关系管理器都通过全局实例 `segmenter` 分词，
+    同一条消息或同一个记忆节点在一次处理流程中只会真正调用一次 jieba。
+    """
+
+    def __init__(self, max_entries: int = 20000, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        """最大缓存条目数"""
+
+        self.max_bytes = max_bytes
+        """最大缓存占用（字节，估算值）"""
+
+        self._cache: OrderedDict[str, tuple[str, ...]] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _estimate_size(text: str, tokens: tuple[str, ...]) -> int:
+        return sys.getsizeof(text) + sys.getsizeof(tokens) + sum(sys.getsizeof(token) for token in tokens)
+
+    def _put(self, text: str, tokens: tuple[str, ...]):
+        """写入缓存并按需淘汰最久未使用的条目，调用方需持有锁"""
+        if text in self._cache:
+            self._bytes -= self._sizes[text]
+        size = self._estimate_size(text, tokens)
+        self._cache[text] = tokens
+        self._cache.move_to_end(text)
+        self._sizes[text] = size
+        self._bytes += size
+
+        while self._cache and (len(self._cache) > self.max_entries or self._bytes > self.max_bytes):
+            old_text, _ = self._cache.popitem(last=False)
+            self._bytes -= self._sizes.pop(old_text)
+            self.evictions += 1
+
+    def cut(self, text: str) -> tuple[str, ...]:
+        """获取文本的分词结果（保持jieba.cut的顺序与重复）"""
+        with self._lock:
+            tokens = self._cache.get(text)
+            if tokens is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return tokens
+            self.misses += 1
+
+        # jieba 分词在锁外进行，避免长文本阻塞其他线程的缓存读取
+        tokens = tuple(jieba.cut(text))
+        with self._lock:
+            self._put(text, tokens)
+        return tokens
+
+    def cut_set(self, text: str) -> frozenset[str]:
+        """获取文本的分词集合"""
+        return frozenset(self.cut(text))
+
+    def counter(self, text: str) -> Counter:
+        """获取文本的词频统计"""
+        return Counter(self.cut(text))
+
+    def warm(self, text: str, tokens: Iterable[str]):
+        """用已知的分词结果预热缓存（例如从数据库恢复的记忆节点分词）"""
+        with self._lock:
+            if text not in self._cache:
+                self._put(text, tuple(tokens))
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._cache.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict[str, int | float]:
+        """获取缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+segmenter = SegmentationCache(
+    max_entries=global_config.segmentation_cache.max_entries,
+    max_bytes=global_config.segmentation_cache.max_memory_mb * 1024 * 1024,
+)  # 全局单例
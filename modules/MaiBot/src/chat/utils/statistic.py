@@ -12,8 +12,12 @@ from src.common.logger import get_logger
 from src.manager.async_task_manager import AsyncTask
 
 from ...common.database.database import db  # This db is the Peewee database instance
-from ...common.database.database_model import OnlineTime, LLMUsage, Messages  # Import the Peewee model
+from ...common.database.database_model import OnlineTime, LLMUsage, MessageView  # Import the Peewee model
 from src.manager.local_store_manager import local_storage
+from src.llm_models.hedged_request import llm_request_hedger
+from src.llm_models.response_cache import llm_response_cache
+from src.llm_models.usage_recorder import llm_usage_recorder
+from src.common.message_buffer import message_write_buffer
 
 logger = get_logger("maibot_statistic")
 
@@ -36,6 +40,8 @@ TOTAL_TOK_BY_TYPE = "tokens_by_type"
 TOTAL_TOK_BY_USER = "tokens_by_user"
 TOTAL_TOK_BY_MODEL = "tokens_by_model"
 TOTAL_TOK_BY_MODULE = "tokens_by_module"
+CACHED_TOK_BY_TYPE = "cached_tokens_by_type"
+CACHED_TOK_BY_MODEL = "cached_tokens_by_model"
 COST_BY_TYPE = "costs_by_type"
 COST_BY_USER = "costs_by_user"
 COST_BY_MODEL = "costs_by_model"
@@ -140,6 +146,20 @@ def _format_online_time(online_seconds: int) -> str:
         return f"{minutes}分钟{seconds}秒"
 
 
+def _select_message_stat_fields():
+    """
+    只查询消息统计用到的字段（时间、群、发送者），不必取出消息内容
+    """
+    return MessageView.select(
+        MessageView.id,
+        MessageView.time,
+        MessageView.chat_info_group_id,
+        MessageView.chat_info_group_name,
+        MessageView.user_id,
+        MessageView.user_nickname,
+    )
+
+
 class StatisticOutputTask(AsyncTask):
     """统计输出任务"""
 
@@ -207,6 +227,9 @@ class StatisticOutputTask(AsyncTask):
 
     async def run(self):
         try:
+            # 先写入队列中尚未落库的LLM用量记录和消息，保证统计完整
+            await llm_usage_recorder.flush_async()
+            message_write_buffer.flush()
             now = datetime.now()
 
             # 使用线程池并行执行耗时操作
@@ -244,6 +267,8 @@ class StatisticOutputTask(AsyncTask):
             try:
                 import concurrent.futures
 
+                await llm_usage_recorder.flush_async()
+                message_write_buffer.flush()
                 now = datetime.now()
                 loop = asyncio.get_event_loop()
 
@@ -308,6 +333,8 @@ class StatisticOutputTask(AsyncTask):
                 TOTAL_TOK_BY_USER: defaultdict(int),
                 TOTAL_TOK_BY_MODEL: defaultdict(int),
                 TOTAL_TOK_BY_MODULE: defaultdict(int),
+                CACHED_TOK_BY_TYPE: defaultdict(int),
+                CACHED_TOK_BY_MODEL: defaultdict(int),
                 TOTAL_COST: 0.0,
                 COST_BY_TYPE: defaultdict(float),
                 COST_BY_USER: defaultdict(float),
@@ -358,6 +385,10 @@ class StatisticOutputTask(AsyncTask):
                         stats[period_key][TOTAL_TOK_BY_MODEL][model_name] += total_tokens
                         stats[period_key][TOTAL_TOK_BY_MODULE][module_name] += total_tokens
 
+                        cached_tokens = record.cached_tokens or 0
+                        stats[period_key][CACHED_TOK_BY_TYPE][request_type] += cached_tokens
+                        stats[period_key][CACHED_TOK_BY_MODEL][model_name] += cached_tokens
+
                         cost = record.cost or 0.0
                         stats[period_key][TOTAL_COST] += cost
                         stats[period_key][COST_BY_TYPE][request_type] += cost
@@ -427,8 +458,8 @@ class StatisticOutputTask(AsyncTask):
             for period_key, _ in collect_period
         }
 
-        query_start_timestamp = collect_period[-1][1].timestamp()  # Messages.time is a DoubleField (timestamp)
-        for message in Messages.select().where(Messages.time >= query_start_timestamp):
+        query_start_timestamp = collect_period[-1][1].timestamp()  # MessageView.time is a DoubleField (timestamp)
+        for message in _select_message_stat_fields().where(MessageView.time >= query_start_timestamp):
             message_time_ts = message.time  # This is a float timestamp
 
             chat_id = None
@@ -769,19 +800,20 @@ class StatisticOutputTask(AsyncTask):
         """
         if stats[TOTAL_REQ_CNT] <= 0:
             return ""
-        data_fmt = "{:<32}  {:>10}  {:>12}  {:>12}  {:>12}  {:>9.4f}¥"
+        data_fmt = "{:<32}  {:>10}  {:>12}  {:>12}  {:>12}  {:>12}  {:>9.4f}¥"
 
         output = [
             "按模型分类统计:",
-            " 模型名称                          调用次数    输入Token     输出Token     Token总量     累计花费",
+            " 模型名称                          调用次数    输入Token  缓存命中Token     输出Token     Token总量     累计花费",
         ]
         for model_name, count in sorted(stats[REQ_CNT_BY_MODEL].items()):
             name = f"{model_name[:29]}..." if len(model_name) > 32 else model_name
             in_tokens = stats[IN_TOK_BY_MODEL][model_name]
+            cached_tokens = stats[CACHED_TOK_BY_MODEL][model_name]
             out_tokens = stats[OUT_TOK_BY_MODEL][model_name]
             tokens = stats[TOTAL_TOK_BY_MODEL][model_name]
             cost = stats[COST_BY_MODEL][model_name]
-            output.append(data_fmt.format(name, count, in_tokens, out_tokens, tokens, cost))
+            output.append(data_fmt.format(name, count, in_tokens, cached_tokens, out_tokens, tokens, cost))
 
         output.append("")
         return "\n".join(output)
@@ -882,6 +914,8 @@ class StatisticOutputTask(AsyncTask):
         tab_list.append('<button class="tab-link" onclick="showTab(event, \'focus\')">Focus统计</button>')
         tab_list.append('<button class="tab-link" onclick="showTab(event, \'versions\')">版本对比</button>')
         tab_list.append('<button class="tab-link" onclick="showTab(event, \'charts\')">数据图表</button>')
+        tab_list.append('<button class="tab-link" onclick="showTab(event, \'cache\')">响应缓存</button>')
+        tab_list.append('<button class="tab-link" onclick="showTab(event, \'hedge\')">请求对冲</button>')
 
         def _format_stat_data(stat_data: dict[str, Any], div_id: str, start_time: datetime) -> str:
             """
@@ -899,6 +933,7 @@ class StatisticOutputTask(AsyncTask):
                     f"<td>{model_name}</td>"
                     f"<td>{count}</td>"
                     f"<td>{stat_data[IN_TOK_BY_MODEL][model_name]}</td>"
+                    f"<td>{stat_data[CACHED_TOK_BY_MODEL][model_name]}</td>"
                     f"<td>{stat_data[OUT_TOK_BY_MODEL][model_name]}</td>"
                     f"<td>{stat_data[TOTAL_TOK_BY_MODEL][model_name]}</td>"
                     f"<td>{stat_data[COST_BY_MODEL][model_name]:.4f} ¥</td>"
@@ -913,6 +948,7 @@ class StatisticOutputTask(AsyncTask):
                     f"<td>{req_type}</td>"
                     f"<td>{count}</td>"
                     f"<td>{stat_data[IN_TOK_BY_TYPE][req_type]}</td>"
+                    f"<td>{stat_data[CACHED_TOK_BY_TYPE][req_type]}</td>"
                     f"<td>{stat_data[OUT_TOK_BY_TYPE][req_type]}</td>"
                     f"<td>{stat_data[TOTAL_TOK_BY_TYPE][req_type]}</td>"
                     f"<td>{stat_data[COST_BY_TYPE][req_type]:.4f} ¥</td>"
@@ -1003,7 +1039,7 @@ class StatisticOutputTask(AsyncTask):
                 
                 <h2>按模型分类统计</h2>
                 <table>
-                    <thead><tr><th>模型名称</th><th>调用次数</th><th>输入Token</th><th>输出Token</th><th>Token总量</th><th>累计花费</th></tr></thead>
+                    <thead><tr><th>模型名称</th><th>调用次数</th><th>输入Token</th><th>缓存命中Token</th><th>输出Token</th><th>Token总量</th><th>累计花费</th></tr></thead>
                     <tbody>
                         {model_rows}
                     </tbody>
@@ -1022,7 +1058,7 @@ class StatisticOutputTask(AsyncTask):
                 <h2>按请求类型分类统计</h2>
                 <table>
                     <thead>
-                        <tr><th>请求类型</th><th>调用次数</th><th>输入Token</th><th>输出Token</th><th>Token总量</th><th>累计花费</th></tr>
+                        <tr><th>请求类型</th><th>调用次数</th><th>输入Token</th><th>缓存命中Token</th><th>输出Token</th><th>Token总量</th><th>累计花费</th></tr>
                     </thead>
                     <tbody>
                     {type_rows}
@@ -1065,6 +1101,12 @@ class StatisticOutputTask(AsyncTask):
         chart_data = self._generate_chart_data(stat)
         tab_content_list.append(self._generate_chart_tab(chart_data))
 
+        # 添加响应缓存内容
+        tab_content_list.append(self._generate_cache_tab())
+
+        # 添加请求对冲内容
+        tab_content_list.append(self._generate_hedge_tab())
+
         joined_tab_list = "\n".join(tab_list)
         joined_tab_content = "\n".join(tab_content_list)
 
@@ -1824,6 +1866,99 @@ class StatisticOutputTask(AsyncTask):
         </div>
         """
 
+    @staticmethod
+    def _generate_cache_tab() -> str:
+        """生成LLM响应缓存命中统计分页的HTML内容"""
+        cache_stats = llm_response_cache.get_stats()
+        if not cache_stats:
+            return """
+        <div id="cache" class="tab-content">
+            <h2>LLM响应缓存</h2>
+            <p class="info-item">暂无缓存数据（未启用缓存或启用缓存的请求类型尚未被调用）</p>
+        </div>
+        """
+
+        total_hits = sum(stats["hits"] + stats["persistent_hits"] for stats in cache_stats.values())
+        total_misses = sum(stats["misses"] for stats in cache_stats.values())
+        total = total_hits + total_misses
+        cache_rows = "\n".join(
+            [
+                f"<tr>"
+                f"<td>{request_type}</td>"
+                f"<td>{stats['hits']}</td>"
+                f"<td>{stats['persistent_hits']}</td>"
+                f"<td>{stats['misses']}</td>"
+                f"<td>{stats['hit_rate']:.1%}</td>"
+                f"</tr>"
+                for request_type, stats in sorted(cache_stats.items())
+            ]
+        )
+
+        return f"""
+        <div id="cache" class="tab-content">
+            <h2>LLM响应缓存</h2>
+            <p class="info-item"><strong>统计时段: </strong>自本次启动以来</p>
+            <p class="info-item"><strong>总命中次数: </strong>{total_hits}</p>
+            <p class="info-item"><strong>总未命中次数: </strong>{total_misses}</p>
+            <p class="info-item"><strong>命中率: </strong>{total_hits / total if total else 0:.1%}</p>
+
+            <h2>按请求类型分类统计</h2>
+            <table>
+                <thead>
+                    <tr><th>请求类型</th><th>内存命中</th><th>持久化命中</th><th>未命中</th><th>命中率</th></tr>
+                </thead>
+                <tbody>
+                {cache_rows}
+                </tbody>
+            </table>
+        </div>
+        """
+
+    @staticmethod
+    def _generate_hedge_tab() -> str:
+        """生成LLM请求对冲统计分页的HTML内容"""
+        hedge_stats = llm_request_hedger.get_stats()
+        if not hedge_stats:
+            return """
+        <div id="hedge" class="tab-content">
+            <h2>LLM请求对冲</h2>
+            <p class="info-item">暂无对冲数据（未启用请求对冲或启用对冲的请求类型尚未被调用）</p>
+        </div>
+        """
+
+        hedge_rows = "\n".join(
+            [
+                f"<tr>"
+                f"<td>{request_type}</td>"
+                f"<td>{stats['requests']}</td>"
+                f"<td>{stats['hedged']} ({stats['hedge_rate']:.1%})</td>"
+                f"<td>{stats['backup_wins']}</td>"
+                f"<td>{stats['failovers']}</td>"
+                f"<td>{stats['latency_saved']:.1f}</td>"
+                f"<td>{', '.join(f'{model}: {count}' for model, count in sorted(stats['wins'].items()))}</td>"
+                f"</tr>"
+                for request_type, stats in sorted(hedge_stats.items())
+            ]
+        )
+
+        return f"""
+        <div id="hedge" class="tab-content">
+            <h2>LLM请求对冲</h2>
+            <p class="info-item"><strong>统计时段: </strong>自本次启动以来</p>
+            <p class="info-item"><strong>估计节省总时间: </strong>{sum(stats["latency_saved"] for stats in hedge_stats.values()):.1f}秒</p>
+
+            <h2>按请求类型分类统计</h2>
+            <table>
+                <thead>
+                    <tr><th>请求类型</th><th>请求数</th><th>对冲次数</th><th>备用模型胜出</th><th>失败切换</th><th>估计节省(秒)</th><th>各模型返回次数</th></tr>
+                </thead>
+                <tbody>
+                {hedge_rows}
+                </tbody>
+            </table>
+        </div>
+        """
+
     def _generate_chart_data(self, stat: dict[str, Any]) -> dict:
         """生成图表数据"""
         now = datetime.now()
@@ -1892,7 +2027,7 @@ class StatisticOutputTask(AsyncTask):
 
         # 查询消息记录
         query_start_timestamp = start_time.timestamp()
-        for message in Messages.select().where(Messages.time >= query_start_timestamp):
+        for message in _select_message_stat_fields().where(MessageView.time >= query_start_timestamp):
             message_time_ts = message.time
 
             # 找到对应的时间间隔索引
@@ -2285,6 +2420,8 @@ class AsyncStatisticOutputTask(AsyncTask):
 
         async def _async_collect_and_output():
             try:
+                await llm_usage_recorder.flush_async()
+                message_write_buffer.flush()
                 now = datetime.now()
                 loop = asyncio.get_event_loop()
 
@@ -2384,5 +2521,13 @@ class AsyncStatisticOutputTask(AsyncTask):
     def _generate_versions_tab(self, stat: dict[str, Any]) -> str:
         return StatisticOutputTask._generate_versions_tab(self, stat)
 
+    @staticmethod
+    def _generate_cache_tab() -> str:
+        return StatisticOutputTask._generate_cache_tab()
+
+    @staticmethod
+    def _generate_hedge_tab() -> str:
+        return StatisticOutputTask._generate_hedge_tab()
+
     def _convert_defaultdict_to_dict(self, data):
         return StatisticOutputTask._convert_defaultdict_to_dict(self, data)
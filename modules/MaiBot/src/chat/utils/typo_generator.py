@@ -14,6 +14,7 @@ import jieba
 from pypinyin import Style, pinyin
 
 from src.common.logger import get_logger
+from .segmentation import segmenter
 
 logger = get_logger("typo_gen")
 
@@ -224,9 +225,9 @@ class ChineseTypoGenerator:
     @staticmethod
     def _segment_sentence(sentence):
         """
-        使用jieba分词，返回词语列表
+        使用jieba分词（经由全局分词缓存），返回词语列表
         """
-        return list(jieba.cut(sentence))
+        return list(segmenter.cut(sentence))
 
     def _get_word_homophones(self, word):
         """
@@ -1,9 +1,7 @@
 import random
 import re
 import time
-from collections import Counter
 
-import jieba
 import numpy as np
 from maim_message import UserInfo
 
@@ -12,8 +10,9 @@ from src.manager.mood_manager import mood_manager
 from ..message_receive.message import MessageRecv
 from src.llm_models.utils_model import LLMRequest
 from .typo_generator import ChineseTypoGenerator
+from .segmentation import segmenter
 from ...config.config import global_config
-from ...common.message_repository import find_messages, count_messages
+from ...common.message_repository import find_messages, count_and_total_length
 
 logger = get_logger("chat_utils")
 
@@ -321,6 +320,42 @@ def random_remove_punctuation(text: str) -> str:
     return result
 
 
+def _create_typo_generator() -> ChineseTypoGenerator:
+    return ChineseTypoGenerator(
+        error_rate=global_config.chinese_typo.error_rate,
+        min_freq=global_config.chinese_typo.min_freq,
+        tone_error_rate=global_config.chinese_typo.tone_error_rate,
+        word_replace_rate=global_config.chinese_typo.word_replace_rate,
+    )
+
+
+def _remove_bracket_content(protected_text: str) -> str:
+    """去除被 () 或 [] 或 （）包裹且包含中文的内容"""
+    pattern = re.compile(r"[(\[（](?=.*[一-鿿]).*?[)\]）]")
+    return pattern.sub("", protected_text)
+
+
+def _split_and_add_typos(
+    cleaned_text: str, enable_splitter: bool, enable_chinese_typo: bool, typo_generator: ChineseTypoGenerator
+) -> list[str]:
+    """分割句子并生成错别字"""
+    if global_config.response_splitter.enable and enable_splitter:
+        split_sentences = split_into_sentences_w_remove_punctuation(cleaned_text)
+    else:
+        split_sentences = [cleaned_text]
+
+    sentences = []
+    for sentence in split_sentences:
+        if global_config.chinese_typo.enable and enable_chinese_typo:
+            typoed_text, typo_corrections = typo_generator.create_typo_sentence(sentence)
+            sentences.append(typoed_text)
+            if typo_corrections:
+                sentences.append(typo_corrections)
+        else:
+            sentences.append(sentence)
+    return sentences
+
+
 def process_llm_response(text: str, enable_splitter: bool = True, enable_chinese_typo: bool = True) -> list[str]:
     if not global_config.response_post_process.enable_response_post_process:
         return [text]
@@ -332,11 +367,8 @@ def process_llm_response(text: str, enable_splitter: bool = True, enable_chinese
     else:
         protected_text = text
         kaomoji_mapping = {}
-    # 提取被 () 或 [] 或 （）包裹且包含中文的内容
-    pattern = re.compile(r"[(\[（](?=.*[一-鿿]).*?[)\]）]")
-    _extracted_contents = pattern.findall(protected_text)  # 在保护后的文本上查找
-    # 去除 () 和 [] 及其包裹的内容
-    cleaned_text = pattern.sub("", protected_text)
+    # 去除 () 和 [] 及其包裹的内容（在保护后的文本上查找）
+    cleaned_text = _remove_bracket_content(protected_text)
 
     if cleaned_text == "":
         return ["呃呃"]
@@ -352,36 +384,12 @@ def process_llm_response(text: str, enable_splitter: bool = True, enable_chinese
             logger.warning(f"回复过长 ({len(cleaned_text)} 字符)，返回默认回复")
             return ["懒得说"]
 
-    typo_generator = ChineseTypoGenerator(
-        error_rate=global_config.chinese_typo.error_rate,
-        min_freq=global_config.chinese_typo.min_freq,
-        tone_error_rate=global_config.chinese_typo.tone_error_rate,
-        word_replace_rate=global_config.chinese_typo.word_replace_rate,
-    )
-
-    if global_config.response_splitter.enable and enable_splitter:
-        split_sentences = split_into_sentences_w_remove_punctuation(cleaned_text)
-    else:
-        split_sentences = [cleaned_text]
-
-    sentences = []
-    for sentence in split_sentences:
-        if global_config.chinese_typo.enable and enable_chinese_typo:
-            typoed_text, typo_corrections = typo_generator.create_typo_sentence(sentence)
-            sentences.append(typoed_text)
-            if typo_corrections:
-                sentences.append(typo_corrections)
-        else:
-            sentences.append(sentence)
+    sentences = _split_and_add_typos(cleaned_text, enable_splitter, enable_chinese_typo, _create_typo_generator())
 
     if len(sentences) > max_sentence_num:
         logger.warning(f"分割后消息数量过多 ({len(sentences)} 条)，返回默认回复")
         return [f"{global_config.bot.nickname}不知道哦"]
 
-    # if extracted_contents:
-    #     for content in extracted_contents:
-    #         sentences.append(content)
-
     # 在所有句子处理完毕后，对包含占位符的列表进行恢复
     if global_config.response_splitter.enable_kaomoji_protection:
         sentences = recover_kaomoji(sentences, kaomoji_mapping)
@@ -389,6 +397,126 @@ def process_llm_response(text: str, enable_splitter: bool = True, enable_chinese
     return sentences
 
 
+class StreamingResponseSplitter:
+    """流式回复的增量分句器
+
+    不断接收模型输出的文本增量，每当出现完整的句子（以句末标点或换行结尾）时，
+    对这部分文本做与 process_llm_response 相同的处理（颜文字保护、去除括号内容、分割合并、错别字），
+    使第一句话不必等待模型输出完毕即可发送。
+    句末标点处于括号内（可能是颜文字）或后面紧跟颜文字符号时不切分。
+
+    已发送的句子无法撤回，所以超出长度或句子数限制时不再替换为默认回复，而是截断之后的内容。
+    未启用回复后处理时与 process_llm_response 一致，不分句，整段回复在输出结束时作为一条消息返回。
+    """
+
+    SENTENCE_ENDINGS = "。！？!?~～\n"
+    OPEN_BRACKETS = "([（【"
+    CLOSE_BRACKETS = ")]）】"
+    KAOMOJI_CHARS = "▼▽・ᴥω･﹏^><≧≦￣｀´∀ヮДд︿﹀へ｡ﾟ╥╯╰︶︹•⁄"
+
+    def __init__(self, enable_splitter: bool = True, enable_chinese_typo: bool = True):
+        self.enable_splitter = enable_splitter
+        self.enable_chinese_typo = enable_chinese_typo
+        self.typo_generator = _create_typo_generator()
+
+        self.buffer = ""
+        """尚未处理的文本"""
+
+        self.has_content = False
+        """是否收到过非空白的文本"""
+
+        self.cleaned_length = 0
+        """已处理文本（去除括号内容后）的总长度"""
+
+        self.sentence_count = 0
+        """已产出的句子数"""
+
+        self.truncated = False
+        """是否因超出限制而截断"""
+
+    def feed(self, delta: str) -> list[str]:
+        """接收一段文本增量，返回已经完整的句子"""
+        self.buffer += delta
+        self.has_content = self.has_content or bool(delta.strip())
+        if not global_config.response_post_process.enable_response_post_process:
+            return []
+        cut = self._find_cut()
+        if cut <= 0:
+            return []
+        chunk, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return self._process_chunk(chunk)
+
+    def flush(self) -> list[str]:
+        """模型输出结束，处理剩余文本"""
+        chunk, self.buffer = self.buffer, ""
+        if not global_config.response_post_process.enable_response_post_process:
+            if not self.has_content:
+                return []
+            self.sentence_count += 1
+            return [chunk]
+        sentences = self._process_chunk(chunk)
+        if self.sentence_count == 0 and self.has_content and not self.truncated:
+            # 与 process_llm_response 一致：去除括号内容后为空时返回默认回复
+            self.sentence_count += 1
+            return ["呃呃"]
+        return sentences
+
+    def _find_cut(self) -> int:
+        """找到最后一个可以切分的位置（句末标点之后），没有则返回0"""
+        depth = 0
+        cut = 0
+        text = self.buffer
+        for i, char in enumerate(text[:-1]):
+            if char in self.OPEN_BRACKETS:
+                depth += 1
+            elif char in self.CLOSE_BRACKETS:
+                depth = max(0, depth - 1)
+            elif char in self.SENTENCE_ENDINGS and depth == 0:
+                next_char = text[i + 1]
+                if (
+                    next_char in self.SENTENCE_ENDINGS
+                    or next_char in self.CLOSE_BRACKETS
+                    or next_char in self.KAOMOJI_CHARS
+                ):
+                    continue
+                cut = i + 1
+        return cut
+
+    def _process_chunk(self, chunk: str) -> list[str]:
+        if self.truncated or not chunk.strip():
+            return []
+
+        if global_config.response_splitter.enable_kaomoji_protection:
+            protected_text, kaomoji_mapping = protect_kaomoji(chunk)
+        else:
+            protected_text = chunk
+            kaomoji_mapping = {}
+        cleaned_text = _remove_bracket_content(protected_text).strip()
+        if not cleaned_text:
+            return []
+
+        self.cleaned_length += len(cleaned_text)
+        max_length = global_config.response_splitter.max_length * 2
+        if get_western_ratio(cleaned_text) < 0.1 and self.cleaned_length > max_length:
+            logger.warning(f"流式回复过长 ({self.cleaned_length} 字符)，截断之后的内容")
+            self.truncated = True
+            return []
+
+        sentences = _split_and_add_typos(
+            cleaned_text, self.enable_splitter, self.enable_chinese_typo, self.typo_generator
+        )
+        remaining = global_config.response_splitter.max_sentence_num - self.sentence_count
+        if len(sentences) > remaining:
+            logger.warning("流式回复分割后消息数量过多，截断之后的内容")
+            self.truncated = True
+            sentences = sentences[:remaining]
+        self.sentence_count += len(sentences)
+
+        if kaomoji_mapping:
+            sentences = recover_kaomoji(sentences, kaomoji_mapping)
+        return sentences
+
+
 def calculate_typing_time(
     input_string: str,
     thinking_start_time: float,
@@ -455,11 +583,8 @@ def cosine_similarity(v1, v2):
 
 def text_to_vector(text):
     """将文本转换为词频向量"""
-    # 分词
-    words = jieba.lcut(text)
-    # 统计词频
-    word_freq = Counter(words)
-    return word_freq
+    # 分词并统计词频（分词结果由全局分词缓存复用）
+    return segmenter.counter(text)
 
 
 def find_similar_topics_simple(text: str, topics: list, top_k: int = 5) -> list:
@@ -584,18 +709,12 @@ def count_messages_between(start_time: float, end_time: float, stream_id: str) -
         logger.error("stream_id 不能为空")
         return 0, 0
 
-    # 使用message_repository中的count_messages和find_messages函数
-
     # 构建查询条件
     filter_query = {"chat_id": stream_id, "time": {"$gt": start_time, "$lte": end_time}}
 
     try:
-        # 先获取消息数量
-        count = count_messages(filter_query)
-
-        # 获取消息内容计算总长度
-        messages = find_messages(message_filter=filter_query)
-        total_length = sum(len(msg.get("processed_plain_text", "")) for msg in messages)
+        # 在一次查询中得到消息数量和文本总长度，不取出消息本身
+        count, total_length = count_and_total_length(filter_query)
 
         return count, total_length
 
@@ -1,17 +1,16 @@
 import base64
 import os
 import time
-import hashlib
 import uuid
-from typing import Optional, Tuple
-from PIL import Image
-import io
-import numpy as np
+from typing import Dict, Optional, Tuple
 import asyncio
 
 
 from src.common.database.database import db
 from src.common.database.database_model import Images, ImageDescriptions
+from src.common.image_pipeline import DecodedImage, image_pipeline
+from src.chat.utils.image_dedup import MAX_DEDUP_CANDIDATES, PerceptualHashIndex, format_phash, parse_phash
+from src.chat.utils.vlm_queue import DescriptionPriority, vlm_description_queue
 from src.config.config import global_config
 from src.llm_models.utils_model import LLMRequest
 
@@ -39,6 +38,9 @@ class ImageManager:
 
             self._initialized = True
             self._llm = LLMRequest(model=global_config.model.vlm, temperature=0.4, max_tokens=300, request_type="image")
+            # 感知哈希索引，首次使用时从数据库加载
+            self._description_indexes: Dict[str, PerceptualHashIndex] = {}
+            self._image_index: Optional[PerceptualHashIndex] = None
 
             try:
                 db.connect(reuse_if_open=True)
@@ -72,55 +74,173 @@ class ImageManager:
             logger.error(f"从数据库获取描述失败 (Peewee): {str(e)}")
             return None
 
-    @staticmethod
-    def _save_description_to_db(image_hash: str, description: str, description_type: str) -> None:
+    def _save_description_to_db(
+        self, image_hash: str, description: str, description_type: str, phash: Optional[int] = None
+    ) -> None:
         """保存图片描述到数据库
 
         Args:
             image_hash: 图片哈希值
             description: 描述文本
             description_type: 描述类型 ('emoji' 或 'image')
+            phash: 图片的感知哈希
         """
         try:
             current_timestamp = time.time()
-            defaults = {"description": description, "timestamp": current_timestamp}
+            defaults = {"description": description, "timestamp": current_timestamp, "phash": format_phash(phash)}
             desc_obj, created = ImageDescriptions.get_or_create(
                 image_description_hash=image_hash, type=description_type, defaults=defaults
             )
             if not created:  # 如果记录已存在，则更新
                 desc_obj.description = description
                 desc_obj.timestamp = current_timestamp
+                if phash is not None:
+                    desc_obj.phash = format_phash(phash)
                 desc_obj.save()
+            # 索引尚未加载时，加载时会从数据库读到这条记录
+            index = self._description_indexes.get(description_type)
+            if phash is not None and index is not None:
+                index.add(phash, image_hash)
         except Exception as e:
             logger.error(f"保存描述到数据库失败 (Peewee): {str(e)}")
 
-    async def get_emoji_description(self, image_base64: str) -> str:
-        """获取表情包描述，带查重和保存功能"""
+    @staticmethod
+    async def _compute_phash(image_bytes: bytes) -> Optional[int]:
+        """计算图片的感知哈希，未启用近似去重时返回None"""
+        if not global_config.image_dedup.enable:
+            return None
+        return await image_pipeline.perceptual_hash(image_bytes)
+
+    def _get_description_index(self, description_type: str) -> PerceptualHashIndex:
+        """获取某类描述的感知哈希索引，首次调用时从ImageDescriptions表加载"""
+        index = self._description_indexes.get(description_type)
+        if index is None:
+            index = PerceptualHashIndex()
+            query = ImageDescriptions.select(ImageDescriptions.image_description_hash, ImageDescriptions.phash).where(
+                (ImageDescriptions.type == description_type) & ImageDescriptions.phash.is_null(False)
+            )
+            for record in query:
+                phash = parse_phash(record.phash)
+                if phash is not None:
+                    index.add(phash, record.image_description_hash)
+            self._description_indexes[description_type] = index
+            logger.debug(f"已加载 {len(index)} 条 {description_type} 描述的感知哈希")
+        return index
+
+    def _get_image_index(self) -> PerceptualHashIndex:
+        """获取图片记录的感知哈希索引，首次调用时从Images表加载"""
+        if self._image_index is None:
+            index = PerceptualHashIndex()
+            query = Images.select(Images.emoji_hash, Images.phash).where(
+                (Images.type == "image") & Images.phash.is_null(False)
+            )
+            for record in query:
+                phash = parse_phash(record.phash)
+                if phash is not None:
+                    index.add(phash, record.emoji_hash)
+            self._image_index = index
+            logger.debug(f"已加载 {len(index)} 条图片记录的感知哈希")
+        return self._image_index
+
+    @staticmethod
+    async def _is_same_image(image_bytes: bytes, candidate_path: Optional[str]) -> bool:
+        """逐像素比较确认感知哈希相近的图片确实是同一张图片，候选图片的文件不存在时无法确认，不视为重复"""
+        difference = await image_pipeline.pixel_difference(image_bytes, candidate_path)
+        return difference is not None and difference <= global_config.image_dedup.max_pixel_difference
+
+    async def _find_similar_description(
+        self, image_bytes: bytes, phash: Optional[int], description_type: str
+    ) -> Optional[str]:
+        """查找近似重复图片的已有描述"""
+        if phash is None:
+            return None
         try:
-            # 计算图片哈希
-            # 确保base64字符串只包含ASCII字符
-            if isinstance(image_base64, str):
-                image_base64 = image_base64.encode("ascii", errors="ignore").decode("ascii")
-            image_bytes = base64.b64decode(image_base64)
-            image_hash = hashlib.md5(image_bytes).hexdigest()
-            image_format = Image.open(io.BytesIO(image_bytes)).format.lower()
+            matches = self._get_description_index(description_type).find_all(
+                phash, global_config.image_dedup.max_distance
+            )
+            for similar_hash, distance in matches[:MAX_DEDUP_CANDIDATES]:
+                similar_image = Images.get_or_none(
+                    (Images.emoji_hash == similar_hash) & (Images.type == description_type)
+                )
+                if similar_image is None or not await self._is_same_image(image_bytes, similar_image.path):
+                    continue
+                description = self._get_description_from_db(similar_hash, description_type)
+                if description:
+                    logger.debug(f"找到近似重复的图片 {similar_hash} (距离 {distance})，复用描述: {description}")
+                    return description
+            return None
+        except Exception as e:
+            logger.error(f"查找近似重复图片失败: {str(e)}")
+            return None
+
+    async def _find_similar_image(self, image_bytes: bytes, phash: Optional[int]) -> Optional[Images]:
+        """查找近似重复图片的已有图片记录"""
+        if phash is None:
+            return None
+        try:
+            matches = self._get_image_index().find_all(phash, global_config.image_dedup.max_distance)
+            for similar_hash, distance in matches[:MAX_DEDUP_CANDIDATES]:
+                existing_image = Images.get_or_none((Images.emoji_hash == similar_hash) & (Images.type == "image"))
+                if existing_image and await self._is_same_image(image_bytes, existing_image.path):
+                    logger.debug(f"找到近似重复的图片 {similar_hash} (距离 {distance})，复用图片记录")
+                    return existing_image
+            return None
+        except Exception as e:
+            logger.error(f"查找近似重复图片失败: {str(e)}")
+            return None
+
+    async def get_emoji_description(
+        self, image_base64: str, priority: DescriptionPriority = DescriptionPriority.NORMAL
+    ) -> str:
+        """获取表情包描述，带查重和保存功能
+
+        Args:
+            image_base64: 图片的base64编码
+            priority: 需要调用VLM识别时的排队优先级
+        """
+        try:
+            # 解码图片，计算哈希并获取格式
+            image = await image_pipeline.decode(image_base64)
+            image_bytes, image_hash = image.data, image.hash
 
             # 查询缓存的描述
             cached_description = self._get_description_from_db(image_hash, "emoji")
             if cached_description:
                 return f"[表情包，含义看起来是：{cached_description}]"
 
+            # 查询近似重复的表情包（重新编码、缩放过的同一张图）的描述，不再重复识别和保存
+            phash = await self._compute_phash(image_bytes)
+            similar_description = await self._find_similar_description(image_bytes, phash, "emoji")
+            if similar_description:
+                # 复用描述时不保存图片文件，这条记录无法用于逐像素确认，不加入感知哈希索引
+                self._save_description_to_db(image_hash, similar_description, "emoji")
+                return f"[表情包，含义看起来是：{similar_description}]"
+
+            # 同一表情包的并发请求只识别一次
+            return await vlm_description_queue.submit(
+                f"emoji:{image_hash}", lambda: self._describe_emoji(image, phash), priority
+            )
+        except Exception as e:
+            logger.error(f"获取表情包描述失败: {str(e)}")
+            return "[表情包]"
+
+    async def _describe_emoji(self, image: DecodedImage, phash: Optional[int]) -> str:
+        """调用VLM识别表情包，保存文件和描述"""
+        image_bytes, image_hash, image_format = image.data, image.hash, image.format
+        try:
             # 调用AI获取描述
-            if image_format == "gif" or image_format == "GIF":
-                image_base64_processed = self.transform_gif(image_base64)
-                if image_base64_processed is None:
+            if image_format == "gif":
+                frame_strip = await image_pipeline.gif_to_frame_strip(image_bytes)
+                if frame_strip is None:
                     logger.warning("GIF转换失败，无法获取描述")
                     return "[表情包(GIF处理失败)]"
                 prompt = "这是一个动态图表情包，每一张图代表了动态图的某一帧，黑色背景代表透明，使用1-2个词描述一下表情包表达的情感和内容，简短一些，输出一段平文本，不超过15个字"
-                description, _ = await self._llm.generate_response_for_image(prompt, image_base64_processed, "jpg")
+                description, _ = await self._llm.generate_response_for_image(
+                    prompt, base64.b64encode(frame_strip).decode("utf-8"), "jpg"
+                )
             else:
                 prompt = "图片是一个表情包，请用使用1-2个词描述一下表情包所表达的情感和内容，简短一些，输出一段平文本，不超过15个字"
-                description, _ = await self._llm.generate_response_for_image(prompt, image_base64, image_format)
+                description, _ = await self._llm.generate_response_for_image(prompt, image.to_base64(), image_format)
 
             if description is None:
                 logger.warning("AI未能生成表情包描述")
@@ -153,6 +273,7 @@ class ImageManager:
                     img_obj.path = file_path
                     img_obj.description = description
                     img_obj.timestamp = current_timestamp
+                    img_obj.phash = format_phash(phash)
                     img_obj.save()
                 except Images.DoesNotExist:
                     Images.create(
@@ -161,29 +282,33 @@ class ImageManager:
                         type="emoji",
                         description=description,
                         timestamp=current_timestamp,
+                        phash=format_phash(phash),
                     )
                 # logger.debug(f"保存表情包元数据: {file_path}")
             except Exception as e:
                 logger.error(f"保存表情包文件或元数据失败: {str(e)}")
 
             # 保存描述到数据库 (ImageDescriptions表)
-            self._save_description_to_db(image_hash, description, "emoji")
+            self._save_description_to_db(image_hash, description, "emoji", phash)
 
             return f"[表情包：{description}]"
         except Exception as e:
             logger.error(f"获取表情包描述失败: {str(e)}")
             return "[表情包]"
 
-    async def get_image_description(self, image_base64: str) -> str:
-        """获取普通图片描述，带查重和保存功能"""
+    async def get_image_description(
+        self, image_base64: str, priority: DescriptionPriority = DescriptionPriority.NORMAL
+    ) -> str:
+        """获取普通图片描述，带查重和保存功能
+
+        Args:
+            image_base64: 图片的base64编码
+            priority: 需要调用VLM识别时的排队优先级
+        """
         try:
-            # 计算图片哈希
-            # 确保base64字符串只包含ASCII字符
-            if isinstance(image_base64, str):
-                image_base64 = image_base64.encode("ascii", errors="ignore").decode("ascii")
-            image_bytes = base64.b64decode(image_base64)
-            image_hash = hashlib.md5(image_bytes).hexdigest()
-            image_format = Image.open(io.BytesIO(image_bytes)).format.lower()
+            # 解码图片，计算哈希并获取格式
+            image = await image_pipeline.decode(image_base64)
+            image_bytes, image_hash = image.data, image.hash
 
             # 查询缓存的描述
             cached_description = self._get_description_from_db(image_hash, "image")
@@ -191,9 +316,28 @@ class ImageManager:
                 logger.debug(f"图片描述缓存中 {cached_description}")
                 return f"[图片：{cached_description}]"
 
+            # 查询近似重复图片的描述
+            phash = await self._compute_phash(image_bytes)
+            similar_description = await self._find_similar_description(image_bytes, phash, "image")
+            if similar_description:
+                self._save_description_to_db(image_hash, similar_description, "image")
+                return f"[图片：{similar_description}]"
+
+            # 同一图片的并发请求只识别一次
+            return await vlm_description_queue.submit(
+                f"image:{image_hash}", lambda: self._describe_image(image, phash), priority
+            )
+        except Exception as e:
+            logger.error(f"获取图片描述失败: {str(e)}")
+            return "[图片]"
+
+    async def _describe_image(self, image: DecodedImage, phash: Optional[int]) -> str:
+        """调用VLM识别图片，保存文件和描述"""
+        image_bytes, image_hash, image_format = image.data, image.hash, image.format
+        try:
             # 调用AI获取描述
             prompt = "请用中文描述这张图片的内容。如果有文字，请把文字都描述出来，请留意其主题，直观感受，输出为一段平文本，最多50字"
-            description, _ = await self._llm.generate_response_for_image(prompt, image_base64, image_format)
+            description, _ = await self._llm.generate_response_for_image(prompt, image.to_base64(), image_format)
 
             if description is None:
                 logger.warning("AI未能生成图片描述")
@@ -227,6 +371,7 @@ class ImageManager:
                     img_obj.path = file_path
                     img_obj.description = description
                     img_obj.timestamp = current_timestamp
+                    img_obj.phash = format_phash(phash)
                     img_obj.save()
                 except Images.DoesNotExist:
                     Images.create(
@@ -235,162 +380,48 @@ class ImageManager:
                         type="image",
                         description=description,
                         timestamp=current_timestamp,
+                        phash=format_phash(phash),
                     )
+                    if phash is not None and self._image_index is not None:
+                        self._image_index.add(phash, image_hash)
                 logger.debug(f"保存图片元数据: {file_path}")
             except Exception as e:
                 logger.error(f"保存图片文件或元数据失败: {str(e)}")
 
             # 保存描述到数据库 (ImageDescriptions表)
-            self._save_description_to_db(image_hash, description, "image")
+            self._save_description_to_db(image_hash, description, "image", phash)
 
             return f"[图片：{description}]"
         except Exception as e:
             logger.error(f"获取图片描述失败: {str(e)}")
             return "[图片]"
 
-    @staticmethod
-    def transform_gif(gif_base64: str, similarity_threshold: float = 1000.0, max_frames: int = 15) -> Optional[str]:
-        """将GIF转换为水平拼接的静态图像, 跳过相似的帧
-
-        Args:
-            gif_base64: GIF的base64编码字符串
-            similarity_threshold: 判定帧相似的阈值 (MSE)，越小表示要求差异越大才算不同帧，默认1000.0
-            max_frames: 最大抽取的帧数，默认15
-
-        Returns:
-            Optional[str]: 拼接后的JPG图像的base64编码字符串, 或者在失败时返回None
-        """
-        try:
-            # 确保base64字符串只包含ASCII字符
-            if isinstance(gif_base64, str):
-                gif_base64 = gif_base64.encode("ascii", errors="ignore").decode("ascii")
-            # 解码base64
-            gif_data = base64.b64decode(gif_base64)
-            gif = Image.open(io.BytesIO(gif_data))
-
-            # 收集所有帧
-            all_frames = []
-            try:
-                while True:
-                    gif.seek(len(all_frames))
-                    # 确保是RGB格式方便比较
-                    frame = gif.convert("RGB")
-                    all_frames.append(frame.copy())
-            except EOFError:
-                pass  # 读完啦
-
-            if not all_frames:
-                logger.warning("GIF中没有找到任何帧")
-                return None  # 空的GIF直接返回None
-
-            # --- 新的帧选择逻辑 ---
-            selected_frames = []
-            last_selected_frame_np = None
-
-            for i, current_frame in enumerate(all_frames):
-                current_frame_np = np.array(current_frame)
-
-                # 第一帧总是要选的
-                if i == 0:
-                    selected_frames.append(current_frame)
-                    last_selected_frame_np = current_frame_np
-                    continue
-
-                # 计算和上一张选中帧的差异（均方误差 MSE）
-                if last_selected_frame_np is not None:
-                    mse = np.mean((current_frame_np - last_selected_frame_np) ** 2)
-                    # logger.debug(f"帧 {i} 与上一选中帧的 MSE: {mse}") # 可以取消注释来看差异值
-
-                    # 如果差异够大，就选它！
-                    if mse > similarity_threshold:
-                        selected_frames.append(current_frame)
-                        last_selected_frame_np = current_frame_np
-                        # 检查是不是选够了
-                        if len(selected_frames) >= max_frames:
-                            # logger.debug(f"已选够 {max_frames} 帧，停止选择。")
-                            break
-                # 如果差异不大就跳过这一帧啦
-
-            # --- 帧选择逻辑结束 ---
-
-            # 如果选择后连一帧都没有（比如GIF只有一帧且后续处理失败？）或者原始GIF就没帧，也返回None
-            if not selected_frames:
-                logger.warning("处理后没有选中任何帧")
-                return None
-
-            # logger.debug(f"总帧数: {len(all_frames)}, 选中帧数: {len(selected_frames)}")
-
-            # 获取选中的第一帧的尺寸（假设所有帧尺寸一致）
-            frame_width, frame_height = selected_frames[0].size
-
-            # 计算目标尺寸，保持宽高比
-            target_height = 200  # 固定高度
-            # 防止除以零
-            if frame_height == 0:
-                logger.error("帧高度为0，无法计算缩放尺寸")
-                return None
-            target_width = int((target_height / frame_height) * frame_width)
-            # 宽度也不能是0
-            if target_width == 0:
-                logger.warning(f"计算出的目标宽度为0 (原始尺寸 {frame_width}x{frame_height})，调整为1")
-                target_width = 1
-
-            # 调整所有选中帧的大小
-            resized_frames = [
-                frame.resize((target_width, target_height), Image.Resampling.LANCZOS) for frame in selected_frames
-            ]
-
-            # 创建拼接图像
-            total_width = target_width * len(resized_frames)
-            # 防止总宽度为0
-            if total_width == 0 and len(resized_frames) > 0:
-                logger.warning("计算出的总宽度为0，但有选中帧，可能目标宽度太小")
-                # 至少给点宽度吧
-                total_width = len(resized_frames)
-            elif total_width == 0:
-                logger.error("计算出的总宽度为0且无选中帧")
-                return None
-
-            combined_image = Image.new("RGB", (total_width, target_height))
-
-            # 水平拼接图像
-            for idx, frame in enumerate(resized_frames):
-                combined_image.paste(frame, (idx * target_width, 0))
-
-            # 转换为base64
-            buffer = io.BytesIO()
-            combined_image.save(buffer, format="JPEG", quality=85)  # 保存为JPEG
-            result_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-            return result_base64
-
-        except MemoryError:
-            logger.error("GIF转换失败: 内存不足，可能是GIF太大或帧数太多")
-            return None  # 内存不够啦
-        except Exception as e:
-            logger.error(f"GIF转换失败: {str(e)}", exc_info=True)  # 记录详细错误信息
-            return None  # 其他错误也返回None
-
-    async def process_image(self, image_base64: str) -> Tuple[str, str]:
+    async def process_image(
+        self, image_base64: str, priority: DescriptionPriority = DescriptionPriority.NORMAL
+    ) -> Tuple[str, str]:
         """处理图片并返回图片ID和描述
 
         Args:
             image_base64: 图片的base64编码
+            priority: 后台VLM识别的排队优先级
 
         Returns:
             Tuple[str, str]: (图片ID, 描述)
         """
         try:
-            # 生成图片ID
-            # 计算图片哈希
-            # 确保base64字符串只包含ASCII字符
-            if isinstance(image_base64, str):
-                image_base64 = image_base64.encode("ascii", errors="ignore").decode("ascii")
-            image_bytes = base64.b64decode(image_base64)
-            image_hash = hashlib.md5(image_bytes).hexdigest()
-
-            # 检查图片是否已存在
+            # 解码图片并计算哈希
+            image = await image_pipeline.decode(image_base64)
+            image_bytes, image_hash = image.data, image.hash
+
+            # 检查图片是否已存在，不存在时查找近似重复的图片
             existing_image = Images.get_or_none(Images.emoji_hash == image_hash)
+            phash = None
+            if not existing_image:
+                phash = await self._compute_phash(image_bytes)
+                similar_image = await self._find_similar_image(image_bytes, phash)
+                # 计算感知哈希期间，同一张图片的另一个副本可能已经创建了记录，需要重新查询；
+                # 从这里到创建记录之间不能再有await，保证同一张图片只创建一条记录、只提交一次VLM识别
+                existing_image = Images.get_or_none(Images.emoji_hash == image_hash) or similar_image
 
             if existing_image:
                 # 检查是否缺少必要字段，如果缺少则创建新记录
@@ -445,10 +476,17 @@ class ImageManager:
                 timestamp=current_timestamp,
                 vlm_processed=False,
                 count=1,
+                phash=format_phash(phash),
             )
+            if phash is not None and self._image_index is not None:
+                self._image_index.add(phash, image_hash)
 
             # 启动异步VLM处理
-            asyncio.create_task(self._process_image_with_vlm(image_id, image_base64))
+            asyncio.create_task(
+                vlm_description_queue.submit(
+                    f"picid:{image_hash}", lambda: self._process_image_with_vlm(image_id, image, phash), priority
+                )
+            )
 
             return image_id, f"[picid:{image_id}]"
 
@@ -456,40 +494,33 @@ class ImageManager:
             logger.error(f"处理图片失败: {str(e)}")
             return "", "[图片]"
 
-    async def _process_image_with_vlm(self, image_id: str, image_base64: str) -> None:
+    async def _process_image_with_vlm(self, image_id: str, image: DecodedImage, phash: Optional[int] = None) -> None:
         """使用VLM处理图片并更新数据库
 
         Args:
             image_id: 图片ID
-            image_base64: 图片的base64编码
+            image: 解码后的图片
+            phash: 图片的感知哈希
         """
         try:
-            # 计算图片哈希
-            # 确保base64字符串只包含ASCII字符
-            if isinstance(image_base64, str):
-                image_base64 = image_base64.encode("ascii", errors="ignore").decode("ascii")
-            image_bytes = base64.b64decode(image_base64)
-            image_hash = hashlib.md5(image_bytes).hexdigest()
+            image_hash = image.hash
 
             # 先检查缓存的描述
             cached_description = self._get_description_from_db(image_hash, "image")
             if cached_description:
                 logger.debug(f"VLM处理时发现缓存描述: {cached_description}")
                 # 更新数据库
-                image = Images.get(Images.image_id == image_id)
-                image.description = cached_description
-                image.vlm_processed = True
-                image.save()
+                image_record = Images.get(Images.image_id == image_id)
+                image_record.description = cached_description
+                image_record.vlm_processed = True
+                image_record.save()
                 return
 
-            # 获取图片格式
-            image_format = Image.open(io.BytesIO(image_bytes)).format.lower()
-
             # 构建prompt
             prompt = """请用中文描述这张图片的内容。如果有文字，请把文字描述概括出来，请留意其主题，直观感受，输出为一段平文本，最多30字，请注意不要分点，就输出一段文本"""
 
             # 获取VLM描述
-            description, _ = await self._llm.generate_response_for_image(prompt, image_base64, image_format)
+            description, _ = await self._llm.generate_response_for_image(prompt, image.to_base64(), image.format)
 
             if description is None:
                 logger.warning("VLM未能生成图片描述")
@@ -502,13 +533,13 @@ class ImageManager:
                 description = cached_description
 
             # 更新数据库
-            image = Images.get(Images.image_id == image_id)
-            image.description = description
-            image.vlm_processed = True
-            image.save()
+            image_record = Images.get(Images.image_id == image_id)
+            image_record.description = description
+            image_record.vlm_processed = True
+            image_record.save()
 
             # 保存描述到ImageDescriptions表
-            self._save_description_to_db(image_hash, description, "image")
+            self._save_description_to_db(image_hash, description, "image", phash)
 
         except Exception as e:
             logger.error(f"VLM处理图片失败: {str(e)}")
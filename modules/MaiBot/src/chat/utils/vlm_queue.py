@@ -0,0 +1,128 @@
+import asyncio
+import itertools
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.common.logger import get_logger
+
+logger = get_logger("vlm_queue")
+
+VLM_DESCRIPTION_WORKERS = 3  # 同时进行的图片识别请求数上限
+
+
+class DescriptionPriority(IntEnum):
+    """图片识别请求的优先级，数值越小越先处理"""
+
+    REPLY = 0
+    """麦麦即将回复的消息（私聊、提到麦麦）或麦麦自己发送的消息中的图片"""
+
+    NORMAL = 1
+    """其他消息中的图片"""
+
+    BACKGROUND = 2
+    """不影响当前对话的后台识别"""
+
+
+@dataclass
+class _DescriptionJob:
+    key: str
+    factory: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    priority: int
+    started: bool = False
+
+
+class VLMDescriptionQueue:
+    """图片识别请求队列
+
+    同一张图片（相同key）的并发请求合并为一次：后到的请求直接等待正在排队或进行中的那次请求的结果。
+    请求按优先级由固定数量的工作协程处理，突发的大量图片不会同时占满VLM的并发额度。
+    """
+
+    def __init__(self, max_workers: int = VLM_DESCRIPTION_WORKERS):
+        self._max_workers = max_workers
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: Dict[str, _DescriptionJob] = {}
+        self._sequence = itertools.count()
+        self.executed = 0
+        """实际执行的请求数"""
+        self.coalesced = 0
+        """合并到进行中请求的请求数"""
+
+    def _ensure_workers(self):
+        """在当前事件循环中启动工作协程"""
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self._max_workers:
+            self._workers.append(asyncio.create_task(self._worker(), name=f"vlm_queue_worker_{len(self._workers)}"))
+
+    def _enqueue(self, job: _DescriptionJob, priority: int):
+        # 序号保证同优先级先进先出，且不会比较到job本身
+        self._queue.put_nowait((priority, next(self._sequence), job))
+
+    async def submit(
+        self, key: str, factory: Callable[[], Awaitable[Any]], priority: int = DescriptionPriority.NORMAL
+    ) -> Any:
+        """提交一个识别请求并等待结果
+
+        Args:
+            key: 请求的标识，相同标识的并发请求只执行一次（如"emoji:图片MD5"）
+            factory: 执行请求的协程函数
+            priority: 优先级，见 DescriptionPriority
+
+        Returns:
+            factory 的返回值，factory 抛出的异常会传给所有等待者
+        """
+        self._ensure_workers()
+        job = self._jobs.get(key)
+        if job is None:
+            job = _DescriptionJob(key, factory, asyncio.get_running_loop().create_future(), priority)
+            # 没有等待者时（等待者都被取消）也标记异常已被读取，避免事件循环报告未处理的异常
+            job.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+            self._jobs[key] = job
+            self._enqueue(job, priority)
+        else:
+            self.coalesced += 1
+            logger.debug(f"图片识别请求 {key} 已在{'进行' if job.started else '排队'}中，等待其结果")
+            if not job.started and priority < job.priority:
+                # 以更高的优先级再入队一次，先出队的那次执行，另一次出队时跳过
+                job.priority = priority
+                self._enqueue(job, priority)
+        # 等待者被取消时不取消共享的请求
+        return await asyncio.shield(job.future)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if job.started:
+                    continue
+                job.started = True
+                self.executed += 1
+                try:
+                    result = await job.factory()
+                except asyncio.CancelledError:
+                    job.future.cancel()
+                    raise
+                except Exception as e:
+                    job.future.set_exception(e)
+                else:
+                    job.future.set_result(result)
+                finally:
+                    self._jobs.pop(job.key, None)
+            finally:
+                self._queue.task_done()
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取队列统计（自启动以来）"""
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+vlm_description_queue = VLMDescriptionQueue()
@@ -85,6 +85,7 @@ class LLMUsage(BaseModel):
     prompt_tokens = IntegerField()
     completion_tokens = IntegerField()
     total_tokens = IntegerField()
+    cached_tokens = IntegerField(default=0)  # 输入中命中服务商前缀缓存的token数
     cost = DoubleField()
     status = TextField()
     timestamp = DateTimeField(index=True)  # 更改为 DateTimeField 并添加索引
@@ -95,6 +96,22 @@ class LLMUsage(BaseModel):
         table_name = "llm_usage"
 
 
+class LLMResponseCache(BaseModel):
+    """
+    用于持久化LLM响应缓存的模型，键为模型、参数与prompt的哈希。
+    """
+
+    cache_key = TextField(unique=True, index=True)  # 请求内容的哈希值
+    model_name = TextField()
+    request_type = TextField()
+    response = TextField()  # JSON格式存储的响应
+    create_time = DoubleField()  # 写入时间戳
+    expire_time = DoubleField(index=True)  # 过期时间戳
+
+    class Meta:
+        table_name = "llm_response_cache"
+
+
 class Emoji(BaseModel):
     """表情包"""
 
@@ -111,21 +128,71 @@ class Emoji(BaseModel):
     register_time = FloatField(null=True)  # 注册时间（被注册为可用表情包的时间）
     usage_count = IntegerField(default=0)  # 使用次数（被使用的次数）
     last_used_time = FloatField(null=True)  # 上次使用时间
+    phash = TextField(null=True)  # 感知哈希（16位十六进制），用于识别近似重复的表情包
 
     class Meta:
         # database = db # 继承自 BaseModel
         table_name = "emoji"
 
 
+class MessageSenders(BaseModel):
+    """
+    消息发送者信息，每种 (平台, 用户ID, 昵称, 群名片) 组合只保存一行，由 Messages.sender_id 引用。
+    (platform, user_id) 与 PersonInfo 中的平台和用户ID对应。
+    """
+
+    platform = TextField()
+    user_id = TextField()
+    user_nickname = TextField(null=True)
+    user_cardname = TextField(null=True)
+
+    class Meta:
+        table_name = "message_senders"
+        indexes = ((("user_id", "platform", "user_nickname", "user_cardname"), False),)
+
+
 class Messages(BaseModel):
     """
     用于存储消息数据的模型。
+    聊天流信息通过 chat_id 关联 ChatStreams，发送者的昵称等信息通过 sender_id 关联 MessageSenders，
+    不在每条消息中重复保存。查询时使用 MessageView 获取展开后的完整信息。
     """
 
     message_id = TextField(index=True)  # 消息 ID (更改自 IntegerField)
-    time = DoubleField()  # 消息时间戳
+    time = DoubleField(index=True)  # 消息时间戳
 
-    chat_id = TextField(index=True)  # 对应的 ChatStreams stream_id
+    chat_id = TextField()  # 对应的 ChatStreams stream_id，由 (chat_id, time) 索引覆盖
+
+    reply_to = TextField(null=True)
+
+    user_id = TextField()  # 发送者的用户ID，保留在消息中以便按用户筛选
+    sender_id = IntegerField(null=True)  # 对应的 MessageSenders id
+
+    processed_plain_text = TextField(null=True)  # 处理后的纯文本消息
+    display_message = TextField(null=True)  # 显示的消息
+    detailed_plain_text = TextField(null=True)  # 详细的纯文本消息
+    memorized_times = IntegerField(default=0)  # 被记忆的次数
+
+    class Meta:
+        # database = db # 继承自 BaseModel
+        table_name = "messages"
+        # 常用查询都是按聊天或发送者筛选一段时间内的消息并按时间排序，复合索引可以同时完成筛选和排序
+        indexes = (
+            (("chat_id", "time"), False),
+            (("user_id", "time"), False),
+        )
+
+
+class MessageView(BaseModel):
+    """
+    消息视图，将 Messages 与 ChatStreams、MessageSenders 关联后展开为扁平结构，
+    各列与规范化之前的消息表一致，只用于查询。
+    """
+
+    message_id = TextField()
+    time = DoubleField()
+
+    chat_id = TextField()
 
     reply_to = TextField(null=True)
 
@@ -154,8 +221,42 @@ class Messages(BaseModel):
     memorized_times = IntegerField(default=0)  # 被记忆的次数
 
     class Meta:
-        # database = db # 继承自 BaseModel
-        table_name = "messages"
+        table_name = "messages_view"
+
+
+class LegacyMessages(MessageView):
+    """
+    规范化之前的消息表，结构与 MessageView 相同。只在迁移期间存在，迁移完成后删除。
+    """
+
+    class Meta:
+        table_name = "messages_legacy"
+
+
+MESSAGE_VIEW_SQL = """
+CREATE VIEW IF NOT EXISTS messages_view AS
+SELECT
+    m.id, m.message_id, m.time, m.chat_id, m.reply_to,
+    m.chat_id AS chat_info_stream_id,
+    c.platform AS chat_info_platform,
+    c.user_platform AS chat_info_user_platform,
+    c.user_id AS chat_info_user_id,
+    c.user_nickname AS chat_info_user_nickname,
+    c.user_cardname AS chat_info_user_cardname,
+    c.group_platform AS chat_info_group_platform,
+    c.group_id AS chat_info_group_id,
+    c.group_name AS chat_info_group_name,
+    c.create_time AS chat_info_create_time,
+    c.last_active_time AS chat_info_last_active_time,
+    s.platform AS user_platform,
+    m.user_id,
+    s.user_nickname,
+    s.user_cardname,
+    m.processed_plain_text, m.display_message, m.detailed_plain_text, m.memorized_times
+FROM messages AS m
+LEFT JOIN chat_streams AS c ON c.stream_id = m.chat_id
+LEFT JOIN message_senders AS s ON s.id = m.sender_id
+"""
 
 
 class ActionRecords(BaseModel):
@@ -196,6 +297,7 @@ class Images(BaseModel):
     timestamp = FloatField()  # 时间戳
     type = TextField()  # 图像类型，例如 "emoji"
     vlm_processed = BooleanField(default=False)  # 是否已经过VLM处理
+    phash = TextField(null=True)  # 感知哈希（16位十六进制），用于识别近似重复的图片
 
     class Meta:
         table_name = "images"
@@ -210,6 +312,7 @@ class ImageDescriptions(BaseModel):
     image_description_hash = TextField(index=True)  # 图像的哈希值
     description = TextField()  # 图像的描述
     timestamp = FloatField()  # 时间戳
+    phash = TextField(null=True)  # 感知哈希（16位十六进制），用于识别近似重复的图片
 
     class Meta:
         # database = db # 继承自 BaseModel
@@ -319,6 +422,7 @@ class GraphNodes(BaseModel):
     concept = TextField(unique=True, index=True)  # 节点概念
     memory_items = TextField()  # JSON格式存储的记忆列表
     hash = TextField()  # 节点哈希值
+    tokens = TextField(null=True)  # JSON格式存储的节点概念分词结果，用于重建倒排索引
     created_time = FloatField()  # 创建时间戳
     last_modified = FloatField()  # 最后修改时间戳
 
@@ -351,7 +455,9 @@ def create_tables():
             [
                 ChatStreams,
                 LLMUsage,
+                LLMResponseCache,
                 Emoji,
+                MessageSenders,
                 Messages,
                 Images,
                 ImageDescriptions,
@@ -365,18 +471,161 @@ def create_tables():
                 ActionRecords,  # 添加 ActionRecords 到初始化列表
             ]
         )
+        create_message_view()
+
+
+# 已被其他索引覆盖、需要从旧数据库中删除的索引
+OBSOLETE_INDEXES = {
+    "messages": ["messages_chat_id"],  # 由 (chat_id, time) 复合索引覆盖
+}
+
+
+def _sync_indexes(model) -> bool:
+    """
+    创建模型中定义但数据库中缺失的索引，删除已废弃的索引。
+    索引逐个以 CREATE INDEX IF NOT EXISTS 创建，已有数据和已有索引不受影响。
+
+    Returns:
+        bool: 是否创建了新索引
+    """
+    table_name = model._meta.table_name
+    existing_indexes = {index.name for index in db.get_indexes(table_name)}
+    created = False
+    for index in model._meta.fields_to_index():
+        if index._name in existing_indexes:
+            continue
+        logger.info(f"表 '{table_name}' 缺失索引 '{index._name}'，正在创建（数据较多时可能需要一些时间）...")
+        try:
+            db.execute(model._schema._create_index(index, safe=True))
+            created = True
+            logger.info(f"索引 '{index._name}' 创建成功")
+        except Exception as e:
+            logger.error(f"创建索引 '{index._name}' 失败: {e}")
+
+    for index_name in OBSOLETE_INDEXES.get(table_name, []):
+        if index_name not in existing_indexes:
+            continue
+        try:
+            db.execute_sql(f'DROP INDEX IF EXISTS "{index_name}"')
+            logger.info(f"已删除废弃的索引 '{index_name}'")
+        except Exception as e:
+            logger.error(f"删除索引 '{index_name}' 失败: {e}")
+    return created
+
+
+MESSAGE_MIGRATION_CHUNK_SIZE = 50000  # 转换旧版消息表时每个事务处理的消息数
+
+
+def create_message_view(database=db):
+    """
+    重建消息视图。视图定义可能随版本变化，每次启动时都重建一次。
+    """
+    database.execute_sql("DROP VIEW IF EXISTS messages_view")
+    database.execute_sql(MESSAGE_VIEW_SQL)
+
+
+def migrate_messages_schema(database=db) -> bool:
+    """
+    将规范化之前的消息表转换为 Messages + MessageSenders 结构。
+
+    旧表先改名为 messages_legacy，然后按 id 顺序分批转换：每批在一个事务内补全聊天流和发送者、
+    写入新表并从旧表删除，中断后下次启动从剩余的消息继续。全部完成后删除旧表并执行 VACUUM 回收空间。
+    新表的索引由 initialize_database 随后创建。需要在事务之外调用，否则各批不会单独提交。
+
+    Returns:
+        bool: 是否进行了转换
+    """
+    tables = set(database.get_tables())
+    if "messages_legacy" not in tables:
+        if "messages" not in tables:
+            return False
+        if "chat_info_stream_id" not in {column.name for column in database.get_columns("messages")}:
+            return False
+        logger.warning("消息表为旧版结构，正在转换为新结构（消息较多时可能需要几分钟）...")
+        with database.atomic():
+            database.execute_sql('ALTER TABLE "messages" RENAME TO "messages_legacy"')
+            # 旧表上的索引名与新表冲突，转换时也用不到
+            for index in database.get_indexes("messages_legacy"):
+                database.execute_sql(f'DROP INDEX IF EXISTS "{index.name}"')
+
+    database.create_tables([ChatStreams, MessageSenders])
+    Messages._schema.create_table(safe=True)
+
+    legacy_columns = {column.name for column in database.get_columns("messages_legacy")}
+    copy_fields = [field for field in Messages._meta.sorted_fields if field.name not in ("id", "sender_id")]
+    copy_columns = ", ".join(field.column_name for field in copy_fields)
+    # 很旧的数据库可能缺少后来新增的列，按默认值填充
+    copy_values = ", ".join(
+        f"l.{field.column_name}"
+        if field.column_name in legacy_columns
+        else ("NULL" if field.default is None else repr(field.default))
+        for field in copy_fields
+    )
+    sender_match = (
+        "s.user_id = l.user_id AND s.platform IS l.user_platform "
+        "AND s.user_nickname IS l.user_nickname AND s.user_cardname IS l.user_cardname"
+    )
+    # 已不存在的聊天流按其最新一条消息中的信息补全，视图中仍能查到
+    insert_streams_sql = """
+        INSERT INTO chat_streams (stream_id, create_time, group_platform, group_id, group_name, last_active_time,
+            platform, user_platform, user_id, user_nickname, user_cardname)
+        SELECT l.chat_id, l.chat_info_create_time, l.chat_info_group_platform, l.chat_info_group_id,
+            l.chat_info_group_name, l.chat_info_last_active_time, l.chat_info_platform, l.chat_info_user_platform,
+            l.chat_info_user_id, l.chat_info_user_nickname, l.chat_info_user_cardname
+        FROM messages_legacy AS l
+        WHERE l.id IN (SELECT MAX(id) FROM messages_legacy WHERE id <= ? GROUP BY chat_id)
+            AND NOT EXISTS (SELECT 1 FROM chat_streams AS c WHERE c.stream_id = l.chat_id)
+    """
+    insert_senders_sql = f"""
+        INSERT INTO message_senders (platform, user_id, user_nickname, user_cardname)
+        SELECT DISTINCT l.user_platform, l.user_id, l.user_nickname, l.user_cardname
+        FROM messages_legacy AS l
+        WHERE l.id <= ? AND NOT EXISTS (SELECT 1 FROM message_senders AS s WHERE {sender_match})
+    """
+    copy_messages_sql = f"""
+        INSERT INTO messages ({copy_columns}, sender_id)
+        SELECT {copy_values}, (SELECT s.id FROM message_senders AS s WHERE {sender_match} LIMIT 1)
+        FROM messages_legacy AS l
+        WHERE l.id <= ?
+        ORDER BY l.id
+    """
+
+    total = database.execute_sql('SELECT COUNT(*) FROM "messages_legacy"').fetchone()[0]
+    migrated = 0
+    while True:
+        upper = database.execute_sql(
+            'SELECT MAX(id) FROM (SELECT id FROM "messages_legacy" ORDER BY id LIMIT ?)',
+            (MESSAGE_MIGRATION_CHUNK_SIZE,),
+        ).fetchone()[0]
+        if upper is None:
+            break
+        with database.atomic():
+            database.execute_sql(insert_streams_sql, (upper,))
+            database.execute_sql(insert_senders_sql, (upper,))
+            migrated += database.execute_sql(copy_messages_sql, (upper,)).rowcount
+            database.execute_sql('DELETE FROM "messages_legacy" WHERE id <= ?', (upper,))
+        logger.info(f"已转换 {migrated}/{total} 条消息")
+
+    database.execute_sql('DROP TABLE "messages_legacy"')
+    logger.info("消息表转换完成，正在回收数据库空间...")
+    database.execute_sql("VACUUM")
+    return True
 
 
 def initialize_database():
     """
     检查所有定义的表是否存在，如果不存在则创建它们。
     检查所有表的所有字段是否存在，如果缺失则自动添加。
+    检查所有表的索引是否存在，如果缺失则自动创建。
+    旧版消息表会先转换为新结构，最后重建消息视图。
     """
 
     models = [
         ChatStreams,
         LLMUsage,
+        LLMResponseCache,
         Emoji,
+        MessageSenders,
         Messages,
         Images,
         ImageDescriptions,
@@ -391,7 +640,12 @@ def initialize_database():
     ]
 
     try:
+        # 转换旧版消息表需要逐批提交并在最后执行 VACUUM，不能放在下面 with db 开启的事务中
+        with db.connection_context():
+            migrate_messages_schema()
+
         with db:  # 管理 table_exists 检查的连接
+            indexes_created = False
             for model in models:
                 table_name = model._meta.table_name
                 if not db.table_exists(model):
@@ -453,6 +707,15 @@ def initialize_database():
                         logger.info(f"字段 '{field_name}' 删除成功")
                     except Exception as e:
                         logger.error(f"删除字段 '{field_name}' 失败: {e}")
+
+                # 检查并创建缺失索引
+                indexes_created = _sync_indexes(model) or indexes_created
+
+            if indexes_created:
+                # 为新索引收集统计信息，帮助查询规划器选择索引
+                db.execute_sql("PRAGMA optimize")
+
+            create_message_view()
     except Exception as e:
         logger.exception(f"检查表或字段是否存在时出错: {e}")
         # 如果检查失败（例如数据库不可用），则退出
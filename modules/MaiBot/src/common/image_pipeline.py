@@ -0,0 +1,320 @@
+import asyncio
+import base64
+import hashlib
+import io
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from src.common.logger import get_logger
+
+logger = get_logger("image_pipeline")
+
+IMAGE_WORKER_THREADS = 2  # 图片处理工作线程数
+FRAME_CHUNK_SIZE = 8  # 帧去重时每批参与向量化比较的最大帧数
+GIF_STRIP_HEIGHT = 200  # 拼接后图像的固定高度
+COMPRESS_SKIP_SIZE = 2 * 1024 * 1024  # 小于该大小的图片不压缩
+PHASH_SIZE = 8  # 感知哈希的边长，哈希位数为其平方
+THUMBNAIL_SIZE = 64  # 确认近似重复时逐像素比较的灰度缩略图边长
+
+# 以下为在工作线程中执行的纯函数：只接收和返回bytes等不可变对象，不访问全局配置，也不写日志
+
+
+def _iter_frames(gif: Image.Image) -> Iterator[np.ndarray]:
+    """逐帧解码GIF，统一为RGB方便比较"""
+    index = 0
+    try:
+        while True:
+            gif.seek(index)
+            yield np.asarray(gif.convert("RGB"))
+            index += 1
+    except EOFError:
+        return
+
+
+def _select_distinct_frames(
+    frames: Iterable[np.ndarray], similarity_threshold: float, max_frames: int
+) -> List[np.ndarray]:
+    """选出与上一张选中帧差异足够大的帧
+
+    与逐帧比较的结果一致：第一帧总是选中，之后依次选出与上一张选中帧的MSE超过阈值的帧。
+    后续帧分批与上一张选中帧比较，连续相似的帧越多批越大；帧按需解码，选够帧数后不再解码剩余的帧。
+
+    Args:
+        frames: 各帧的 (高, 宽, 3) uint8数组
+        similarity_threshold: 判定帧相似的MSE阈值
+        max_frames: 最多选出的帧数
+
+    Returns:
+        List[np.ndarray]: 选中的帧
+    """
+    frame_iter = iter(frames)
+    first_frame = next(frame_iter, None)
+    if first_frame is None:
+        return []
+
+    selected = [first_frame]
+    # 转为int16后再相减，避免uint8相减时溢出回绕；平方和在int64中累加
+    reference = first_frame.reshape(-1).astype(np.int16)
+    chunk_size = 1
+    while len(selected) < max_frames:
+        chunk = list(itertools.islice(frame_iter, chunk_size))
+        if not chunk:
+            break
+        diff = np.stack(chunk).reshape(len(chunk), -1).astype(np.int16) - reference
+        mse = np.einsum("ij,ij->i", diff, diff, dtype=np.int64) / reference.size
+        different = np.flatnonzero(mse > similarity_threshold)
+        if different.size:
+            index = int(different[0])
+            selected.append(chunk[index])
+            reference = chunk[index].reshape(-1).astype(np.int16)
+            # 本批中选中帧之后的帧还要与新的选中帧比较
+            frame_iter = itertools.chain(chunk[index + 1 :], frame_iter)
+            chunk_size = 1
+        else:
+            chunk_size = min(chunk_size * 2, FRAME_CHUNK_SIZE)
+    return selected
+
+
+def _gif_to_frame_strip(gif_bytes: bytes, similarity_threshold: float, max_frames: int) -> Optional[bytes]:
+    """将GIF转换为水平拼接的静态JPEG图像，跳过相似的帧，没有可用帧时返回None"""
+    gif = Image.open(io.BytesIO(gif_bytes))
+    selected_frames = [
+        Image.fromarray(frame) for frame in _select_distinct_frames(_iter_frames(gif), similarity_threshold, max_frames)
+    ]
+    if not selected_frames:
+        return None
+
+    # 按固定高度缩放，保持宽高比
+    frame_width, frame_height = selected_frames[0].size
+    if frame_height == 0:
+        return None
+    target_width = max(1, int((GIF_STRIP_HEIGHT / frame_height) * frame_width))
+
+    combined_image = Image.new("RGB", (target_width * len(selected_frames), GIF_STRIP_HEIGHT))
+    for idx, frame in enumerate(selected_frames):
+        resized_frame = frame.resize((target_width, GIF_STRIP_HEIGHT), Image.Resampling.LANCZOS)
+        combined_image.paste(resized_frame, (idx * target_width, 0))
+
+    buffer = io.BytesIO()
+    combined_image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def _compress_image(image_bytes: bytes, target_size: int) -> Tuple[bytes, Tuple[int, int], Tuple[int, int]]:
+    """按面积比例缩小图片，使其大小接近目标大小
+
+    Returns:
+        Tuple[bytes, Tuple[int, int], Tuple[int, int]]: 压缩后的数据、原始尺寸、压缩后尺寸
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    original_width, original_height = img.size
+
+    scale = min(1.0, (target_size / len(image_bytes)) ** 0.5)
+    new_width = int(original_width * scale)
+    new_height = int(original_height * scale)
+
+    output_buffer = io.BytesIO()
+    if getattr(img, "is_animated", False):
+        # 动图折上折
+        new_width, new_height = new_width // 2, new_height // 2
+        frames = []
+        for frame_idx in range(img.n_frames):
+            img.seek(frame_idx)
+            frames.append(img.copy().resize((new_width, new_height), Image.Resampling.LANCZOS))
+        frames[0].save(
+            output_buffer,
+            format="GIF",
+            save_all=True,
+            append_images=frames[1:],
+            optimize=True,
+            duration=img.info.get("duration", 100),
+            loop=img.info.get("loop", 0),
+        )
+    else:
+        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        # 保持原始格式
+        if img.format == "PNG" and img.mode in ("RGBA", "LA"):
+            resized_img.save(output_buffer, format="PNG", optimize=True)
+        else:
+            resized_img.save(output_buffer, format="JPEG", quality=95, optimize=True)
+
+    return output_buffer.getvalue(), (original_width, original_height), (new_width, new_height)
+
+
+def _load_gray(image_bytes: bytes, size: Tuple[int, int], draft_size: Tuple[int, int]) -> Image.Image:
+    """解码为灰度图并缩放到指定大小，动图只取第一帧，透明区域按白色背景处理"""
+    img = Image.open(io.BytesIO(image_bytes))
+    # JPEG可以直接以较低分辨率（不低于draft_size）解码，其他格式无效果
+    img.draft("RGB", draft_size)
+    rgba = img.convert("RGBA")
+    background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+    background.alpha_composite(rgba)
+    return background.convert("L").resize(size, Image.Resampling.LANCZOS)
+
+
+def _perceptual_hash(image_bytes: bytes) -> int:
+    """计算图片的差值哈希（dHash）
+
+    缩放为 (PHASH_SIZE+1)xPHASH_SIZE 的灰度图后比较每行相邻像素的明暗，对重新编码、缩放和轻微调色不敏感。
+    """
+    pixels = np.asarray(
+        _load_gray(image_bytes, (PHASH_SIZE + 1, PHASH_SIZE), (PHASH_SIZE * 8, PHASH_SIZE * 8)), dtype=np.int16
+    )
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _normalized_thumbnail(image_bytes: bytes) -> np.ndarray:
+    """THUMBNAIL_SIZE 见方的灰度缩略图，按亮度的均值和标准差归一化，抵消整体调亮、调对比度的影响"""
+    pixels = np.asarray(
+        _load_gray(image_bytes, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), (THUMBNAIL_SIZE * 4, THUMBNAIL_SIZE * 4)),
+        dtype=np.float32,
+    )
+    return (pixels - pixels.mean()) / max(float(pixels.std()), 1.0)
+
+
+def _pixel_difference(image_bytes: bytes, other_path: str) -> float:
+    """两张图片归一化缩略图逐像素差值的最大值
+
+    重新编码、缩放过的同一张图片各处差值都很小；同一模板只改了文字的图片在文字处差值很大，
+    而64位感知哈希只反映整体明暗结构，无法区分这两种情况。
+    """
+    with open(other_path, "rb") as f:
+        other_bytes = f.read()
+    return float(np.abs(_normalized_thumbnail(image_bytes) - _normalized_thumbnail(other_bytes)).max())
+
+
+def _sniff_format(image_bytes: bytes) -> str:
+    """读取图片格式（只解析文件头，不解码像素）"""
+    return Image.open(io.BytesIO(image_bytes)).format.lower()
+
+
+# 以下为在事件循环中调用的接口
+
+
+@dataclass
+class DecodedImage:
+    """解码后的图片，在各处理阶段之间传递bytes而不是base64字符串"""
+
+    data: bytes
+    """图片原始数据"""
+
+    hash: str
+    """图片数据的MD5"""
+
+    format: str
+    """图片格式（小写）"""
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+
+def _decode_image(image_base64: str) -> DecodedImage:
+    # 确保base64字符串只包含ASCII字符
+    if isinstance(image_base64, str):
+        image_base64 = image_base64.encode("ascii", errors="ignore").decode("ascii")
+    image_bytes = base64.b64decode(image_base64)
+    return DecodedImage(image_bytes, hashlib.md5(image_bytes).hexdigest(), _sniff_format(image_bytes))
+
+
+class ImagePipeline:
+    """在事件循环之外执行的图片预处理
+
+    解码、缩放、GIF抽帧和重新编码都是CPU密集的操作，放在事件循环中执行时一张大GIF就会阻塞所有聊天。
+    使用独立的线程池执行（Pillow和NumPy的主要计算会释放GIL）。不使用进程池：主程序已启动多个线程，
+    fork出的子进程可能继承被其他线程持有的锁而死锁，spawn/forkserver又会在每个子进程中重新导入整个主程序。
+    """
+
+    def __init__(self, max_workers: int = IMAGE_WORKER_THREADS):
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="image_pipeline")
+        return self._executor
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    @staticmethod
+    async def decode(image_base64: str) -> DecodedImage:
+        """解码base64图片，计算哈希并读取格式"""
+        return await asyncio.to_thread(_decode_image, image_base64)
+
+    async def gif_to_frame_strip(
+        self, gif_bytes: bytes, similarity_threshold: float = 1000.0, max_frames: int = 15
+    ) -> Optional[bytes]:
+        """将GIF转换为水平拼接的静态JPEG图像, 跳过相似的帧
+
+        Args:
+            gif_bytes: GIF数据
+            similarity_threshold: 判定帧相似的阈值 (MSE)，越小表示要求差异越大才算不同帧，默认1000.0
+            max_frames: 最大抽取的帧数，默认15
+
+        Returns:
+            Optional[bytes]: 拼接后的JPEG数据, 或者在失败时返回None
+        """
+        try:
+            result = await self._run(_gif_to_frame_strip, gif_bytes, similarity_threshold, max_frames)
+        except MemoryError:
+            logger.error("GIF转换失败: 内存不足，可能是GIF太大或帧数太多")
+            return None
+        except Exception as e:
+            logger.error(f"GIF转换失败: {str(e)}")
+            return None
+        if result is None:
+            logger.warning("GIF中没有找到任何可用的帧")
+        return result
+
+    async def compress(self, image_bytes: bytes, target_size: int = int(0.8 * 1024 * 1024)) -> bytes:
+        """压缩图片到接近目标大小，小于2MB或压缩失败时返回原图
+
+        Args:
+            image_bytes: 图片数据
+            target_size: 目标文件大小（字节），默认0.8MB
+        """
+        if len(image_bytes) <= COMPRESS_SKIP_SIZE:
+            return image_bytes
+        try:
+            compressed_data, original_size, new_size = await self._run(_compress_image, image_bytes, target_size)
+        except Exception as e:
+            logger.error(f"压缩图片失败: {str(e)}")
+            return image_bytes
+        logger.info(f"压缩图片: {original_size[0]}x{original_size[1]} -> {new_size[0]}x{new_size[1]}")
+        logger.info(f"压缩前大小: {len(image_bytes) / 1024:.1f}KB, 压缩后大小: {len(compressed_data) / 1024:.1f}KB")
+        return compressed_data
+
+    async def perceptual_hash(self, image_bytes: bytes) -> Optional[int]:
+        """计算图片的64位感知哈希，失败时返回None"""
+        try:
+            return await self._run(_perceptual_hash, image_bytes)
+        except Exception as e:
+            logger.error(f"计算感知哈希失败: {str(e)}")
+            return None
+
+    async def pixel_difference(self, image_bytes: bytes, other_path: str) -> Optional[float]:
+        """计算图片与另一个图片文件的归一化缩略图逐像素差值的最大值，文件不存在或读取失败时返回None"""
+        if not other_path or not os.path.exists(other_path):
+            return None
+        try:
+            return await self._run(_pixel_difference, image_bytes, other_path)
+        except Exception as e:
+            logger.error(f"比较图片像素失败: {str(e)}")
+            return None
+
+    def shutdown(self):
+        """关闭工作线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,147 @@
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.common.database.database import db
+from src.common.database.database_model import Messages, MessageSenders, MessageView
+from src.common.logger import get_logger
+from src.manager.async_task_manager import AsyncTask
+
+logger = get_logger("message_storage")
+
+FLUSH_INTERVAL = 1  # 定时写入的间隔（秒）
+FLUSH_BATCH_SIZE = 64  # 积压达到该条数时立即写入
+
+# 缓冲中的消息保存为与 MessageView 相同的扁平结构，查询时可以直接合并；没有给出的字段按模型默认值补全
+_MESSAGE_DEFAULTS = {
+    field.name: field.default for field in MessageView._meta.sorted_fields if field is not MessageView._meta.primary_key
+}
+_VIEW_FIELDS = MessageView._meta.fields
+_INSERT_FIELDS = [field for field in Messages._meta.sorted_fields if field is not Messages._meta.primary_key]
+# 预先生成的单行INSERT语句，批量写入时以 executemany 复用，省去 insert_many 逐行生成SQL的开销
+_INSERT_SQL = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+    Messages._meta.table_name,
+    ", ".join(f'"{field.column_name}"' for field in _INSERT_FIELDS),
+    ", ".join("?" for _ in _INSERT_FIELDS),
+)
+_SELECT_SENDER_SQL = (
+    "SELECT id FROM message_senders WHERE platform IS ? AND user_id = ? AND user_nickname IS ? AND user_cardname IS ?"
+)
+_INSERT_SENDER_SQL = "INSERT INTO message_senders (platform, user_id, user_nickname, user_cardname) VALUES (?, ?, ?, ?)"
+
+SenderKey = Tuple[Optional[str], str, Optional[str], Optional[str]]
+
+
+def _sender_key(row: Dict[str, Any]) -> SenderKey:
+    """消息发送者的 (平台, 用户ID, 昵称, 群名片)，按字段类型转换取值"""
+    return (
+        MessageSenders.platform.db_value(row["user_platform"]),
+        MessageSenders.user_id.db_value(row["user_id"]),
+        MessageSenders.user_nickname.db_value(row["user_nickname"]),
+        MessageSenders.user_cardname.db_value(row["user_cardname"]),
+    )
+
+
+class MessageWriteBuffer:
+    """消息写入缓冲
+
+    新消息只追加到内存队列中，由后台任务定时或在积压达到一定条数时在一个事务内批量写入数据库，
+    收发消息时不再各自在事件循环上单独写一次数据库。
+    尚未写入的消息由 message_repository 在查询时合并到结果中，同一进程内写入后立即可见。
+    """
+
+    def __init__(self):
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._flush_scheduled = False
+        self._sender_ids: Dict[SenderKey, int] = {}
+        """已写入数据库的发送者的id"""
+
+    def add(self, **fields) -> Dict[str, Any]:
+        """添加一条消息，字段与 MessageView 一致，返回缓冲中的记录
+
+        各字段按类型转换为写入数据库后的取值（如数字的 user_id 转为字符串），查询时与数据库中的记录比较结果一致。
+        """
+        row = dict(_MESSAGE_DEFAULTS)
+        row.update((name, _VIEW_FIELDS[name].db_value(value)) for name, value in fields.items())
+        self._pending.append(row)
+        if len(self._pending) < FLUSH_BATCH_SIZE or self._flush_scheduled:
+            return row
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中（如脚本中直接调用），直接写入
+            self.flush()
+            return row
+        self._flush_scheduled = True
+        loop.call_soon(self.flush)
+        return row
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """尚未写入数据库的消息（按添加顺序）"""
+        return list(self._pending)
+
+    def find_latest(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """查找尚未写入数据库的最新一条指定ID的消息，返回的字典可以直接修改"""
+        for row in reversed(self._pending):
+            if row["message_id"] == message_id:
+                return row
+        return None
+
+    def _get_sender_id(self, key: SenderKey, new_senders: Dict[SenderKey, int]) -> int:
+        """查找发送者的id，不存在时新建。需要在写入消息的事务中调用，新建的发送者先记在new_senders中"""
+        sender_id = self._sender_ids.get(key) or new_senders.get(key)
+        if sender_id is None:
+            existing = db.execute_sql(_SELECT_SENDER_SQL, key).fetchone()
+            sender_id = existing[0] if existing else db.execute_sql(_INSERT_SENDER_SQL, key).lastrowid
+            new_senders[key] = sender_id
+        return sender_id
+
+    def _to_params(self, row: Dict[str, Any], new_senders: Dict[SenderKey, int]) -> tuple:
+        """转换为 Messages 的一行，按字段类型转换取值（如把数字的message_id转为字符串），与 Messages.create 一致"""
+        sender_id = self._get_sender_id(_sender_key(row), new_senders)
+        return tuple(
+            sender_id if field is Messages.sender_id else field.db_value(row[field.name]) for field in _INSERT_FIELDS
+        )
+
+    def flush(self) -> int:
+        """将队列中的消息写入数据库，返回写入的条数"""
+        self._flush_scheduled = False
+        batch = list(self._pending)
+        self._pending.clear()
+        if not batch:
+            return 0
+
+        new_senders: Dict[SenderKey, int] = {}
+        try:
+            with db.atomic():
+                db.cursor().executemany(_INSERT_SQL, [self._to_params(row, new_senders) for row in batch])
+            # 事务提交后才缓存新建的发送者，回滚时不会留下无效的id
+            self._sender_ids.update(new_senders)
+            return len(batch)
+        except Exception as e:
+            logger.error(f"批量写入 {len(batch)} 条消息失败，改为逐条写入: {str(e)}")
+
+        written = 0
+        for row in batch:
+            new_senders = {}
+            try:
+                with db.atomic():
+                    db.execute_sql(_INSERT_SQL, self._to_params(row, new_senders))
+                self._sender_ids.update(new_senders)
+                written += 1
+            except Exception:
+                logger.exception(f"存储消息失败: {row.get('message_id')}")
+        return written
+
+
+class MessageFlushTask(AsyncTask):
+    """定时写入缓冲消息的任务"""
+
+    def __init__(self):
+        super().__init__(task_name="Message Flush Task", run_interval=FLUSH_INTERVAL)
+
+    async def run(self):
+        message_write_buffer.flush()
+
+
+message_write_buffer = MessageWriteBuffer()
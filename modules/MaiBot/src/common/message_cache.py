@@ -0,0 +1,100 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.common.logger import get_logger
+
+logger = get_logger("message_cache")
+
+RECENT_MESSAGE_LIMIT = 100  # 每个聊天缓存的最近消息条数
+MAX_CACHED_CHATS = 200  # 最多缓存的聊天数，超出时移除最久没有查询过的聊天
+
+
+class _ChatMessages:
+    """一个聊天的最近消息，按时间升序排列"""
+
+    __slots__ = ("messages", "times", "since")
+
+    def __init__(self, messages: List[Dict[str, Any]], since: float):
+        self.messages = messages
+        self.times = [message["time"] for message in messages]
+        self.since = since
+        """缓存中包含该聊天 time > since 的全部消息"""
+
+
+class RecentMessageCache:
+    """各聊天最近消息的内存缓存
+
+    每个聊天保存最新的若干条消息（与 find_messages 返回的字典格式相同），以及缓存完整覆盖的时间范围。
+    聊天第一次被查询时从数据库加载，之后存储新消息时同步追加，超出条数时丢弃最早的消息并相应缩小覆盖范围。
+    message_repository 在查询范围完全落在覆盖范围内时直接由缓存回答，否则仍查询数据库。
+    """
+
+    def __init__(self, size: int = RECENT_MESSAGE_LIMIT, max_chats: int = MAX_CACHED_CHATS):
+        self.size = size
+        self._max_chats = max_chats
+        self._chats: "OrderedDict[str, _ChatMessages]" = OrderedDict()
+        self.hits = 0
+        """由缓存回答的查询数"""
+        self.misses = 0
+        """缓存不能覆盖、转为查询数据库的查询数"""
+
+    def get(self, chat_id: str) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """获取聊天的缓存消息（按时间升序，不要修改）和覆盖范围的下界，聊天未缓存时返回 None"""
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            return None
+        self._chats.move_to_end(chat_id)
+        return chat.messages, chat.since
+
+    def seed(self, chat_id: str, messages: List[Dict[str, Any]]):
+        """以聊天中最新的消息初始化缓存
+
+        Args:
+            chat_id: 聊天ID
+            messages: 该聊天最新的至多 size 条消息（按时间升序，需包含写入缓冲中尚未写入数据库的消息）
+        """
+        messages = [dict(message) for message in messages[-self.size :]]
+        # 不足 size 条时说明聊天中的消息已全部加载
+        since = messages[0]["time"] if len(messages) >= self.size else float("-inf")
+        self._chats[chat_id] = _ChatMessages(messages, since)
+        self._chats.move_to_end(chat_id)
+        logger.debug(f"已缓存聊天 {chat_id} 最近的 {len(messages)} 条消息")
+        while len(self._chats) > self._max_chats:
+            self._chats.popitem(last=False)
+
+    def add(self, row: Dict[str, Any]):
+        """记录一条新存储的消息。只更新已缓存的聊天，未缓存的聊天在下次查询时从数据库加载"""
+        chat = self._chats.get(row["chat_id"])
+        if chat is None or row["time"] <= chat.since:
+            return
+        # 消息一般按时间顺序到达，个别时间较早的消息插入到对应位置
+        index = bisect_right(chat.times, row["time"])
+        chat.times.insert(index, row["time"])
+        chat.messages.insert(index, {"id": None, **row})
+        if len(chat.messages) > self.size:
+            chat.since = chat.times.pop(0)
+            chat.messages.pop(0)
+
+    def update(self, message_id: str, chat_id: Optional[str] = None, **fields):
+        """修改缓存中指定ID的消息，与对数据库中消息的修改保持一致
+
+        Args:
+            message_id: 消息ID
+            chat_id: 消息所在的聊天，为 None 时在所有缓存的聊天中查找
+            **fields: 要修改的字段
+        """
+        chats = list(self._chats.values()) if chat_id is None else [self._chats.get(chat_id)]
+        for chat in chats:
+            if chat is None:
+                continue
+            for message in chat.messages:
+                if message["message_id"] == message_id:
+                    message.update(fields)
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取缓存统计（自启动以来）"""
+        return {"chats": len(self._chats), "hits": self.hits, "misses": self.misses}
+
+
+recent_message_cache = RecentMessageCache()
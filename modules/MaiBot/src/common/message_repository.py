@@ -1,8 +1,11 @@
-from src.common.database.database_model import Messages  # 更改导入
+from src.common.database.database_model import MessageView  # 查询展开了聊天流和发送者信息的消息视图
 from src.common.logger import get_logger
+from src.common.message_buffer import message_write_buffer
+from src.common.message_cache import recent_message_cache
 import traceback
+from collections import Counter
 from typing import List, Any, Optional
-from peewee import Model  # 添加 Peewee Model 导入
+from peewee import Model, SQL, fn  # 添加 Peewee Model 导入
 
 logger = get_logger(__name__)
 
@@ -14,11 +17,278 @@ def _model_to_dict(model_instance: Model) -> dict[str, Any]:
     return model_instance.__data__
 
 
+def _apply_filter(query, message_filter: dict[str, Any]):
+    """
+    将 MongoDB 风格的过滤器字典转换为 Peewee 条件并应用到查询上。
+    """
+    if not message_filter:
+        return query
+    conditions = []
+    for key, value in message_filter.items():
+        if hasattr(MessageView, key):
+            field = getattr(MessageView, key)
+            if isinstance(value, dict):
+                # 处理 MongoDB 风格的操作符
+                for op, op_value in value.items():
+                    if op == "$gt":
+                        conditions.append(field > op_value)
+                    elif op == "$lt":
+                        conditions.append(field < op_value)
+                    elif op == "$gte":
+                        conditions.append(field >= op_value)
+                    elif op == "$lte":
+                        conditions.append(field <= op_value)
+                    elif op == "$ne":
+                        conditions.append(field != op_value)
+                    elif op == "$in":
+                        conditions.append(field.in_(op_value))
+                    elif op == "$nin":
+                        conditions.append(field.not_in(op_value))
+                    else:
+                        logger.warning(f"过滤器中遇到未知操作符 '{op}' (字段: '{key}')。将跳过此操作符。")
+            else:
+                # 直接相等比较
+                conditions.append(field == value)
+        else:
+            logger.warning(f"过滤器键 '{key}' 在 MessageView 模型中未找到。将跳过此条件。")
+    if conditions:
+        query = query.where(*conditions)
+    return query
+
+
+def _match_condition(value: Any, op: str, op_value: Any) -> bool:
+    """
+    按数据库查询的语义判断单个操作符条件，NULL 与任何值比较都不成立，未知操作符视为成立（与查询时跳过一致）。
+    """
+    if value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > op_value
+        if op == "$lt":
+            return value < op_value
+        if op == "$gte":
+            return value >= op_value
+        if op == "$lte":
+            return value <= op_value
+        if op == "$ne":
+            return value != op_value
+        if op == "$in":
+            return value in op_value
+        if op == "$nin":
+            return value not in op_value
+    except TypeError:
+        return False
+    return True
+
+
+def _normalize_filter(message_filter: dict[str, Any]) -> dict[str, Any]:
+    """
+    按字段类型转换过滤器中的取值（如数字的 user_id 转为字符串），在内存中比较时与数据库查询的结果一致。
+    """
+    fields = MessageView._meta.fields
+    normalized = {}
+    for key, value in (message_filter or {}).items():
+        field = fields.get(key)
+        if field is None:
+            normalized[key] = value
+        elif isinstance(value, dict):
+            normalized[key] = {
+                op: [field.db_value(item) for item in op_value] if op in ("$in", "$nin") else field.db_value(op_value)
+                for op, op_value in value.items()
+            }
+        else:
+            normalized[key] = field.db_value(value)
+    return normalized
+
+
+def _match_filter(row: dict[str, Any], message_filter: dict[str, Any]) -> bool:
+    """
+    判断一条内存中的消息是否满足（经过 _normalize_filter 转换的）过滤器，与 _apply_filter 生成的查询条件一致。
+    """
+    for key, value in message_filter.items():
+        if key not in row:
+            continue
+        if isinstance(value, dict):
+            if not all(_match_condition(row[key], op, op_value) for op, op_value in value.items()):
+                return False
+        elif row[key] != value:
+            return False
+    return True
+
+
+def _pending_messages(message_filter: dict[str, Any]) -> List[dict[str, Any]]:
+    """
+    写入缓冲中满足过滤器的消息，格式与 _model_to_dict 的结果一致（尚未分配 id）。
+    """
+    message_filter = _normalize_filter(message_filter)
+    return [{"id": None, **row} for row in message_write_buffer.pending() if _match_filter(row, message_filter)]
+
+
+def _sort_and_limit(
+    messages: List[dict[str, Any]],
+    sort: Optional[List[tuple[str, int]]],
+    limit: int,
+    limit_mode: str,
+) -> List[dict[str, Any]]:
+    """
+    在内存中按与数据库查询相同的规则排序和截取消息。
+    """
+    if limit > 0:
+        messages.sort(key=lambda msg: msg["time"])
+        return messages[:limit] if limit_mode == "earliest" else messages[-limit:]
+    # 多个排序条件时从最后一个开始依次稳定排序，NULL 与数据库中一样排在最小的位置
+    for field_name, direction in reversed(sort or []):
+        if field_name in MessageView._meta.fields and direction in (1, -1):
+            messages.sort(
+                key=lambda msg: (msg[field_name] is not None, msg[field_name]),
+                reverse=direction == -1,
+            )
+    return messages
+
+
+def _covers_time(time_filter: Any, since: float) -> bool:
+    """
+    时间条件是否保证所有结果都满足 time > since（即完全落在缓存覆盖的范围内）。
+    """
+    if time_filter is None:
+        return False
+    if not isinstance(time_filter, dict):
+        return time_filter > since
+    return any(
+        (op == "$gt" and value >= since) or (op == "$gte" and value > since) for op, value in time_filter.items()
+    )
+
+
+def _find_recent(message_filter: dict[str, Any], limit: int = 0, limit_mode: str = "latest") -> Optional[List[dict]]:
+    """
+    尝试由最近消息缓存回答按单个聊天筛选的查询，返回缓存中满足过滤器的消息（按时间升序，不要修改）。
+    缓存不能确定完整覆盖查询范围时返回 None，由调用方查询数据库。
+    """
+    chat_id = (message_filter or {}).get("chat_id")
+    if not isinstance(chat_id, str):
+        return None
+    cached = recent_message_cache.get(chat_id)
+    if cached is None:
+        recent_message_cache.seed(
+            chat_id, _find_in_database({"chat_id": chat_id}, limit=recent_message_cache.size, limit_mode="latest")
+        )
+        cached = recent_message_cache.get(chat_id)
+    messages, since = cached
+
+    message_filter = _normalize_filter(message_filter)
+    matched = [row for row in messages if row["time"] > since and _match_filter(row, message_filter)]
+    # 时间下界在覆盖范围内时结果完整；只取最新 limit 条时，覆盖范围内已有足够的消息也可以直接回答
+    if _covers_time(message_filter.get("time"), since) or (
+        limit > 0 and limit_mode != "earliest" and len(matched) >= limit
+    ):
+        recent_message_cache.hits += 1
+        return matched
+    recent_message_cache.misses += 1
+    return None
+
+
+def preload_recent_messages(chat_ids: List[str]):
+    """
+    预先将聊天最近的消息加载到缓存中（已缓存的聊天跳过）。
+    """
+    for chat_id in chat_ids:
+        if recent_message_cache.get(chat_id) is None:
+            recent_message_cache.seed(
+                chat_id, _find_in_database({"chat_id": chat_id}, limit=recent_message_cache.size, limit_mode="latest")
+            )
+
+
+def _resolve_fields(fields: Optional[List[str]]) -> Optional[List[str]]:
+    """
+    检查 find_messages 的 fields 参数，跳过不存在的字段；没有有效字段时返回 None（返回全部字段）。
+    """
+    if not fields:
+        return None
+    resolved = []
+    for field_name in fields:
+        if field_name in MessageView._meta.fields:
+            resolved.append(field_name)
+        else:
+            logger.warning(f"投影字段 '{field_name}' 在 MessageView 模型中未找到。将跳过此字段。")
+    return resolved or None
+
+
+def _build_find_query(
+    message_filter: dict[str, Any],
+    sort: Optional[List[tuple[str, int]]] = None,
+    limit: int = 0,
+    limit_mode: str = "latest",
+    fields: Optional[List[str]] = None,
+):
+    """
+    构建 find_messages 使用的查询，参数含义同 find_messages。
+    单独拆出以便检查查询计划（见 scripts/check_message_query_plans.py）。
+    指定 fields 时只查询这些字段以及排序、合并结果所需的 time 和排序字段。
+    """
+    columns = []
+    if fields:
+        selected = list(fields)
+        for field_name in ["time"] + [field_name for field_name, _ in sort or []]:
+            if field_name in MessageView._meta.fields and field_name not in selected:
+                selected.append(field_name)
+        columns = [getattr(MessageView, field_name) for field_name in selected]
+    query = _apply_filter(MessageView.select(*columns), message_filter)
+
+    if limit > 0:
+        if limit_mode == "earliest":
+            # 获取时间最早的 limit 条记录，已经是正序
+            return query.order_by(MessageView.time.asc()).limit(limit)
+        # 默认为 'latest'，获取时间最晚的 limit 条记录
+        return query.order_by(MessageView.time.desc()).limit(limit)
+
+    # limit 为 0 时，应用传入的 sort 参数
+    if sort:
+        peewee_sort_terms = []
+        for field_name, direction in sort:
+            if hasattr(MessageView, field_name):
+                field = getattr(MessageView, field_name)
+                if direction == 1:  # ASC
+                    peewee_sort_terms.append(field.asc())
+                elif direction == -1:  # DESC
+                    peewee_sort_terms.append(field.desc())
+                else:
+                    logger.warning(f"字段 '{field_name}' 的排序方向 '{direction}' 无效。将跳过此排序条件。")
+            else:
+                logger.warning(f"排序字段 '{field_name}' 在 MessageView 模型中未找到。将跳过此排序条件。")
+        if peewee_sort_terms:
+            query = query.order_by(*peewee_sort_terms)
+    return query
+
+
+def _find_in_database(
+    message_filter: dict[str, Any],
+    sort: Optional[List[tuple[str, int]]] = None,
+    limit: int = 0,
+    limit_mode: str = "latest",
+    fields: Optional[List[str]] = None,
+) -> List[dict[str, Any]]:
+    """
+    从数据库（以及写入缓冲）中查找消息，不经过最近消息缓存，参数含义同 find_messages。
+    指定 fields 时结果中可能还带有排序所需的字段，由调用方按 fields 截取。
+    """
+    # 直接取出字典，不必为每一行构造模型实例
+    results = list(_build_find_query(message_filter, sort, limit, limit_mode, fields).dicts())
+    if limit > 0 and limit_mode != "earliest":
+        # 最新的记录是倒序取出的，将结果按时间正序排列
+        results.sort(key=lambda msg: msg["time"])
+    pending = _pending_messages(message_filter)
+    if pending:
+        results = _sort_and_limit(results + pending, sort, limit, limit_mode)
+    return results
+
+
 def find_messages(
     message_filter: dict[str, Any],
     sort: Optional[List[tuple[str, int]]] = None,
     limit: int = 0,
     limit_mode: str = "latest",
+    fields: Optional[List[str]] = None,
 ) -> List[dict[str, Any]]:
     """
     根据提供的过滤器、排序和限制条件查找消息。
@@ -28,77 +298,23 @@ def find_messages(
         sort: 排序条件列表，例如 [('time', 1)] (1 for asc, -1 for desc)。仅在 limit 为 0 时生效。
         limit: 返回的最大文档数，0表示不限制。
         limit_mode: 当 limit > 0 时生效。 'earliest' 表示获取最早的记录， 'latest' 表示获取最新的记录（结果仍按时间正序排列）。默认为 'latest'。
+        fields: 只查询并返回这些字段，例如 ['chat_id', 'time']。默认为 None，返回全部字段。
 
     Returns:
-        消息字典列表，如果出错则返回空列表。
+        消息字典列表，如果出错则返回空列表。结果包含写入缓冲中尚未写入数据库的消息。
+        按单个聊天查询最近的消息时由最近消息缓存回答，不查询数据库。
     """
     try:
-        query = Messages.select()
-
-        # 应用过滤器
-        if message_filter:
-            conditions = []
-            for key, value in message_filter.items():
-                if hasattr(Messages, key):
-                    field = getattr(Messages, key)
-                    if isinstance(value, dict):
-                        # 处理 MongoDB 风格的操作符
-                        for op, op_value in value.items():
-                            if op == "$gt":
-                                conditions.append(field > op_value)
-                            elif op == "$lt":
-                                conditions.append(field < op_value)
-                            elif op == "$gte":
-                                conditions.append(field >= op_value)
-                            elif op == "$lte":
-                                conditions.append(field <= op_value)
-                            elif op == "$ne":
-                                conditions.append(field != op_value)
-                            elif op == "$in":
-                                conditions.append(field.in_(op_value))
-                            elif op == "$nin":
-                                conditions.append(field.not_in(op_value))
-                            else:
-                                logger.warning(f"过滤器中遇到未知操作符 '{op}' (字段: '{key}')。将跳过此操作符。")
-                    else:
-                        # 直接相等比较
-                        conditions.append(field == value)
-                else:
-                    logger.warning(f"过滤器键 '{key}' 在 Messages 模型中未找到。将跳过此条件。")
-            if conditions:
-                query = query.where(*conditions)
-
-        if limit > 0:
-            if limit_mode == "earliest":
-                # 获取时间最早的 limit 条记录，已经是正序
-                query = query.order_by(Messages.time.asc()).limit(limit)
-                peewee_results = list(query)
-            else:  # 默认为 'latest'
-                # 获取时间最晚的 limit 条记录
-                query = query.order_by(Messages.time.desc()).limit(limit)
-                latest_results_peewee = list(query)
-                # 将结果按时间正序排列
-                peewee_results = sorted(latest_results_peewee, key=lambda msg: msg.time)
+        fields = _resolve_fields(fields)
+        recent = _find_recent(message_filter, limit, limit_mode)
+        if recent is not None:
+            results = _sort_and_limit(recent, sort, limit, limit_mode)
         else:
-            # limit 为 0 时，应用传入的 sort 参数
-            if sort:
-                peewee_sort_terms = []
-                for field_name, direction in sort:
-                    if hasattr(Messages, field_name):
-                        field = getattr(Messages, field_name)
-                        if direction == 1:  # ASC
-                            peewee_sort_terms.append(field.asc())
-                        elif direction == -1:  # DESC
-                            peewee_sort_terms.append(field.desc())
-                        else:
-                            logger.warning(f"字段 '{field_name}' 的排序方向 '{direction}' 无效。将跳过此排序条件。")
-                    else:
-                        logger.warning(f"排序字段 '{field_name}' 在 Messages 模型中未找到。将跳过此排序条件。")
-                if peewee_sort_terms:
-                    query = query.order_by(*peewee_sort_terms)
-            peewee_results = list(query)
-
-        return [_model_to_dict(msg) for msg in peewee_results]
+            results = _find_in_database(message_filter, sort, limit, limit_mode, fields)
+        if fields:
+            return [{field_name: msg[field_name] for field_name in fields} for msg in results]
+        # 缓存中的记录需要复制，避免调用方修改缓存
+        return [dict(msg) for msg in results] if recent is not None else results
     except Exception as e:
         log_message = (
             f"使用 Peewee 查找消息失败 (filter={message_filter}, sort={sort}, limit={limit}, limit_mode={limit_mode}): {e}\n"
@@ -116,54 +332,80 @@ def count_messages(message_filter: dict[str, Any]) -> int:
         message_filter: 查询过滤器字典，键为模型字段名，值为期望值或包含操作符的字典 (例如 {'$gt': value}).
 
     Returns:
-        符合条件的消息数量，如果出错则返回 0。
+        符合条件的消息数量，如果出错则返回 0。计数包含写入缓冲中尚未写入数据库的消息。
+        按单个聊天统计最近的消息时由最近消息缓存回答，不查询数据库。
     """
     try:
-        query = Messages.select()
-
-        # 应用过滤器
-        if message_filter:
-            conditions = []
-            for key, value in message_filter.items():
-                if hasattr(Messages, key):
-                    field = getattr(Messages, key)
-                    if isinstance(value, dict):
-                        # 处理 MongoDB 风格的操作符
-                        for op, op_value in value.items():
-                            if op == "$gt":
-                                conditions.append(field > op_value)
-                            elif op == "$lt":
-                                conditions.append(field < op_value)
-                            elif op == "$gte":
-                                conditions.append(field >= op_value)
-                            elif op == "$lte":
-                                conditions.append(field <= op_value)
-                            elif op == "$ne":
-                                conditions.append(field != op_value)
-                            elif op == "$in":
-                                conditions.append(field.in_(op_value))
-                            elif op == "$nin":
-                                conditions.append(field.not_in(op_value))
-                            else:
-                                logger.warning(
-                                    f"计数时，过滤器中遇到未知操作符 '{op}' (字段: '{key}')。将跳过此操作符。"
-                                )
-                    else:
-                        # 直接相等比较
-                        conditions.append(field == value)
-                else:
-                    logger.warning(f"计数时，过滤器键 '{key}' 在 Messages 模型中未找到。将跳过此条件。")
-            if conditions:
-                query = query.where(*conditions)
-
-        count = query.count()
-        return count
+        recent = _find_recent(message_filter)
+        if recent is not None:
+            return len(recent)
+        return _apply_filter(MessageView.select(), message_filter).count() + len(_pending_messages(message_filter))
     except Exception as e:
         log_message = f"使用 Peewee 计数消息失败 (message_filter={message_filter}): {e}\n{traceback.format_exc()}"
         logger.error(log_message)
         return 0
 
 
+def count_and_total_length(message_filter: dict[str, Any], field_name: str = "processed_plain_text") -> tuple[int, int]:
+    """
+    在一次查询中计算消息数量和某个文本字段的总长度，不取出消息本身。
+
+    Args:
+        message_filter: 查询过滤器字典，格式同 count_messages。
+        field_name: 计算长度的文本字段，默认为 processed_plain_text。为 NULL 的记录长度计为 0。
+
+    Returns:
+        (消息数量, 文本总长度)，如果出错则返回 (0, 0)。包含写入缓冲中尚未写入数据库的消息。
+    """
+    try:
+        count, total_length = 0, 0
+        rows = _find_recent(message_filter)
+        if rows is None:
+            field = getattr(MessageView, field_name)
+            count, total_length = _apply_filter(
+                MessageView.select(fn.COUNT(SQL("*")), fn.COALESCE(fn.SUM(fn.LENGTH(field)), 0)), message_filter
+            ).scalar(as_tuple=True)
+            rows = _pending_messages(message_filter)
+        return count + len(rows), total_length + sum(len(row[field_name] or "") for row in rows)
+    except Exception as e:
+        log_message = (
+            f"使用 Peewee 统计消息长度失败 (message_filter={message_filter}, field_name={field_name}): {e}\n"
+            + traceback.format_exc()
+        )
+        logger.error(log_message)
+        return 0, 0
+
+
+def count_messages_by_field(message_filter: dict[str, Any], group_field: str) -> dict[Any, int]:
+    """
+    按字段分组计算消息数量，不取出消息本身。
+
+    Args:
+        message_filter: 查询过滤器字典，格式同 count_messages。
+        group_field: 分组字段，例如 'user_id'。
+
+    Returns:
+        {字段值: 消息数量}，没有消息的取值不出现在结果中，如果出错则返回空字典。包含写入缓冲中尚未写入数据库的消息。
+    """
+    try:
+        counts = Counter()
+        rows = _find_recent(message_filter)
+        if rows is None:
+            field = getattr(MessageView, group_field)
+            query = _apply_filter(MessageView.select(field, fn.COUNT(SQL("*"))), message_filter).group_by(field)
+            counts.update(dict(query.tuples()))
+            rows = _pending_messages(message_filter)
+        counts.update(row[group_field] for row in rows)
+        return dict(counts)
+    except Exception as e:
+        log_message = (
+            f"使用 Peewee 分组计数消息失败 (message_filter={message_filter}, group_field={group_field}): {e}\n"
+            + traceback.format_exc()
+        )
+        logger.error(log_message)
+        return {}
+
+
 # 你可以在这里添加更多与 messages 集合相关的数据库操作函数，例如 find_one_message, insert_message 等。
-# 注意：对于 Peewee，插入操作通常是 Messages.create(...) 或 instance.save()。
-# 查找单个消息可以是 Messages.get_or_none(...) 或 query.first()。
+# 注意：插入消息通过 message_write_buffer.add(...) 批量写入 Messages 表，查询时使用 MessageView。
+# 查找单个消息可以是 MessageView.get_or_none(...) 或 query.first()。
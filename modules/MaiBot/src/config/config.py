@@ -21,6 +21,7 @@ from src.config.official_configs import (
     NormalChatConfig,
     FocusChatConfig,
     EmojiConfig,
+    ImageDedupConfig,
     MemoryConfig,
     MoodConfig,
     KeywordReactionConfig,
@@ -35,6 +36,10 @@ from src.config.official_configs import (
     LPMMKnowledgeConfig,
     RelationshipConfig,
     ToolConfig,
+    LLMProviderConfig,
+    LLMCacheConfig,
+    SegmentationCacheConfig,
+    LLMHedgeConfig,
 )
 
 install(extra_lines=3)
@@ -152,6 +157,7 @@ class Config(ConfigBase):
     normal_chat: NormalChatConfig
     focus_chat: FocusChatConfig
     emoji: EmojiConfig
+    image_dedup: ImageDedupConfig
     expression: ExpressionConfig
     memory: MemoryConfig
     mood: MoodConfig
@@ -165,6 +171,10 @@ class Config(ConfigBase):
     maim_message: MaimMessageConfig
     lpmm_knowledge: LPMMKnowledgeConfig
     tool: ToolConfig
+    llm_provider: LLMProviderConfig
+    llm_cache: LLMCacheConfig
+    segmentation_cache: SegmentationCacheConfig
+    llm_hedge: LLMHedgeConfig
 
 
 def load_config(config_path: str) -> Config:
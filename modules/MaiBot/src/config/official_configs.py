@@ -381,6 +381,23 @@ class EmojiConfig(ConfigBase):
     """表情包过滤要求"""
 
 
+@dataclass
+class ImageDedupConfig(ConfigBase):
+    """图片近似去重配置类"""
+
+    enable: bool = True
+    """是否识别重新编码、缩放过的同一张图片，复用已有的描述和文件"""
+
+    max_distance: int = 6
+    """感知哈希（64位）的汉明距离不超过该值的图片作为候选，再逐像素比较确认"""
+
+    max_pixel_difference: float = 0.75
+    """
+    候选图片与已有图片的64x64灰度缩略图（按亮度均值和标准差归一化）逐像素差值的最大值不超过该值时才视为同一张图片
+    同一模板只改了文字的表情包感知哈希距离往往也很小，但在文字处的差值很大，不会被误判；越大越容易把不同图片误判为相同
+    """
+
+
 @dataclass
 class MemoryConfig(ConfigBase):
     """记忆配置类"""
@@ -430,6 +447,24 @@ class MemoryConfig(ConfigBase):
     memory_ban_words: list[str] = field(default_factory=lambda: ["表情包", "图片", "回复", "聊天记录"])
     """不允许记忆的词列表"""
 
+    memory_build_concurrency: int = 4
+    """记忆构建时同时进行的LLM请求数量上限"""
+
+    memory_build_sample_concurrency: int = 2
+    """记忆构建时同时处理的样本数量"""
+
+    memory_summary_timeout: float = 60.0
+    """单个记忆主题概括请求的超时时间（秒），从请求发出时开始计算，排队等待的时间不计入"""
+
+    enable_embedding_recall: bool = False
+    """是否使用向量检索召回记忆（使用嵌入模型代替LLM提取关键词）"""
+
+    embedding_recall_top_k: int = 5
+    """向量检索时召回的记忆节点数量"""
+
+    embedding_recall_threshold: float = 0.5
+    """向量检索时记忆节点的最低余弦相似度"""
+
 
 @dataclass
 class MoodConfig(ConfigBase):
@@ -539,6 +574,9 @@ class ResponseSplitterConfig(ConfigBase):
     enable_kaomoji_protection: bool = False
     """是否启用颜文字保护"""
 
+    enable_streaming_reply: bool = False
+    """是否流式生成回复，模型每输出一句完整的话就立即发送，而不是等待全部生成完毕"""
+
 
 @dataclass
 class TelemetryConfig(ConfigBase):
@@ -629,6 +667,112 @@ class LPMMKnowledgeConfig(ConfigBase):
     """QA最终结果的Top K数量"""
 
 
+@dataclass
+class LLMProviderConfig(ConfigBase):
+    """LLM服务商连接配置类"""
+
+    max_connections: int = 16
+    """每个服务商的HTTP连接池大小"""
+
+    provider_max_connections: dict[str, int] = field(default_factory=lambda: {})
+    """按服务商单独设置的连接池大小，键为服务商名称（如 SILICONFLOW）"""
+
+    keepalive_timeout: float = 30.0
+    """空闲连接的保活时间（秒）"""
+
+    dns_cache_ttl: int = 300
+    """DNS解析结果的缓存时间（秒）"""
+
+    max_concurrent_requests: int = 0
+    """每个服务商同时进行的请求数上限，0为不限制"""
+
+    rpm: int = 0
+    """每个服务商每分钟的请求数上限，0为不限制"""
+
+    tpm: int = 0
+    """每个服务商每分钟的token数上限（按估计值预扣，请求完成后按实际用量修正），0为不限制"""
+
+    provider_limits: dict[str, dict[str, int]] = field(default_factory=lambda: {})
+    """按服务商单独设置的限制，键为服务商名称，值可包含 max_concurrent_requests、rpm、tpm"""
+
+    high_priority_request_types: list[str] = field(
+        default_factory=lambda: [
+            "focus.replyer",
+            "normal.replyer",
+            "reply_generation",
+            "focus.planner",
+            "normal.planner",
+            "tool_executor",
+            "action_planning",
+        ]
+    )
+    """优先发送的请求类型（匹配request_type本身及以"类型."开头的子类型）"""
+
+    low_priority_request_types: list[str] = field(
+        default_factory=lambda: ["memory.build", "expressor.learner", "individuality", "relationship"]
+    )
+    """最后发送的后台请求类型"""
+
+
+@dataclass
+class LLMCacheConfig(ConfigBase):
+    """LLM响应缓存配置类"""
+
+    enable: bool = False
+    """是否启用LLM响应缓存"""
+
+    request_types: list[str] = field(default_factory=lambda: ["action.judge", "image"])
+    """
+    启用缓存的请求类型（匹配request_type本身及以"类型."开头的子类型），只应包含相同prompt期望相同结果的请求
+    记忆构建与记忆检索（memory、memory.build）的结果不应复用
+    """
+
+    ttl: int = 3600
+    """缓存有效期（秒）"""
+
+    max_entries: int = 1000
+    """内存中最多缓存的响应数，超出时淘汰最久未使用的"""
+
+    persistent: bool = False
+    """是否将缓存持久化到数据库，重启后仍可命中"""
+
+
+@dataclass
+class SegmentationCacheConfig(ConfigBase):
+    """分词缓存配置类"""
+
+    max_entries: int = 20000
+    """最多缓存的分词结果数，超出时淘汰最久未使用的"""
+
+    max_memory_mb: int = 32
+    """分词缓存的内存占用上限（MB，估算值）"""
+
+
+@dataclass
+class LLMHedgeConfig(ConfigBase):
+    """LLM请求对冲配置类"""
+
+    enable: bool = False
+    """是否启用请求对冲"""
+
+    request_types: list[str] = field(
+        default_factory=lambda: ["focus.replyer", "normal.replyer", "focus.planner", "normal.planner"]
+    )
+    """启用对冲的请求类型（匹配request_type本身及以"类型."开头的子类型），只应包含对延迟敏感的请求"""
+
+    deadline_percentile: float = 90
+    """主模型超过其最近耗时的该百分位数仍未返回时，向备用模型发出请求"""
+
+    default_deadline: float = 5.0
+    """主模型的耗时样本不足时使用的截止时间（秒）"""
+
+    min_deadline: float = 1.0
+    """截止时间的下限（秒）"""
+
+    backup_model: str = ""
+    """备用模型，填写[model]中的模型名称（如"utils"），为空时仅回复器在两个回复模型之间对冲"""
+
+
 @dataclass
 class ModelConfig(ConfigBase):
     """模型配置类"""
@@ -3,7 +3,7 @@ from typing import List, Dict, Any, Callable
 
 from playhouse import shortcuts
 
-from src.common.database.database_model import Messages  # Peewee Messages 模型导入
+from src.common.database.database_model import MessageView  # 展开了聊天流和发送者信息的消息视图
 
 model_to_dict: Callable[..., dict] = shortcuts.model_to_dict  # Peewee 模型转换为字典的快捷函数
 
@@ -57,9 +57,9 @@ class PeeweeMessageStorage(MessageStorage):
 
     async def get_messages_after(self, chat_id: str, message_time: float) -> List[Dict[str, Any]]:
         query = (
-            Messages.select()
-            .where((Messages.chat_id == chat_id) & (Messages.time > message_time))
-            .order_by(Messages.time.asc())
+            MessageView.select()
+            .where((MessageView.chat_id == chat_id) & (MessageView.time > message_time))
+            .order_by(MessageView.time.asc())
         )
 
         # print(f"storage_check_message: {message_time}")
@@ -68,9 +68,9 @@ class PeeweeMessageStorage(MessageStorage):
 
     async def get_messages_before(self, chat_id: str, time_point: float, limit: int = 5) -> List[Dict[str, Any]]:
         query = (
-            Messages.select()
-            .where((Messages.chat_id == chat_id) & (Messages.time < time_point))
-            .order_by(Messages.time.desc())
+            MessageView.select()
+            .where((MessageView.chat_id == chat_id) & (MessageView.time < time_point))
+            .order_by(MessageView.time.desc())
             .limit(limit)
         )
 
@@ -80,7 +80,7 @@ class PeeweeMessageStorage(MessageStorage):
         return [model_to_dict(msg) for msg in messages_models]
 
     async def has_new_messages(self, chat_id: str, after_time: float) -> bool:
-        return Messages.select().where((Messages.chat_id == chat_id) & (Messages.time > after_time)).exists()
+        return MessageView.select().where((MessageView.chat_id == chat_id) & (MessageView.time > after_time)).exists()
 
 
 # # 创建一个内存消息存储实现，用于测试
@@ -23,7 +23,7 @@ class KnowledgeFetcher:
         )
         self.private_name = private_name
 
-    def _lpmm_get_knowledge(self, query: str) -> str:
+    async def _lpmm_get_knowledge(self, query: str) -> str:
         """获取相关知识
 
         Args:
@@ -35,7 +35,7 @@ class KnowledgeFetcher:
 
         logger.debug(f"[私聊][{self.private_name}]正在从LPMM知识库中获取知识")
         try:
-            knowledge_info = qa_manager.get_knowledge(query)
+            knowledge_info = await qa_manager.get_knowledge_async(query)
             logger.debug(f"[私聊][{self.private_name}]LPMM知识库查询结果: {knowledge_info:150}")
             return knowledge_info
         except Exception as e:
@@ -80,7 +80,7 @@ class KnowledgeFetcher:
             sources_text = "，".join(sources)
 
         knowledge_text += "\n现在有以下**知识**可供参考：\n "
-        knowledge_text += self._lpmm_get_knowledge(query)
+        knowledge_text += await self._lpmm_get_knowledge(query)
         knowledge_text += "\n请记住这些**知识**，并根据**知识**回答问题。\n"
 
         return knowledge_text or "未找到相关知识", sources_text or "无记忆匹配"
@@ -0,0 +1,210 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, asdict, field
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from src.common.logger import get_logger
+from src.config.config import global_config
+from src.llm_models.rate_scheduler import match_request_type
+from src.llm_models.utils_model import LLMRequest
+
+logger = get_logger("llm_hedge")
+
+LATENCY_HISTORY_SIZE = 200  # 每个模型保留的最近耗时样本数
+MIN_LATENCY_SAMPLES = 10  # 样本数少于该值时使用默认截止时间
+
+
+@dataclass
+class HedgeResult:
+    """一次（可能发出了对冲请求的）LLM请求的结果"""
+
+    model_name: str
+    """返回结果的模型"""
+
+    hedged: bool
+    """是否向备用模型发出了请求"""
+
+    failover: bool
+    """是否因主模型失败而由备用模型完成"""
+
+    latency: float
+    """总耗时（秒）"""
+
+    latency_saved: float
+    """估计节省的时间（秒）"""
+
+
+@dataclass
+class HedgeStats:
+    """单个请求类型的对冲统计"""
+
+    requests: int = 0
+    """请求数"""
+
+    hedged: int = 0
+    """发出对冲请求的次数"""
+
+    failovers: int = 0
+    """主模型失败后由备用模型完成的次数"""
+
+    backup_wins: int = 0
+    """备用模型先返回结果的次数（含失败切换）"""
+
+    latency_saved: float = 0.0
+    """估计节省的总时间（秒）"""
+
+    wins: Dict[str, int] = field(default_factory=dict)
+    """各模型返回结果的次数"""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转为dict，附带对冲率"""
+        data = asdict(self)
+        data["hedge_rate"] = self.hedged / self.requests if self.requests else 0.0
+        return data
+
+
+class LLMRequestHedger:
+    """对延迟敏感的请求（回复、规划）的对冲与故障切换
+
+    主模型在截止时间内没有返回时，向备用模型发出同样的请求，先成功返回的结果胜出，另一个请求被取消；
+    主模型请求失败时立即切换到备用模型，不再等待其重试。
+    截止时间取主模型最近耗时的指定百分位数，样本不足时使用配置的默认值。
+    """
+
+    def __init__(self):
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._stats: Dict[str, HedgeStats] = {}
+
+    @staticmethod
+    def is_enabled_for(request_type: str) -> bool:
+        """该请求类型是否启用对冲"""
+        hedge_config = global_config.llm_hedge
+        return hedge_config.enable and match_request_type(request_type, hedge_config.request_types)
+
+    @staticmethod
+    def create_backup_request(primary: LLMRequest) -> Optional[LLMRequest]:
+        """按配置的备用模型创建请求对象，未配置或与主模型相同时返回None"""
+        backup_model = global_config.llm_hedge.backup_model
+        if not backup_model:
+            return None
+        model_config = getattr(global_config.model, backup_model, None)
+        if not model_config or model_config.get("name") == primary.model_name:
+            return None
+        return LLMRequest(model=model_config, request_type=primary.request_type)
+
+    def record_latency(self, model_name: str, latency: float):
+        """记录模型一次请求的耗时"""
+        self._latencies.setdefault(model_name, deque(maxlen=LATENCY_HISTORY_SIZE)).append(latency)
+
+    def get_deadline(self, model_name: str) -> float:
+        """发出对冲请求前等待主模型的时间（秒）"""
+        hedge_config = global_config.llm_hedge
+        samples = self._latencies.get(model_name)
+        if not samples or len(samples) < MIN_LATENCY_SAMPLES:
+            return hedge_config.default_deadline
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * hedge_config.deadline_percentile / 100))
+        return max(hedge_config.min_deadline, ordered[index])
+
+    def _estimate_remaining(self, model_name: str, elapsed: float) -> float:
+        """估计已运行elapsed秒仍未返回的请求还需多久：历史上耗时超过elapsed的请求的平均耗时减去elapsed"""
+        longer = [latency for latency in self._latencies.get(model_name, ()) if latency > elapsed]
+        return sum(longer) / len(longer) - elapsed if longer else 0.0
+
+    async def _timed_request(self, request: LLMRequest, prompt: str, kwargs: Dict[str, Any]) -> Tuple:
+        start_time = time.monotonic()
+        response = await request.generate_response_async(prompt, **kwargs)
+        self.record_latency(request.model_name, time.monotonic() - start_time)
+        return response
+
+    @staticmethod
+    async def _first_success(tasks: Set[asyncio.Task]) -> asyncio.Task:
+        """等待第一个成功完成的任务，全部失败时抛出最后一个异常"""
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+            successes = [task for task in done if task.exception() is None]
+            if successes:
+                return successes[0]
+        raise error
+
+    async def generate_response_async(
+        self, primary: LLMRequest, prompt: str, backup: Optional[LLMRequest] = None, **kwargs
+    ) -> Tuple[Tuple, HedgeResult]:
+        """生成回复，启用对冲时在主模型超过截止时间或失败后向备用模型发出请求
+
+        Args:
+            primary: 主模型
+            prompt: prompt文本
+            backup: 备用模型，为None时使用配置中的备用模型
+
+        Returns:
+            Tuple[Tuple, HedgeResult]: 与 LLMRequest.generate_response_async 相同的响应，以及本次请求的结果
+        """
+        request_type = primary.request_type
+        if self.is_enabled_for(request_type) and backup is None:
+            backup = self.create_backup_request(primary)
+        if backup is None or not self.is_enabled_for(request_type):
+            start_time = time.monotonic()
+            response = await self._timed_request(primary, prompt, kwargs)
+            return response, HedgeResult(primary.model_name, False, False, time.monotonic() - start_time, 0.0)
+
+        start_time = time.monotonic()
+        deadline = self.get_deadline(primary.model_name)
+        primary_task = asyncio.create_task(self._timed_request(primary, prompt, kwargs))
+        backup_task = None
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=deadline)
+            if done and primary_task.exception() is None:
+                winner_task = primary_task
+            else:
+                if done:
+                    logger.warning(
+                        f"主模型 {primary.model_name} 请求失败: {primary_task.exception()}，切换到备用模型 {backup.model_name}"
+                    )
+                else:
+                    logger.info(
+                        f"主模型 {primary.model_name} {deadline:.2f}秒内未返回，向备用模型 {backup.model_name} 发出对冲请求"
+                    )
+                backup_task = asyncio.create_task(self._timed_request(backup, prompt, kwargs))
+                winner_task = await self._first_success({backup_task} if done else {primary_task, backup_task})
+        finally:
+            for task in (primary_task, backup_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+        latency = time.monotonic() - start_time
+        primary_failed = primary_task.done() and not primary_task.cancelled() and primary_task.exception() is not None
+        backup_won = winner_task is backup_task
+        latency_saved = 0.0
+        if backup_won and not primary_failed:
+            latency_saved = self._estimate_remaining(primary.model_name, latency)
+            # 被取消的主模型请求至少耗时latency，记为样本，避免截止时间只按较快的请求计算而偏低
+            self.record_latency(primary.model_name, latency)
+        model_name = backup.model_name if backup_won else primary.model_name
+        result = HedgeResult(model_name, backup_task is not None, backup_won and primary_failed, latency, latency_saved)
+
+        stats = self._stats.setdefault(request_type, HedgeStats())
+        stats.requests += 1
+        stats.wins[model_name] = stats.wins.get(model_name, 0) + 1
+        if result.hedged:
+            stats.hedged += 1
+        if result.failover:
+            stats.failovers += 1
+        if backup_won:
+            stats.backup_wins += 1
+            stats.latency_saved += latency_saved
+            logger.info(f"备用模型 {model_name} 先返回结果，耗时 {latency:.2f}秒，估计节省 {latency_saved:.2f}秒")
+        return winner_task.result(), result
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各请求类型的对冲统计（自启动以来）"""
+        return {request_type: stats.to_dict() for request_type, stats in list(self._stats.items())}
+
+
+llm_request_hedger = LLMRequestHedger()
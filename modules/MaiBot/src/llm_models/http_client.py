@@ -0,0 +1,138 @@
+import asyncio
+from dataclasses import dataclass, asdict
+from types import SimpleNamespace
+from typing import Any, Dict, Tuple
+
+import aiohttp
+
+from src.common.logger import get_logger
+from src.common.tcp_connector import get_tcp_connector
+from src.config.config import global_config
+
+logger = get_logger("llm_http_client")
+
+
+@dataclass
+class ProviderConnectionStats:
+    """单个服务商的连接统计"""
+
+    requests: int = 0
+    """发出的请求数"""
+
+    connections_created: int = 0
+    """新建的连接数（每次新建都需要DNS解析与TLS握手）"""
+
+    connections_reused: int = 0
+    """复用已有连接的请求数"""
+
+    queued: int = 0
+    """因连接池已满而排队等待连接的请求数"""
+
+    queue_wait_time: float = 0.0
+    """排队等待连接的总时长（秒）"""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转为dict，附带连接复用率与平均排队时长"""
+        data = asdict(self)
+        acquired = self.connections_created + self.connections_reused
+        data["reuse_rate"] = self.connections_reused / acquired if acquired else 0.0
+        data["avg_queue_wait_time"] = self.queue_wait_time / self.queued if self.queued else 0.0
+        return data
+
+
+class LLMClientRegistry:
+    """进程级的LLM HTTP客户端注册表
+
+    每个服务商（及事件循环）持有一个长期存在的 aiohttp.ClientSession，连接池大小按服务商配置，
+    空闲连接保活，使规划器、回复器、记忆、表达等模块对同一服务商的请求复用已建立的连接。
+    """
+
+    def __init__(self):
+        self._sessions: Dict[Tuple[str, asyncio.AbstractEventLoop], aiohttp.ClientSession] = {}
+        self._stats: Dict[str, ProviderConnectionStats] = {}
+
+    @staticmethod
+    def get_pool_size(provider: str) -> int:
+        """获取服务商的连接池大小"""
+        provider_config = global_config.llm_provider
+        return provider_config.provider_max_connections.get(provider, provider_config.max_connections)
+
+    def _build_trace_config(self, provider: str) -> aiohttp.TraceConfig:
+        """构建记录连接复用与排队情况的TraceConfig"""
+        stats = self._stats.setdefault(provider, ProviderConnectionStats())
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx: SimpleNamespace, params):
+            stats.requests += 1
+
+        async def on_connection_queued_start(session, ctx: SimpleNamespace, params):
+            stats.queued += 1
+            ctx.queued_at = asyncio.get_running_loop().time()
+
+        async def on_connection_queued_end(session, ctx: SimpleNamespace, params):
+            stats.queue_wait_time += asyncio.get_running_loop().time() - ctx.queued_at
+
+        async def on_connection_create_end(session, ctx: SimpleNamespace, params):
+            stats.connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx: SimpleNamespace, params):
+            stats.connections_reused += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    async def get_session(self, provider: str) -> aiohttp.ClientSession:
+        """获取服务商在当前事件循环中的共享会话，不存在或已关闭时创建
+
+        调用方不应关闭返回的会话，会话在 close_all 时统一关闭。
+        """
+        key = (provider, asyncio.get_running_loop())
+        session = self._sessions.get(key)
+        if session is not None and not session.closed:
+            return session
+
+        # 创建过程中不会让出事件循环，同一服务商不会被并发创建多个会话
+        pool_size = self.get_pool_size(provider)
+        connector = await get_tcp_connector(
+            limit=pool_size,
+            keepalive_timeout=global_config.llm_provider.keepalive_timeout,
+            ttl_dns_cache=global_config.llm_provider.dns_cache_ttl,
+        )
+        session = aiohttp.ClientSession(connector=connector, trace_configs=[self._build_trace_config(provider)])
+        self._sessions[key] = session
+        logger.debug(f"为服务商 {provider} 创建共享HTTP会话，连接池大小: {pool_size}")
+        return session
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各服务商的连接复用与排队统计"""
+        return {provider: stats.to_dict() for provider, stats in self._stats.items()}
+
+    async def close_all(self):
+        """关闭所有共享会话（在优雅关闭时调用）"""
+        loop = asyncio.get_running_loop()
+        sessions = self._sessions
+        self._sessions = {}
+        for (provider, session_loop), session in sessions.items():
+            if session.closed:
+                continue
+            if session_loop is not loop:
+                # 其他事件循环中的会话无法在此等待关闭，交给其连接器的析构处理
+                continue
+            try:
+                await session.close()
+            except Exception as e:
+                logger.warning(f"关闭服务商 {provider} 的HTTP会话时发生错误: {e}")
+
+        for provider, stats in self.get_stats().items():
+            logger.info(
+                f"服务商 {provider} 连接统计: 请求 {stats['requests']} 次, 新建连接 {stats['connections_created']} 个, "
+                f"连接复用率 {stats['reuse_rate']:.1%}, 排队 {stats['queued']} 次, "
+                f"平均排队 {stats['avg_queue_wait_time'] * 1000:.1f}ms"
+            )
+
+
+llm_client_registry = LLMClientRegistry()
@@ -0,0 +1,303 @@
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.common.logger import get_logger
+from src.config.config import global_config
+
+logger = get_logger("llm_scheduler")
+
+RATE_LIMITED_PAUSE = 5.0  # 收到429且没有Retry-After时，暂停向该服务商发送请求的时长（秒）
+SLOW_ACQUIRE_THRESHOLD = 1.0  # 排队超过该时长（秒）的请求会记录日志
+
+
+class RequestPriority(IntEnum):
+    """请求优先级，数值越小越先发送"""
+
+    HIGH = 0
+    """回复生成、规划等直接影响回复速度的请求"""
+
+    NORMAL = 1
+    """默认优先级"""
+
+    LOW = 2
+    """记忆构建、表达学习等后台任务"""
+
+
+def match_request_type(request_type: str, patterns: List[str]) -> bool:
+    """request_type 等于某一项，或以 "某一项." 开头"""
+    return any(request_type == pattern or request_type.startswith(f"{pattern}.") for pattern in patterns)
+
+
+def get_request_priority(request_type: str) -> RequestPriority:
+    """根据 request_type 确定请求的优先级"""
+    provider_config = global_config.llm_provider
+    if match_request_type(request_type, provider_config.high_priority_request_types):
+        return RequestPriority.HIGH
+    if match_request_type(request_type, provider_config.low_priority_request_types):
+        return RequestPriority.LOW
+    return RequestPriority.NORMAL
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """粗略估计一次请求消耗的token数（输入 + 最大输出），用于TPM限流
+
+    非ASCII字符按每字1个token、ASCII字符按每4个字符1个token估计，实际用量在请求完成后修正。
+    """
+    texts = []
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(part.get("text", "") for part in content if isinstance(part, dict))
+    embedding_input = payload.get("input")
+    if isinstance(embedding_input, str):
+        texts.append(embedding_input)
+    elif isinstance(embedding_input, list):
+        texts.extend(text for text in embedding_input if isinstance(text, str))
+
+    prompt_tokens = 0
+    for text in texts:
+        ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+        prompt_tokens += (len(text) - ascii_chars) + ascii_chars // 4
+    return prompt_tokens + (payload.get("max_tokens") or payload.get("max_completion_tokens") or 0)
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟的限额，按秒匀速补充"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """距离桶中有足够令牌还需等待的时间（超过容量的请求按容量计算）"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """按实际用量修正：delta为正表示多用，令牌可以为负，之后的请求会相应推迟"""
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+@dataclass
+class _Waiter:
+    priority: RequestPriority
+    tokens: int
+    future: asyncio.Future
+    enqueued_at: float
+
+
+@dataclass
+class PriorityStats:
+    """单个优先级的排队统计"""
+
+    granted: int = 0
+    """已放行的请求数"""
+
+    max_queue_depth: int = 0
+    """最大排队深度"""
+
+    total_wait_time: float = 0.0
+    """排队总时长（秒）"""
+
+
+@dataclass
+class SchedulerTicket:
+    """已放行请求的凭证，请求结束后必须调用 release"""
+
+    scheduler: "ProviderScheduler"
+    tokens: int
+
+    def release(self, actual_tokens: Optional[int] = None):
+        self.scheduler.release(self.tokens, actual_tokens)
+
+
+class ProviderScheduler:
+    """单个服务商的请求调度器
+
+    请求按优先级（同优先级先到先得）排队，只有在进行中的请求数、RPM与TPM令牌桶都允许时才放行，
+    从而在发送前整形流量，而不是等服务商返回429后再重试。
+    """
+
+    def __init__(self, provider: str, max_concurrent_requests: int, rpm: int, tpm: int):
+        self.provider = provider
+        self.max_concurrent_requests = max_concurrent_requests
+        self.request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.token_bucket = TokenBucket(tpm) if tpm > 0 else None
+
+        self.inflight = 0
+        """进行中的请求数"""
+
+        self.rate_limited = 0
+        """收到429的次数"""
+
+        self.stats: Dict[RequestPriority, PriorityStats] = {priority: PriorityStats() for priority in RequestPriority}
+
+        self._queue: List[Tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._paused_until = 0.0
+
+    def queue_depth(self) -> Dict[RequestPriority, int]:
+        """各优先级当前的排队数"""
+        depth = {priority: 0 for priority in RequestPriority}
+        for _, _, waiter in self._queue:
+            if not waiter.future.done():
+                depth[waiter.priority] += 1
+        return depth
+
+    async def acquire(self, priority: RequestPriority, tokens: int) -> SchedulerTicket:
+        """排队等待放行"""
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, tokens, loop.create_future(), time.monotonic())
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        depth = self.queue_depth()[priority]
+        stats = self.stats[priority]
+        stats.max_queue_depth = max(stats.max_queue_depth, depth)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已被放行但调用方在恢复执行前被取消，归还名额
+                self.release(tokens)
+            raise
+
+        wait_time = time.monotonic() - waiter.enqueued_at
+        stats.granted += 1
+        stats.total_wait_time += wait_time
+        if wait_time > SLOW_ACQUIRE_THRESHOLD:
+            logger.debug(f"服务商 {self.provider} 的{priority.name}优先级请求排队 {wait_time:.2f}秒后发送")
+        return SchedulerTicket(self, tokens)
+
+    def release(self, tokens: int, actual_tokens: Optional[int] = None):
+        """请求结束，归还并发名额并按实际用量修正TPM令牌桶"""
+        self.inflight -= 1
+        if self.token_bucket is not None and actual_tokens:
+            self.token_bucket.adjust(actual_tokens - tokens)
+        self._dispatch()
+
+    def pause(self, seconds: float):
+        """收到429后暂停放行一段时间"""
+        self.rate_limited += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._dispatch()
+
+    def _dispatch(self):
+        """按优先级放行当前允许的请求，受速率限制时在令牌足够的时刻再次调度"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._queue:
+            _, _, waiter = self._queue[0]
+            if waiter.future.done():
+                # 调用方已取消
+                heapq.heappop(self._queue)
+                continue
+            if self.max_concurrent_requests > 0 and self.inflight >= self.max_concurrent_requests:
+                # 等待进行中的请求结束后由 release 再次调度
+                return
+
+            now = time.monotonic()
+            delay = self._paused_until - now
+            if self.request_bucket is not None:
+                delay = max(delay, self.request_bucket.wait_time(1, now))
+            if self.token_bucket is not None:
+                delay = max(delay, self.token_bucket.wait_time(waiter.tokens, now))
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+
+            heapq.heappop(self._queue)
+            self.inflight += 1
+            if self.request_bucket is not None:
+                self.request_bucket.consume(1, now)
+            if self.token_bucket is not None:
+                self.token_bucket.consume(waiter.tokens, now)
+            waiter.future.set_result(None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计"""
+        depth = self.queue_depth()
+        return {
+            "inflight": self.inflight,
+            "rate_limited": self.rate_limited,
+            "priorities": {
+                priority.name: {
+                    "queue_depth": depth[priority],
+                    "max_queue_depth": stats.max_queue_depth,
+                    "granted": stats.granted,
+                    "avg_wait_time": stats.total_wait_time / stats.granted if stats.granted else 0.0,
+                }
+                for priority, stats in self.stats.items()
+            },
+        }
+
+
+class LLMRequestScheduler:
+    """所有LLM请求的中央调度器，每个服务商（及事件循环）一个 ProviderScheduler"""
+
+    def __init__(self):
+        self._schedulers: Dict[Tuple[str, asyncio.AbstractEventLoop], ProviderScheduler] = {}
+
+    @staticmethod
+    def get_limits(provider: str) -> Dict[str, int]:
+        """获取服务商的并发与速率限制（按服务商的设置覆盖全局默认值）"""
+        provider_config = global_config.llm_provider
+        limits = {
+            "max_concurrent_requests": provider_config.max_concurrent_requests,
+            "rpm": provider_config.rpm,
+            "tpm": provider_config.tpm,
+        }
+        for key, value in provider_config.provider_limits.get(provider, {}).items():
+            if key in limits:
+                limits[key] = value
+            else:
+                logger.warning(f"服务商 {provider} 的限流设置中有未知的项: {key}")
+        return limits
+
+    def get_scheduler(self, provider: str) -> ProviderScheduler:
+        key = (provider, asyncio.get_running_loop())
+        scheduler = self._schedulers.get(key)
+        if scheduler is None:
+            limits = self.get_limits(provider)
+            scheduler = ProviderScheduler(provider, **limits)
+            self._schedulers[key] = scheduler
+            logger.debug(f"为服务商 {provider} 创建请求调度器: {limits}")
+        return scheduler
+
+    async def acquire(self, provider: str, request_type: str, payload: Dict[str, Any]) -> SchedulerTicket:
+        """按 request_type 对应的优先级排队，直到服务商的并发与速率限制允许发送"""
+        return await self.get_scheduler(provider).acquire(get_request_priority(request_type), estimate_tokens(payload))
+
+    def report_rate_limited(self, provider: str, retry_after: Optional[float] = None):
+        """服务商返回429时调用，在 Retry-After（或默认时长）内暂停向其发送请求"""
+        self.get_scheduler(provider).pause(retry_after if retry_after is not None else RATE_LIMITED_PAUSE)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各服务商的调度统计（含各优先级的排队深度）"""
+        return {provider: scheduler.get_stats() for (provider, _), scheduler in self._schedulers.items()}
+
+
+llm_request_scheduler = LLMRequestScheduler()
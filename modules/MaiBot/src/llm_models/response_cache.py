@@ -0,0 +1,189 @@
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Optional, Tuple
+
+from src.common.database.database_model import LLMResponseCache
+from src.common.logger import get_logger
+from src.config.config import global_config
+from src.llm_models.rate_scheduler import match_request_type
+
+logger = get_logger("llm_cache")
+
+PURGE_INTERVAL = 100  # 每写入多少条持久化缓存清理一次过期记录
+
+
+@dataclass
+class CacheStats:
+    """单个请求类型的缓存统计"""
+
+    hits: int = 0
+    """内存缓存命中次数"""
+
+    persistent_hits: int = 0
+    """持久化缓存命中次数"""
+
+    misses: int = 0
+    """未命中次数（实际发出请求）"""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转为dict，附带命中率"""
+        data = asdict(self)
+        total = self.hits + self.persistent_hits + self.misses
+        data["hit_rate"] = (self.hits + self.persistent_hits) / total if total else 0.0
+        return data
+
+
+TUPLE_MARKER = "__tuple__"  # 序列化时标记元组，JSON本身不区分元组与列表
+
+
+def _encode_tuples(value: Any) -> Any:
+    """把响应中（任意层级的）元组替换为带标记的字典"""
+    if isinstance(value, tuple):
+        return {TUPLE_MARKER: [_encode_tuples(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode_tuples(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _encode_tuples(item) for key, item in value.items()}
+    return value
+
+
+def _decode_tuples(value: Any) -> Any:
+    """还原 _encode_tuples 标记的元组"""
+    if isinstance(value, list):
+        return [_decode_tuples(item) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1 and TUPLE_MARKER in value:
+            return tuple(_decode_tuples(item) for item in value[TUPLE_MARKER])
+        return {key: _decode_tuples(item) for key, item in value.items()}
+    return value
+
+
+def _dump_response(response: Any) -> str:
+    """序列化响应，保留各层级的元组以便还原"""
+    return json.dumps({"value": _encode_tuples(response)}, ensure_ascii=False)
+
+
+def _load_response(data: str) -> Any:
+    record = json.loads(data)
+    if "tuple" in record:
+        # 旧格式只记录了顶层是否为元组
+        return tuple(record["value"]) if record["tuple"] else record["value"]
+    return _decode_tuples(record["value"])
+
+
+class LLMResponseCacheManager:
+    """LLM响应缓存
+
+    以服务商、接口、完整请求体（模型、参数与prompt）的哈希为键缓存解析后的响应，
+    仅对配置中启用的 request_type 生效。内存中按LRU淘汰并带TTL，可选持久化到数据库，重启后仍可命中；
+    持久化的读写在线程池中进行，不阻塞事件循环。
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._stats: Dict[str, CacheStats] = {}
+        self._persistent_writes = 0
+
+    @staticmethod
+    def is_enabled_for(request_type: str) -> bool:
+        """该请求类型是否启用缓存"""
+        cache_config = global_config.llm_cache
+        return cache_config.enable and match_request_type(request_type, cache_config.request_types)
+
+    @staticmethod
+    def make_key(provider: str, endpoint: str, payload: Dict[str, Any]) -> str:
+        """计算请求的缓存键"""
+        content = json.dumps(
+            {"provider": provider, "endpoint": endpoint, "payload": payload}, sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _get_stats(self, request_type: str) -> CacheStats:
+        return self._stats.setdefault(request_type, CacheStats())
+
+    async def get(self, key: str, request_type: str) -> Optional[Any]:
+        """查询缓存，未命中返回None"""
+        now = time.time()
+        stats = self._get_stats(request_type)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expire_time, response = entry
+            if expire_time > now:
+                self._entries.move_to_end(key)
+                stats.hits += 1
+                return copy.deepcopy(response)
+            del self._entries[key]
+
+        if global_config.llm_cache.persistent:
+            response = await asyncio.to_thread(self._get_persistent, key, now)
+            if response is not None:
+                stats.persistent_hits += 1
+                self._put_memory(key, response, now)
+                return copy.deepcopy(response)
+
+        stats.misses += 1
+        return None
+
+    async def put(self, key: str, request_type: str, model_name: str, response: Any):
+        """写入缓存"""
+        now = time.time()
+        self._put_memory(key, copy.deepcopy(response), now)
+        if global_config.llm_cache.persistent:
+            self._persistent_writes += 1
+            purge = self._persistent_writes % PURGE_INTERVAL == 0
+            await asyncio.to_thread(
+                self._put_persistent, key, request_type, model_name, _dump_response(response), now, purge
+            )
+
+    def _put_memory(self, key: str, response: Any, now: float):
+        cache_config = global_config.llm_cache
+        self._entries[key] = (now + cache_config.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > cache_config.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _get_persistent(key: str, now: float) -> Optional[Any]:
+        try:
+            record = LLMResponseCache.get_or_none(
+                (LLMResponseCache.cache_key == key) & (LLMResponseCache.expire_time > now)
+            )
+            return _load_response(record.response) if record else None
+        except Exception as e:
+            logger.warning(f"读取持久化LLM响应缓存失败: {e}")
+            return None
+
+    @staticmethod
+    def _put_persistent(key: str, request_type: str, model_name: str, data: str, now: float, purge: bool):
+        """写入一条持久化缓存，purge 为True时顺便清理过期记录"""
+        try:
+            LLMResponseCache.replace(
+                cache_key=key,
+                model_name=model_name,
+                request_type=request_type,
+                response=data,
+                create_time=now,
+                expire_time=now + global_config.llm_cache.ttl,
+            ).execute()
+            if purge:
+                deleted = LLMResponseCache.delete().where(LLMResponseCache.expire_time <= now).execute()
+                if deleted:
+                    logger.debug(f"清理了 {deleted} 条过期的LLM响应缓存")
+        except Exception as e:
+            logger.warning(f"写入持久化LLM响应缓存失败: {e}")
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各请求类型的缓存命中统计（自启动以来）
+
+        统计报告在线程池中调用，先复制一份再遍历，避免与事件循环中的写入冲突。
+        """
+        return {request_type: stats.to_dict() for request_type, stats in list(self._stats.items())}
+
+
+llm_response_cache = LLMResponseCacheManager()
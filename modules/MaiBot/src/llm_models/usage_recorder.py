@@ -0,0 +1,90 @@
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict
+
+from peewee import chunked
+
+from src.common.database.database import db
+from src.common.database.database_model import LLMUsage
+from src.common.logger import get_logger
+from src.manager.async_task_manager import AsyncTask
+
+logger = get_logger("llm_usage")
+
+FLUSH_INTERVAL = 5  # 定时写入的间隔（秒）
+FLUSH_BATCH_SIZE = 100  # 积压达到该条数时立即写入
+INSERT_CHUNK_SIZE = 50  # 单条INSERT语句包含的记录数，避免超出SQLite的变量数限制
+
+
+class LLMUsageRecorder:
+    """LLM用量记录器
+
+    记录只追加到内存队列中，由后台任务定时或在积压达到一定条数时在一个事务内批量写入数据库，
+    写入在线程中进行，不阻塞事件循环。
+    """
+
+    def __init__(self):
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._flush_scheduled = False
+        self._flush_lock = asyncio.Lock()
+        """保证同一时间只有一个线程在写入"""
+
+    def record(self, **fields):
+        """记录一次用量，字段与 LLMUsage 一致"""
+        self._pending.append(fields)
+        if len(self._pending) < FLUSH_BATCH_SIZE or self._flush_scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中（如脚本中直接调用），直接写入
+            self.flush()
+            return
+        self._flush_scheduled = True
+        loop.create_task(self.flush_async())
+
+    async def flush_async(self) -> int:
+        """在线程中将队列中的记录写入数据库，返回写入的条数"""
+        async with self._flush_lock:
+            return await asyncio.to_thread(self.flush)
+
+    def flush(self) -> int:
+        """将队列中的记录写入数据库，返回写入的条数。会阻塞调用的线程，事件循环中请使用 flush_async"""
+        self._flush_scheduled = False
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        if not batch:
+            return 0
+
+        try:
+            with db.atomic():
+                for rows in chunked(batch, INSERT_CHUNK_SIZE):
+                    LLMUsage.insert_many(rows).execute()
+            return len(batch)
+        except Exception as e:
+            logger.error(f"批量写入 {len(batch)} 条token使用记录失败，改为逐条写入: {str(e)}")
+
+        # 逐条写入，个别记录出错不影响其他记录
+        written = 0
+        for row in batch:
+            try:
+                with db.atomic():
+                    LLMUsage.insert(row).execute()
+                written += 1
+            except Exception:
+                logger.exception(f"写入token使用记录失败: {row.get('model_name')} {row.get('request_type')}")
+        return written
+
+
+class LLMUsageFlushTask(AsyncTask):
+    """定时写入LLM用量记录的任务"""
+
+    def __init__(self):
+        super().__init__(task_name="LLM Usage Flush Task", run_interval=FLUSH_INTERVAL)
+
+    async def run(self):
+        await llm_usage_recorder.flush_async()
+
+
+llm_usage_recorder = LLMUsageRecorder()
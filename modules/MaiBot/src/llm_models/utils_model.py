@@ -2,24 +2,30 @@ import asyncio
 import json
 import re
 from datetime import datetime
-from typing import Tuple, Union, Dict, Any
+from typing import AsyncIterator, Tuple, Union, Dict, Any
 import aiohttp
 from aiohttp.client import ClientResponse
 from src.common.logger import get_logger
 import base64
-from PIL import Image
-import io
 import os
 from src.common.database.database import db  # 确保 db 被导入用于 create_tables
 from src.common.database.database_model import LLMUsage  # 导入 LLMUsage 模型
+from src.common.image_pipeline import image_pipeline
 from src.config.config import global_config
-from src.common.tcp_connector import get_tcp_connector
+from src.llm_models.http_client import llm_client_registry
+from src.llm_models.rate_scheduler import llm_request_scheduler
+from src.llm_models.response_cache import llm_response_cache
+from src.llm_models.usage_recorder import llm_usage_recorder
 from rich.traceback import install
 
 install(extra_lines=3)
 
 logger = get_logger("model_utils")
 
+# prompt中静态前缀与动态内容的分界标记：分界之前的内容（身份、人格、动作说明、规则等）在多次请求间保持不变，
+# 便于服务商的前缀缓存命中。发送前会被去除，模型配置了 cache_control 时转为服务商的缓存标注
+PROMPT_CACHE_BREAKPOINT = "<|cache_breakpoint|>"
+
 
 class PayLoadTooLargeError(Exception):
     """自定义异常类，用于处理请求体过大错误"""
@@ -88,6 +94,14 @@ async def _safely_record(request_content: Dict[str, Any], payload: Dict[str, Any
     return payload
 
 
+def _parse_retry_after(response: ClientResponse) -> float | None:
+    """解析Retry-After响应头（秒数形式），不存在或无法解析时返回None"""
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
 class LLMRequest:
     # 定义需要转换的模型列表，作为类变量避免重复
     MODELS_NEEDING_TRANSFORMATION = [
@@ -107,6 +121,9 @@ class LLMRequest:
         "o4-mini-2025-04-16",
     ]
 
+    # 没有返回结果时的默认响应，不写入缓存
+    EMPTY_RESPONSE = ("没有返回结果", "")
+
     def __init__(self, model: dict, **kwargs):
         # 将大写的配置键转换为小写并从config中获取实际值
         try:
@@ -122,6 +139,7 @@ class LLMRequest:
                 f"找不到{model['provider']}_KEY或{model['provider']}_BASE_URL环境变量，请检查配置文件或环境变量设置。"
             )
         self.model_name: str = model["name"]
+        self.provider: str = model["provider"]
         self.params = kwargs
 
         self.enable_thinking = model.get("enable_thinking", False)
@@ -131,6 +149,7 @@ class LLMRequest:
         self.pri_in = model.get("pri_in", 0)
         self.pri_out = model.get("pri_out", 0)
         self.max_tokens = model.get("max_tokens", global_config.model.model_max_output_length)
+        self.cache_control = model.get("cache_control", False)
         # print(f"max_tokens: {self.max_tokens}")
 
         # 获取数据库实例
@@ -157,12 +176,14 @@ class LLMRequest:
         user_id: str = "system",
         request_type: str = None,
         endpoint: str = "/chat/completions",
+        cached_tokens: int = 0,
     ):
-        """记录模型使用情况到数据库
+        """记录模型使用情况（批量写入数据库）
         Args:
             prompt_tokens: 输入token数
             completion_tokens: 输出token数
             total_tokens: 总token数
+            cached_tokens: 输入中命中服务商前缀缓存的token数
             user_id: 用户ID，默认为system
             request_type: 请求类型
             endpoint: API端点
@@ -171,28 +192,37 @@ class LLMRequest:
         if request_type is None:
             request_type = self.request_type
 
-        try:
-            # 使用 Peewee 模型创建记录
-            LLMUsage.create(
-                model_name=self.model_name,
-                user_id=user_id,
-                request_type=request_type,
-                endpoint=endpoint,
-                prompt_tokens=prompt_tokens,
-                completion_tokens=completion_tokens,
-                total_tokens=total_tokens,
-                cost=self._calculate_cost(prompt_tokens, completion_tokens),
-                status="success",
-                timestamp=datetime.now(),  # Peewee 会处理 DateTimeField
-            )
-            logger.debug(
-                f"Token使用情况 - 模型: {self.model_name}, "
-                f"用户: {user_id}, 类型: {request_type}, "
-                f"提示词: {prompt_tokens}, 完成: {completion_tokens}, "
-                f"总计: {total_tokens}"
-            )
-        except Exception as e:
-            logger.error(f"记录token使用情况失败: {str(e)}")
+        # 只追加到内存队列，由后台任务批量写入数据库
+        llm_usage_recorder.record(
+            model_name=self.model_name,
+            user_id=user_id,
+            request_type=request_type,
+            endpoint=endpoint,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=total_tokens,
+            cached_tokens=cached_tokens,
+            cost=self._calculate_cost(prompt_tokens, completion_tokens),
+            status="success",
+            timestamp=datetime.now(),  # 记录请求完成的时间，而不是写入数据库的时间
+        )
+        logger.debug(
+            f"Token使用情况 - 模型: {self.model_name}, "
+            f"用户: {user_id}, 类型: {request_type}, "
+            f"提示词: {prompt_tokens}（缓存命中: {cached_tokens}）, 完成: {completion_tokens}, "
+            f"总计: {total_tokens}"
+        )
+
+    @staticmethod
+    def _get_cached_tokens(usage: Dict[str, Any]) -> int:
+        """从用量信息中取出命中前缀缓存的输入token数，兼容不同服务商的字段"""
+        prompt_tokens_details = usage.get("prompt_tokens_details") or {}
+        return (
+            prompt_tokens_details.get("cached_tokens")
+            or usage.get("prompt_cache_hit_tokens")  # DeepSeek
+            or usage.get("cache_read_input_tokens")  # Anthropic
+            or 0
+        )
 
     def _calculate_cost(self, prompt_tokens: int, completion_tokens: int) -> float:
         """计算API调用成本
@@ -292,6 +322,7 @@ class LLMRequest:
         response_handler: callable = None,
         user_id: str = "system",
         request_type: str = None,
+        timeout: float = None,
     ):
         """统一请求执行入口
         Args:
@@ -304,6 +335,7 @@ class LLMRequest:
             response_handler: 自定义响应处理器
             user_id: 用户ID
             request_type: 请求类型
+            timeout: 单次请求的超时时间（秒），从调度器放行后开始计算，超时后不再重试；为None时不限制
         """
         # 获取请求配置
         request_content = await self._prepare_request(
@@ -311,22 +343,47 @@ class LLMRequest:
         )
         if request_type is None:
             request_type = self.request_type
+        # 启用缓存的请求类型，相同的请求直接返回之前的结果
+        cache_key = None
+        if llm_response_cache.is_enabled_for(request_type):
+            cache_key = llm_response_cache.make_key(self.provider, endpoint, request_content["payload"])
+            cached_result = await llm_response_cache.get(cache_key, request_type)
+            if cached_result is not None:
+                return cached_result
+        loop = asyncio.get_running_loop()
         for retry in range(request_content["policy"]["max_retries"]):
+            sent_at = None
             try:
-                # 使用上下文管理器处理会话
                 headers = await self._build_headers()
                 # 似乎是openai流式必须要的东西,不过阿里云的qwq-plus加了这个没有影响
                 if request_content["stream_mode"]:
                     headers["Accept"] = "text/event-stream"
-                async with aiohttp.ClientSession(connector=await get_tcp_connector()) as session:
-                    async with session.post(
-                        request_content["api_url"], headers=headers, json=request_content["payload"]
-                    ) as response:
-                        handled_result = await self._handle_response(
-                            response, request_content, retry, response_handler, user_id, request_type, endpoint
-                        )
-                        return handled_result
+                # 按服务商的并发与速率限制排队，放行后才发送
+                ticket = await llm_request_scheduler.acquire(self.provider, request_type, request_content["payload"])
+                sent_at = loop.time()
+                try:
+                    # 超时只计算放行后的时间，排队等待不计入
+                    handled_result = await asyncio.wait_for(
+                        self._send_request(
+                            request_content, headers, retry, response_handler, user_id, request_type, endpoint
+                        ),
+                        timeout=timeout,
+                    )
+                    if cache_key is not None and handled_result and handled_result != self.EMPTY_RESPONSE:
+                        await llm_response_cache.put(cache_key, request_type, self.model_name, handled_result)
+                    return handled_result
+                finally:
+                    ticket.release(request_content.pop("total_tokens", None))
             except Exception as e:
+                # aiohttp的连接、读取超时也是 asyncio.TimeoutError，只有超过本次请求的 timeout 时才不再重试
+                if (
+                    isinstance(e, asyncio.TimeoutError)
+                    and timeout is not None
+                    and sent_at is not None
+                    and loop.time() - sent_at >= timeout
+                ):
+                    logger.warning(f"模型 {self.model_name} 的请求在 {timeout} 秒内未完成")
+                    raise
                 handled_payload, count_delta = await self._handle_exception(e, retry, request_content)
                 retry += count_delta  # 降级不计入重试次数
                 if handled_payload:
@@ -337,6 +394,26 @@ class LLMRequest:
         logger.error(f"模型 {self.model_name} 达到最大重试次数，请求仍然失败")
         raise RuntimeError(f"模型 {self.model_name} 达到最大重试次数，API请求仍然失败")
 
+    async def _send_request(
+        self,
+        request_content: Dict[str, Any],
+        headers: dict,
+        retry_count: int,
+        response_handler: callable,
+        user_id,
+        request_type,
+        endpoint,
+    ) -> Union[Dict[str, Any], None]:
+        """发送请求并处理响应"""
+        # 同一服务商的请求共用会话与连接池，复用已建立的连接
+        session = await llm_client_registry.get_session(self.provider)
+        async with session.post(
+            request_content["api_url"], headers=headers, json=request_content["payload"]
+        ) as response:
+            return await self._handle_response(
+                response, request_content, retry_count, response_handler, user_id, request_type, endpoint
+            )
+
     async def _handle_response(
         self,
         response: ClientResponse,
@@ -360,6 +437,8 @@ class LLMRequest:
             result = await self._handle_stream_output(response)
         else:
             result = await response.json()
+        # 记录实际用量，供请求调度器修正TPM
+        request_content["total_tokens"] = (result.get("usage") or {}).get("total_tokens")
         return (
             response_handler(result)
             if response_handler
@@ -469,6 +548,8 @@ class LLMRequest:
                 raise RuntimeError("服务器负载过高，模型回复失败QAQ")
             else:
                 logger.warning(f"模型 {self.model_name} 请求限制(429)，等待{wait_time}秒后重试...")
+                # 暂停向该服务商发送请求，排队中的其他请求不再继续撞上限制
+                llm_request_scheduler.report_rate_limited(self.provider, _parse_retry_after(response))
                 raise RuntimeError("请求限制(429)")
         elif response.status in policy["abort_codes"]:
             if response.status != 403:
@@ -544,8 +625,9 @@ class LLMRequest:
 
         elif isinstance(exception, PayLoadTooLargeError):
             if keep_request:
-                image_base64 = request_content["image_base64"]
-                compressed_image_base64 = compress_base64_image_by_scale(image_base64)
+                image = await image_pipeline.decode(request_content["image_base64"])
+                compressed_image = await image_pipeline.compress(image.data)
+                compressed_image_base64 = base64.b64encode(compressed_image).decode("utf-8")
                 new_payload = await self._build_payload(
                     request_content["prompt"], compressed_image_base64, request_content["image_format"]
                 )
@@ -553,6 +635,11 @@ class LLMRequest:
             else:
                 return None, 0
 
+        elif isinstance(exception, aiohttp.ServerDisconnectedError) and keep_request:
+            # 复用的空闲连接可能已被服务端关闭，直接换一个连接重试，无需等待
+            logger.warning(f"模型 {self.model_name} 连接被服务端关闭，立即重试: {str(exception)}")
+            return None, 0
+
         elif isinstance(exception, aiohttp.ClientError) or isinstance(exception, asyncio.TimeoutError):
             if keep_request:
                 logger.error(f"模型 {self.model_name} 网络错误，等待{wait_time}秒后重试... 错误: {str(exception)}")
@@ -649,7 +736,7 @@ class LLMRequest:
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": prompt},
+                        {"type": "text", "text": prompt.replace(PROMPT_CACHE_BREAKPOINT, "")},
                         {
                             "type": "image_url",
                             "image_url": {"url": f"data:image/{image_format.lower()};base64,{image_base64}"},
@@ -658,7 +745,7 @@ class LLMRequest:
                 }
             ]
         else:
-            messages = [{"role": "user", "content": prompt}]
+            messages = [{"role": "user", "content": self._build_prompt_content(prompt)}]
 
         payload = {
             "model": self.model_name,
@@ -687,6 +774,23 @@ class LLMRequest:
             payload["max_completion_tokens"] = payload.pop("max_tokens")
         return payload
 
+    def _build_prompt_content(self, prompt: str) -> Union[str, list]:
+        """构建用户消息的content，去除静态前缀的分界标记
+
+        模型配置了 cache_control 时，将分界之前的静态前缀作为单独的文本块并添加缓存标注，
+        供支持显式缓存的服务商（如Anthropic）缓存该前缀。
+        """
+        if PROMPT_CACHE_BREAKPOINT not in prompt:
+            return prompt
+        prefix, _, suffix = prompt.partition(PROMPT_CACHE_BREAKPOINT)
+        suffix = suffix.replace(PROMPT_CACHE_BREAKPOINT, "")
+        if not self.cache_control or not prefix.strip():
+            return prefix + suffix
+        return [
+            {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": suffix},
+        ]
+
     def _default_response_handler(
         self, result: dict, user_id: str = "system", request_type: str = None, endpoint: str = "/chat/completions"
     ) -> Tuple:
@@ -717,6 +821,7 @@ class LLMRequest:
                     user_id=user_id,
                     request_type=request_type if request_type is not None else self.request_type,
                     endpoint=endpoint,
+                    cached_tokens=self._get_cached_tokens(usage),
                 )
 
             # 只有当tool_calls存在且不为空时才返回
@@ -726,7 +831,7 @@ class LLMRequest:
             else:
                 return content, reasoning_content
 
-        return "没有返回结果", ""
+        return self.EMPTY_RESPONSE
 
     @staticmethod
     def _extract_reasoning(content: str) -> Tuple[str, str]:
@@ -761,17 +866,25 @@ class LLMRequest:
             content, reasoning_content = response
             return content, reasoning_content
 
-    async def generate_response_async(self, prompt: str, **kwargs) -> Union[str, Tuple]:
-        """异步方式根据输入的提示生成模型的响应"""
+    async def generate_response_async(self, prompt: str, timeout: float = None, **kwargs) -> Union[str, Tuple]:
+        """异步方式根据输入的提示生成模型的响应
+
+        Args:
+            prompt: 提示词
+            timeout: 请求超时时间（秒），从请求发出时开始计算，在服务商调度器中排队的时间不计入；为None时不限制
+            **kwargs: 额外的请求参数
+        """
         # 构建请求体，不硬编码max_tokens
         data = {
             "model": self.model_name,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": [{"role": "user", "content": self._build_prompt_content(prompt)}],
             **self.params,
             **kwargs,
         }
 
-        response = await self._execute_request(endpoint="/chat/completions", payload=data, prompt=prompt)
+        response = await self._execute_request(
+            endpoint="/chat/completions", payload=data, prompt=prompt, timeout=timeout
+        )
         # 原样返回响应，不做处理
 
         if len(response) == 3:
@@ -781,6 +894,118 @@ class LLMRequest:
             content, reasoning_content = response
             return content, (reasoning_content, self.model_name)
 
+    async def generate_response_stream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """流式生成回复，逐段产出模型输出的文本增量
+
+        <think></think> 中的思考内容不会产出。只有在尚未产出任何内容时才会重试，
+        已产出内容后出错则直接抛出异常，由调用方决定如何处理已收到的部分。
+        """
+        data = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": self._build_prompt_content(prompt)}],
+            **self.params,
+            **kwargs,
+        }
+        endpoint = "/chat/completions"
+        request_content = await self._prepare_request(endpoint, prompt=prompt, payload=data)
+        request_content["payload"]["stream"] = True
+        policy = request_content["policy"]
+
+        for retry in range(policy["max_retries"]):
+            yielded = False
+            usage = None
+            try:
+                headers = await self._build_headers()
+                headers["Accept"] = "text/event-stream"
+                ticket = await llm_request_scheduler.acquire(
+                    self.provider, self.request_type, request_content["payload"]
+                )
+                try:
+                    session = await llm_client_registry.get_session(self.provider)
+                    async with session.post(
+                        request_content["api_url"], headers=headers, json=request_content["payload"]
+                    ) as response:
+                        if response.status in policy["retry_codes"] or response.status in policy["abort_codes"]:
+                            await self._handle_error_response(response, retry, policy)
+                        response.raise_for_status()
+
+                        pending = ""  # 尚未确定是否为思考内容的开头部分
+                        thinking = None  # None: 尚未确定, True: 处于<think>中, False: 正文
+                        async for chunk in self._iter_stream_chunks(response):
+                            usage = chunk.get("usage") or usage
+                            choices = chunk.get("choices")
+                            if not choices:
+                                continue
+                            delta = (choices[0].get("delta") or {}).get("content")
+                            if not delta:
+                                continue
+
+                            if thinking is False:
+                                yielded = True
+                                yield delta
+                                continue
+                            pending += delta
+                            if thinking is None:
+                                head = pending.lstrip()
+                                if head.startswith("<think>"):
+                                    thinking = True
+                                elif "<think>".startswith(head):
+                                    continue
+                                else:
+                                    thinking = False
+                                    yielded = True
+                                    yield pending
+                                    pending = ""
+                                    continue
+                            end = pending.find("</think>")
+                            if end >= 0:
+                                thinking = False
+                                rest = pending[end + len("</think>") :].lstrip()
+                                pending = ""
+                                if rest:
+                                    yielded = True
+                                    yield rest
+                        if thinking is None and pending.strip():
+                            yielded = True
+                            yield pending
+                finally:
+                    ticket.release((usage or {}).get("total_tokens"))
+
+                if usage:
+                    self._record_usage(
+                        prompt_tokens=usage.get("prompt_tokens", 0),
+                        completion_tokens=usage.get("completion_tokens", 0),
+                        total_tokens=usage.get("total_tokens", 0),
+                        endpoint=endpoint,
+                        cached_tokens=self._get_cached_tokens(usage),
+                    )
+                return
+            except Exception as e:
+                if yielded:
+                    logger.error(f"模型 {self.model_name} 流式输出中断: {str(e)}")
+                    raise
+                handled_payload, _ = await self._handle_exception(e, retry, request_content)
+                if handled_payload:
+                    handled_payload["stream"] = True
+                    request_content["payload"] = handled_payload
+
+        logger.error(f"模型 {self.model_name} 达到最大重试次数，流式请求仍然失败")
+        raise RuntimeError(f"模型 {self.model_name} 达到最大重试次数，API请求仍然失败")
+
+    async def _iter_stream_chunks(self, response: ClientResponse) -> AsyncIterator[Dict[str, Any]]:
+        """逐个解析SSE流中的数据块"""
+        async for line_bytes in response.content:
+            line = line_bytes.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data_str = line[5:].strip()
+            if data_str == "[DONE]":
+                break
+            try:
+                yield json.loads(data_str)
+            except json.JSONDecodeError as e:
+                logger.warning(f"模型 {self.model_name} 解析流式输出错误: {str(e)}")
+
     async def get_embedding(self, text: str) -> Union[list, None]:
         """异步方法：获取文本的embedding向量
 
@@ -827,81 +1052,40 @@ class LLMRequest:
         )
         return embedding
 
+    async def get_embeddings(self, texts: list[str]) -> Union[list[list[float]], None]:
+        """异步方法：在一次请求中批量获取多段文本的embedding向量
 
-def compress_base64_image_by_scale(base64_data: str, target_size: int = 0.8 * 1024 * 1024) -> str:
-    """压缩base64格式的图片到指定大小
-    Args:
-        base64_data: base64编码的图片数据
-        target_size: 目标文件大小（字节），默认0.8MB
-    Returns:
-        str: 压缩后的base64图片数据
-    """
-    try:
-        # 将base64转换为字节数据
-        # 确保base64字符串只包含ASCII字符
-        if isinstance(base64_data, str):
-            base64_data = base64_data.encode("ascii", errors="ignore").decode("ascii")
-        image_data = base64.b64decode(base64_data)
-
-        # 如果已经小于目标大小，直接返回原图
-        if len(image_data) <= 2 * 1024 * 1024:
-            return base64_data
-
-        # 将字节数据转换为图片对象
-        img = Image.open(io.BytesIO(image_data))
-
-        # 获取原始尺寸
-        original_width, original_height = img.size
-
-        # 计算缩放比例
-        scale = min(1.0, (target_size / len(image_data)) ** 0.5)
-
-        # 计算新的尺寸
-        new_width = int(original_width * scale)
-        new_height = int(original_height * scale)
-
-        # 创建内存缓冲区
-        output_buffer = io.BytesIO()
-
-        # 如果是GIF，处理所有帧
-        if getattr(img, "is_animated", False):
-            frames = []
-            for frame_idx in range(img.n_frames):
-                img.seek(frame_idx)
-                new_frame = img.copy()
-                new_frame = new_frame.resize((new_width // 2, new_height // 2), Image.Resampling.LANCZOS)  # 动图折上折
-                frames.append(new_frame)
-
-            # 保存到缓冲区
-            frames[0].save(
-                output_buffer,
-                format="GIF",
-                save_all=True,
-                append_images=frames[1:],
-                optimize=True,
-                duration=img.info.get("duration", 100),
-                loop=img.info.get("loop", 0),
-            )
-        else:
-            # 处理静态图片
-            resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            # 保存到缓冲区，保持原始格式
-            if img.format == "PNG" and img.mode in ("RGBA", "LA"):
-                resized_img.save(output_buffer, format="PNG", optimize=True)
-            else:
-                resized_img.save(output_buffer, format="JPEG", quality=95, optimize=True)
-
-        # 获取压缩后的数据并转换为base64
-        compressed_data = output_buffer.getvalue()
-        logger.info(f"压缩图片: {original_width}x{original_height} -> {new_width}x{new_height}")
-        logger.info(f"压缩前大小: {len(image_data) / 1024:.1f}KB, 压缩后大小: {len(compressed_data) / 1024:.1f}KB")
+        Args:
+            texts: 需要获取embedding的文本列表
 
-        return base64.b64encode(compressed_data).decode("utf-8")
+        Returns:
+            list: 与texts顺序一致的embedding向量列表，如果失败则返回None
+        """
+        if not texts:
+            return []
 
-    except Exception as e:
-        logger.error(f"压缩图片失败: {str(e)}")
-        import traceback
+        def embeddings_handler(result):
+            """处理响应"""
+            if "data" not in result or len(result["data"]) != len(texts):
+                return None
+            usage = result.get("usage", {})
+            if usage:
+                self._record_usage(
+                    prompt_tokens=usage.get("prompt_tokens", 0),
+                    completion_tokens=usage.get("completion_tokens", 0),
+                    total_tokens=usage.get("total_tokens", 0),
+                    user_id="system",
+                    request_type=self.request_type,
+                    endpoint="/embeddings",
+                )
+            # 按服务端返回的index排序，保证与输入顺序一致
+            data = sorted(result["data"], key=lambda item: item.get("index", 0))
+            return [item.get("embedding") for item in data]
 
-        logger.error(traceback.format_exc())
-        return base64_data
+        return await self._execute_request(
+            endpoint="/embeddings",
+            prompt=texts[0],
+            payload={"model": self.model_name, "input": texts, "encoding_format": "float"},
+            retry_policy={"max_retries": 2, "base_wait": 6},
+            response_handler=embeddings_handler,
+        )
@@ -6,6 +6,8 @@ from src.chat.express.exprssion_learner import get_expression_learner
 from src.common.remote import TelemetryHeartBeatTask
 from src.manager.async_task_manager import async_task_manager
 from src.chat.utils.statistic import OnlineTimeRecordTask, StatisticOutputTask
+from src.llm_models.usage_recorder import LLMUsageFlushTask
+from src.common.message_buffer import MessageFlushTask
 from src.manager.mood_manager import MoodPrintTask, MoodUpdateTask
 from src.chat.emoji_system.emoji_manager import get_emoji_manager
 from src.chat.normal_chat.willing.willing_manager import get_willing_manager
@@ -78,6 +80,12 @@ class MainSystem:
         # 添加在线时间统计任务
         await async_task_manager.add_task(OnlineTimeRecordTask())
 
+        # 添加LLM用量批量写入任务
+        await async_task_manager.add_task(LLMUsageFlushTask())
+
+        # 添加消息批量写入任务
+        await async_task_manager.add_task(MessageFlushTask())
+
         # 添加统计信息输出任务
         await async_task_manager.add_task(StatisticOutputTask())
 
@@ -120,6 +128,9 @@ class MainSystem:
             if self.hippocampus_manager:
                 self.hippocampus_manager.initialize()
                 logger.info("记忆系统初始化成功")
+                if global_config.memory.enable_embedding_recall:
+                    # 后台补齐记忆向量索引，首次启用时需要嵌入全部已有记忆
+                    asyncio.create_task(self.hippocampus_manager.get_hippocampus().sync_embedding_index())
         else:
             logger.info("记忆系统已禁用，跳过初始化")
 
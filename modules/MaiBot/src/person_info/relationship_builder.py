@@ -13,6 +13,7 @@ from src.chat.utils.chat_message_builder import (
     get_raw_msg_by_timestamp_with_chat_inclusive,
     get_raw_msg_before_timestamp_with_chat,
     num_new_messages_since,
+    num_messages_by_timestamp_with_chat_inclusive,
 )
 
 logger = get_logger("relationship_builder")
@@ -193,8 +194,7 @@ class RelationshipBuilder:
 
     def _count_messages_in_timerange(self, start_time: float, end_time: float) -> int:
         """计算指定时间范围内的消息数量（包含边界）"""
-        messages = get_raw_msg_by_timestamp_with_chat_inclusive(self.chat_id, start_time, end_time)
-        return len(messages)
+        return num_messages_by_timestamp_with_chat_inclusive(self.chat_id, start_time, end_time)
 
     def _count_messages_between(self, start_time: float, end_time: float) -> int:
         """计算两个时间点之间的消息数量（不包含边界），用于间隔检查"""
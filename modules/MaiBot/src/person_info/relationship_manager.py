@@ -11,7 +11,7 @@ import json
 from json_repair import repair_json
 from datetime import datetime
 from difflib import SequenceMatcher
-import jieba
+from src.chat.utils.segmentation import segmenter
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
@@ -601,8 +601,8 @@ class RelationshipManager:
         s2 = str(s2)
 
         # 1. 使用 jieba 进行分词
-        s1_words = " ".join(jieba.cut(s1))
-        s2_words = " ".join(jieba.cut(s2))
+        s1_words = " ".join(segmenter.cut(s1))
+        s2_words = " ".join(segmenter.cut(s2))
 
         # 2. 将两句话放入一个列表中
         corpus = [s1_words, s2_words]
@@ -5,15 +5,48 @@
     from src.plugin_system.apis import database_api
     records = await database_api.db_query(ActionRecords, query_type="get")
     record = await database_api.db_save(ActionRecords, data={"action_id": "123"})
+
+消息的完整信息（聊天流、发送者昵称等）请从 MessageView 查询。Messages 只保存消息本身的字段，
+为兼容旧插件，读取 Messages 时会改为读取 MessageView；写入时使用已移除的字段会报错。
 """
 
 import traceback
 from typing import Dict, List, Any, Union, Type
 from src.common.logger import get_logger
+from src.common.database.database_model import Messages, MessageView
 from peewee import Model, DoesNotExist
 
 logger = get_logger("database_api")
 
+# 消息表规范化后从 Messages 移到 MessageView 的字段（聊天流信息与发送者的平台、昵称、群名片）
+_LEGACY_MESSAGE_FIELDS = set(MessageView._meta.fields) - set(Messages._meta.fields)
+_legacy_read_warned = False
+
+
+def _resolve_read_model(model_class: Type[Model]) -> Type[Model]:
+    """读取 Messages 时改为读取 MessageView，返回的字段与规范化之前的消息表一致"""
+    global _legacy_read_warned
+    if model_class is not Messages:
+        return model_class
+    if not _legacy_read_warned:
+        _legacy_read_warned = True
+        logger.warning(
+            "[DatabaseAPI] 通过 Messages 读取消息已弃用，已改为查询 MessageView，请在插件中直接使用 MessageView"
+        )
+    return MessageView
+
+
+def _check_write_fields(model_class: Type[Model], field_names) -> None:
+    """写入 Messages 时检查是否使用了已移到 MessageView 的字段"""
+    if model_class is not Messages:
+        return
+    legacy_fields = sorted(_LEGACY_MESSAGE_FIELDS.intersection(field_names))
+    if legacy_fields:
+        raise ValueError(
+            f"Messages 已不再保存字段 {legacy_fields}，聊天流与发送者信息只能通过 MessageView 查询，不能写入"
+        )
+
+
 # =============================================================================
 # 通用数据库查询API函数
 # =============================================================================
@@ -33,7 +66,7 @@ async def db_query(
     这个方法提供了一个通用接口来执行数据库操作，包括查询、创建、更新和删除记录。
 
     Args:
-        model_class: Peewee 模型类，例如 ActionRecords, Messages 等
+        model_class: Peewee 模型类，例如 ActionRecords, MessageView 等（读取 Messages 时会改为读取 MessageView）
         query_type: 查询类型，可选值: "get", "create", "update", "delete", "count"
         filters: 过滤条件字典，键为字段名，值为要匹配的值
         data: 用于创建或更新的数据字典
@@ -50,9 +83,9 @@ async def db_query(
         - "count": 返回记录数量
 
     示例:
-        # 查询最近10条消息
+        # 查询最近10条消息（消息的完整信息从 MessageView 查询）
         messages = await database_api.db_query(
-            Messages,
+            MessageView,
             query_type="get",
             filters={"chat_id": chat_stream.stream_id},
             limit=10,
@@ -83,7 +116,7 @@ async def db_query(
 
         # 计数
         count = await database_api.db_query(
-            Messages,
+            MessageView,
             query_type="count",
             filters={"chat_id": chat_stream.stream_id}
         )
@@ -91,6 +124,10 @@ async def db_query(
     try:
         if query_type not in ["get", "create", "update", "delete", "count"]:
             raise ValueError("query_type must be 'get' or 'create' or 'update' or 'delete' or 'count'")
+        if query_type in ["get", "count"]:
+            model_class = _resolve_read_model(model_class)
+        else:
+            _check_write_fields(model_class, [*(filters or {}), *(data or {})])
         # 构建基本查询
         if query_type in ["get", "update", "delete", "count"]:
             query = model_class.select()
@@ -176,7 +213,7 @@ async def db_save(
     如果没有找到匹配记录，或未提供key_field和key_value，则创建新记录。
 
     Args:
-        model_class: Peewee模型类，如ActionRecords, Messages等
+        model_class: Peewee模型类，如ActionRecords等（Messages 不能写入已移到 MessageView 的字段）
         data: 要保存的数据字典
         key_field: 用于查找现有记录的字段名，例如"action_id"
         key_value: 用于查找现有记录的字段值
@@ -200,6 +237,8 @@ async def db_save(
         )
     """
     try:
+        _check_write_fields(model_class, [*data, *([key_field] if key_field else [])])
+
         # 如果提供了key_field和key_value，尝试更新现有记录
         if key_field and key_value is not None:
             # 查找现有记录
@@ -237,7 +276,7 @@ async def db_get(
     这是db_query方法的简化版本，专注于数据检索操作。
 
     Args:
-        model_class: Peewee模型类
+        model_class: Peewee模型类（读取 Messages 时会改为读取 MessageView）
         filters: 过滤条件，字段名和值的字典
         order_by: 排序字段，前缀'-'表示降序，例如'-time'表示按时间降序
         limit: 结果数量限制，如果为1则返回单个记录而不是列表
@@ -256,13 +295,15 @@ async def db_get(
 
         # 获取最近10条记录
         records = await database_api.db_get(
-            Messages,
+            MessageView,
             filters={"chat_id": chat_stream.stream_id},
             order_by="-time",
             limit=10
         )
     """
     try:
+        model_class = _resolve_read_model(model_class)
+
         # 构建查询
         query = model_class.select()
 
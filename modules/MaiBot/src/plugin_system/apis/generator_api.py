@@ -6,14 +6,16 @@
     from src.plugin_system.apis import generator_api
     replyer = generator_api.get_replyer(chat_stream)
     success, reply_set = await generator_api.generate_reply(chat_stream, action_data, reasoning)
+    async for reply_seg in generator_api.generate_reply_stream(chat_stream, action_data=action_data):
+        ...
 """
 
 import traceback
-from typing import Tuple, Any, Dict, List, Optional
+from typing import AsyncIterator, Tuple, Any, Dict, List, Optional
 from src.common.logger import get_logger
 from src.chat.replyer.default_generator import DefaultReplyer
 from src.chat.message_receive.chat_stream import ChatStream
-from src.chat.utils.utils import process_llm_response
+from src.chat.utils.utils import process_llm_response, StreamingResponseSplitter
 from src.chat.replyer.replyer_manager import replyer_manager
 
 logger = get_logger("generator_api")
@@ -129,6 +131,58 @@ async def generate_reply(
         return False, []
 
 
+async def generate_reply_stream(
+    chat_stream=None,
+    chat_id: str = None,
+    action_data: Dict[str, Any] = None,
+    reply_to: str = "",
+    relation_info: str = "",
+    extra_info: str = "",
+    available_actions: List[str] = None,
+    enable_tool: bool = False,
+    enable_splitter: bool = True,
+    enable_chinese_typo: bool = True,
+    model_configs: Optional[List[Dict[str, Any]]] = None,
+    request_type: str = "",
+) -> AsyncIterator[Tuple[str, Any]]:
+    """流式生成回复，每当模型输出一句完整的话，就产出经过处理的回复项
+
+    参数与 generate_reply 相同。生成失败时结束迭代，没有产出任何回复项即表示失败。
+
+    Yields:
+        Tuple[str, Any]: 回复项，如 ("text", "句子")
+    """
+    replyer = get_replyer(
+        chat_stream, chat_id, model_configs=model_configs, request_type=request_type, enable_tool=enable_tool
+    )
+    if not replyer:
+        logger.error("[GeneratorAPI] 无法获取回复器")
+        return
+
+    logger.info("[GeneratorAPI] 开始流式生成回复")
+
+    splitter = StreamingResponseSplitter(enable_splitter, enable_chinese_typo)
+    reply_count = 0
+    async for delta in replyer.generate_reply_stream_with_context(
+        reply_data=action_data or {},
+        reply_to=reply_to,
+        relation_info=relation_info,
+        extra_info=extra_info,
+        available_actions=available_actions,
+    ):
+        for sentence in splitter.feed(delta):
+            reply_count += 1
+            yield ("text", sentence)
+    for sentence in splitter.flush():
+        reply_count += 1
+        yield ("text", sentence)
+
+    if reply_count:
+        logger.info(f"[GeneratorAPI] 流式回复生成完成，生成了 {reply_count} 个回复项")
+    else:
+        logger.warning("[GeneratorAPI] 流式回复生成失败")
+
+
 async def rewrite_reply(
     chat_stream=None,
     reply_data: Dict[str, Any] = None,
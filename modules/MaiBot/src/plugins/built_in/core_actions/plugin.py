@@ -7,7 +7,7 @@
 
 import random
 import time
-from typing import List, Tuple, Type
+from typing import Any, AsyncIterator, List, Tuple, Type
 
 # 导入新插件系统
 from src.plugin_system import BasePlugin, register_plugin, BaseAction, ComponentInfo, ActionActivationType, ChatMode
@@ -60,32 +60,32 @@ class ReplyAction(BaseAction):
         start_time = self.action_data.get("loop_start_time", time.time())
 
         try:
-            success, reply_set = await generator_api.generate_reply(
-                action_data=self.action_data,
-                chat_id=self.chat_id,
-                request_type="focus.replyer",
-                enable_tool=global_config.tool.enable_in_focus_chat,
-            )
-
-            # 检查从start_time以来的新消息数量
-            # 获取动作触发时间或使用默认值
-            current_time = time.time()
-            new_message_count = message_api.count_new_messages(
-                chat_id=self.chat_id, start_time=start_time, end_time=current_time
-            )
-
-            # 根据新消息数量决定是否使用reply_to
-            need_reply = new_message_count >= random.randint(2, 5)
-            logger.info(
-                f"{self.log_prefix} 从{start_time}到{current_time}共有{new_message_count}条新消息，{'使用' if need_reply else '不使用'}reply_to"
-            )
+            streaming = global_config.response_splitter.enable_streaming_reply
+            if streaming:
+                # 流式生成时，每生成一句就发送一句
+                reply_segments = generator_api.generate_reply_stream(
+                    action_data=self.action_data,
+                    chat_id=self.chat_id,
+                    request_type="focus.replyer",
+                    enable_tool=global_config.tool.enable_in_focus_chat,
+                )
+            else:
+                success, reply_set = await generator_api.generate_reply(
+                    action_data=self.action_data,
+                    chat_id=self.chat_id,
+                    request_type="focus.replyer",
+                    enable_tool=global_config.tool.enable_in_focus_chat,
+                )
+                reply_segments = _iter_reply_set(reply_set)
 
             # 构建回复文本
             reply_text = ""
             first_replyed = False
-            for reply_seg in reply_set:
+            async for reply_seg in reply_segments:
                 data = reply_seg[1]
                 if not first_replyed:
+                    # 检查从start_time以来的新消息数量，根据新消息数量决定是否使用reply_to
+                    need_reply = self._need_reply_to(start_time)
                     if need_reply:
                         await self.send_text(content=data, reply_to=self.action_data.get("reply_to", ""), typing=False)
                         first_replyed = True
@@ -96,6 +96,9 @@ class ReplyAction(BaseAction):
                     await self.send_text(content=data, typing=True)
                 reply_text += data
 
+            if streaming:
+                success = first_replyed
+
             # 存储动作记录
             await self.store_action_info(
                 action_build_into_prompt=False,
@@ -112,6 +115,23 @@ class ReplyAction(BaseAction):
             logger.error(f"{self.log_prefix} 回复动作执行失败: {e}")
             return False, f"回复失败: {str(e)}"
 
+    def _need_reply_to(self, start_time: float) -> bool:
+        """从start_time以来的新消息较多时，引用回复目标消息"""
+        current_time = time.time()
+        new_message_count = message_api.count_new_messages(
+            chat_id=self.chat_id, start_time=start_time, end_time=current_time
+        )
+        need_reply = new_message_count >= random.randint(2, 5)
+        logger.info(
+            f"{self.log_prefix} 从{start_time}到{current_time}共有{new_message_count}条新消息，{'使用' if need_reply else '不使用'}reply_to"
+        )
+        return need_reply
+
+
+async def _iter_reply_set(reply_set: List[Tuple[str, Any]]) -> AsyncIterator[Tuple[str, Any]]:
+    for reply_seg in reply_set:
+        yield reply_seg
+
 
 @register_plugin
 class CoreActionsPlugin(BasePlugin):